@@ -0,0 +1,405 @@
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import zipfile
+from datetime import datetime
+
+from customer_issues_blob_store import resolve_stored_path, is_within
+
+# مجلد أرشيفات الحالات داخل مجلد المرفقات (archives/<السنة>/case_<id>.zip)
+ARCHIVE_FOLDER = "archives"
+ARCHIVE_INDEX_NAME = "index.json"
+JOURNAL_SUFFIX = ".journal"
+PART_SUFFIX = ".part"
+
+# الملفات المستخرجة من الأرشيفات لفتحها (تُحذف بعد مدة من آخر استخدام)
+DEFAULT_EXTRACT_FOLDER = os.path.join('cache', 'archive_extract')
+EXTRACT_MAX_AGE = 24 * 3600
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+COMPRESSION_METHODS = {'deflate': zipfile.ZIP_DEFLATED, 'lzma': zipfile.ZIP_LZMA}
+# صيغ مضغوطة أصلاً: تُخزن بدون ضغط لأن ضغطها لا يوفر مساحة ويستهلك وقتاً
+COMPRESSED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3', '.mp4',
+                         '.zip', '.rar', '.7z', '.gz', '.docx', '.xlsx', '.pptx'}
+
+
+class ArchiveError(Exception):
+    """فشلت أرشفة الحالة (الملفات الأصلية لم تُمس)"""
+
+
+class ArchiveCancelled(Exception):
+    """أُلغيت الأرشفة (تُستكمل في التشغيل التالي من ملف السجل)"""
+
+
+def _file_crc(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+class CaseArchiver:
+    """أرشفة مرفقات الحالات المغلقة في ملف zip مضغوط لكل حالة
+
+    يُؤرشف فقط ما يملكه النظام من ملفات (المنسوخة داخل files_root، ومنها ملفات
+    مخزن المحتوى)، والملفات المرتبطة من خارجه تبقى كما هي. الأرشيف يحتوي
+    index.json بوصف المرفقات. مراحل كل حالة تُسجل في ملف journal بجانب الأرشيف
+    فتُستكمل الأرشفة المنقطعة من آخر مرحلة: packing (الملف الجزئي يحتفظ بما أُضيف)
+    ثم packed (اكتمل الأرشيف وطابق CRC كل ملف) ثم committed (سُجل في قاعدة
+    البيانات)، وبعدها تُحذف الملفات الأصلية التي لم يعد يستخدمها مرفق غير مؤرشف.
+    """
+
+    def __init__(self, database, files_root, project_root, method='deflate'):
+        if method not in COMPRESSION_METHODS:
+            raise ValueError(f"طريقة ضغط غير معروفة: {method}")
+        self.database = database
+        self.files_root = os.path.abspath(files_root)
+        self.project_root = project_root
+        self.method = method
+        self.archive_root = os.path.join(self.files_root, ARCHIVE_FOLDER)
+
+    def archive_path_for(self, case_id, created_date=None):
+        year = str(created_date)[:4] if created_date and str(created_date)[:4].isdigit() else 'other'
+        return os.path.join(self.archive_root, year, f"case_{case_id}.zip")
+
+    def archive_closed_cases(self, before_year=None, progress=None, cancel_event=None):
+        """أرشفة الحالات المغلقة المنشأة قبل before_year (الافتراضي: السنوات السابقة)
+
+        تُستكمل الأرشفات المنقطعة أولاً. progress(done, total) بعدد الحالات.
+        """
+        started = time.perf_counter()
+        report = {'cases': 0, 'files': 0, 'original_bytes': 0, 'archive_bytes': 0,
+                  'reclaimed_bytes': 0, 'resumed': 0, 'failed': []}
+        cancelled = False
+        for journal_path in self._pending_journals():
+            journal = self._read_journal(journal_path)
+            if journal is None:
+                continue
+            report['resumed'] += 1
+            if not self._run(journal['case_id'], journal['archive_path'], report, cancel_event):
+                cancelled = True
+                break
+
+        before_year = int(before_year or datetime.now().year)
+        candidates = [] if cancelled else self.database.get_archive_candidates(f"{before_year:04d}-01-01")
+        for done, (case_id, created_date) in enumerate(candidates, 1):
+            if not self._run(case_id, self.archive_path_for(case_id, created_date), report, cancel_event):
+                break
+            if progress:
+                progress(done, len(candidates))
+        report['seconds'] = round(time.perf_counter() - started, 2)
+        return report
+
+    def _run(self, case_id, archive_path, report, cancel_event):
+        """أرشفة حالة وإضافة نتيجتها للتقرير (False عند الإلغاء)"""
+        try:
+            result = self._archive(case_id, archive_path, cancel_event)
+        except ArchiveCancelled:
+            return False
+        except (ArchiveError, OSError, zipfile.BadZipFile) as e:
+            print(f"خطأ في أرشفة الحالة {case_id}: {e}")
+            report['failed'].append(case_id)
+            return True
+        if result:
+            report['cases'] += 1
+            for key in ('files', 'original_bytes', 'archive_bytes', 'reclaimed_bytes'):
+                report[key] += result[key]
+        return True
+
+    def archive_case(self, case_id, created_date=None, cancel_event=None):
+        """أرشفة مرفقات حالة واحدة وإرجاع النتيجة (None إذا لم يكن لها ما يُؤرشف)"""
+        return self._archive(case_id, self.archive_path_for(case_id, created_date), cancel_event)
+
+    def remove_case_archive(self, case_id, archive_path=None, created_date=None):
+        """حذف أرشيف الحالة وملف السجل والملف الجزئي (عند حذف الحالة) وإرجاع البايتات المحررة
+
+        archive_path المسجل في case_archives إن وُجد، والمسار المتوقع من سنة الإنشاء
+        يُفحص أيضاً لأن الأرشفة المنقطعة تترك سجلاً بدون صف في قاعدة البيانات.
+        """
+        paths = {self.archive_path_for(case_id, created_date)}
+        if archive_path:
+            paths.add(resolve_stored_path(archive_path, self.project_root))
+        freed = 0
+        for path in paths:
+            for candidate in (path, path + JOURNAL_SUFFIX, path + PART_SUFFIX):
+                try:
+                    size = os.path.getsize(candidate)
+                    os.remove(candidate)
+                    freed += size
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"خطأ في حذف ملف الأرشيف {candidate}: {e}")
+        return freed
+
+    def _archive(self, case_id, archive_path, cancel_event=None):
+        journal_path = archive_path + JOURNAL_SUFFIX
+        journal = self._read_journal(journal_path)
+        if journal is None:
+            if self.database.get_case_archive(case_id):
+                return None
+            entries = self._collect_entries(case_id)
+            if not entries:
+                return None
+            journal = {'case_id': case_id, 'archive_path': archive_path, 'method': self.method,
+                       'phase': 'packing', 'entries': entries}
+            os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+            self._write_journal(journal_path, journal)
+
+        part_path = archive_path + PART_SUFFIX
+        if journal['phase'] == 'packing':
+            try:
+                self._pack(journal, journal_path, part_path, cancel_event)
+                self._verify(journal, part_path)
+            except (ArchiveError, OSError, zipfile.BadZipFile):
+                # أرشيف غير سليم أو ملف أصلي لم يعد متاحاً: يُبدأ من جديد في المرة القادمة
+                for path in (part_path, journal_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+            os.replace(part_path, archive_path)
+            journal['phase'] = 'packed'
+            self._write_journal(journal_path, journal)
+
+        original_bytes = sum(entry['size'] for entry in journal['entries'])
+        archive_bytes = os.path.getsize(archive_path)
+        if journal['phase'] == 'packed':
+            members = {attachment['id']: entry['member']
+                       for entry in journal['entries'] for attachment in entry['attachments']}
+            if not self.database.mark_case_archived(case_id, archive_path, journal['method'], members,
+                                                    original_bytes, archive_bytes):
+                raise ArchiveError(f"تعذر تسجيل أرشيف الحالة {case_id}")
+            journal['phase'] = 'committed'
+            self._write_journal(journal_path, journal)
+
+        freed = self._release_sources(journal, journal_path)
+        reclaimed = freed - archive_bytes
+        self.database.set_archive_reclaimed(case_id, reclaimed)
+        os.remove(journal_path)
+        return {'case_id': case_id, 'archive_path': archive_path,
+                'files': sum(len(entry['attachments']) for entry in journal['entries']),
+                'original_bytes': original_bytes, 'archive_bytes': archive_bytes, 'reclaimed_bytes': reclaimed}
+
+    def _collect_entries(self, case_id):
+        """ملفات مرفقات الحالة المملوكة للنظام (ملف واحد في الأرشيف لكل ملف على القرص)"""
+        entries = {}
+        for row in self.database.get_attachments(case_id):
+            if row.get('archive_member'):
+                continue
+            path = resolve_stored_path(row.get('file_path'), self.project_root)
+            if (not path or not is_within(path, self.files_root) or is_within(path, self.archive_root)
+                    or not os.path.isfile(path)):
+                continue
+            entry = entries.get(path)
+            if entry is None:
+                file_name = os.path.basename(row.get('file_name') or path).replace('/', '_').replace('\\', '_')
+                entry = entries[path] = {
+                    'path': path, 'stored_path': row.get('file_path'), 'member': f"{row['id']}_{file_name}",
+                    'blob_hash': row.get('blob_hash'), 'size': os.path.getsize(path), 'crc': None,
+                    'attachments': []
+                }
+            entry['attachments'].append({
+                'id': row['id'], 'file_name': row.get('file_name'), 'description': row.get('description'),
+                'upload_date': row.get('upload_date'), 'uploaded_by': row.get('uploaded_by_name')
+            })
+        return list(entries.values())
+
+    def _pack(self, journal, journal_path, part_path, cancel_event):
+        """إضافة الملفات إلى الأرشيف الجزئي (الملفات المضافة سابقاً تُتخطى)"""
+        existing = set()
+        if os.path.exists(part_path):
+            try:
+                with zipfile.ZipFile(part_path) as archive:
+                    existing = set(archive.namelist())
+            except zipfile.BadZipFile:
+                # انقطعت الكتابة في منتصف ملف: لا يمكن استكمال هذا الجزء
+                os.remove(part_path)
+        compression = COMPRESSION_METHODS[journal['method']]
+        for entry in journal['entries']:
+            if entry['member'] in existing:
+                continue
+            if cancel_event is not None and cancel_event.is_set():
+                raise ArchiveCancelled(journal['case_id'])
+            # فتح الأرشيف لكل ملف: الفهرس المركزي يُكتب بعد كل ملف فيبقى الجزء قابلاً للاستكمال
+            with zipfile.ZipFile(part_path, 'a' if os.path.exists(part_path) else 'w', allowZip64=True) as archive:
+                entry['crc'] = self._write_member(archive, entry, compression)
+            self._write_journal(journal_path, journal)
+        if ARCHIVE_INDEX_NAME not in existing:
+            index = {'case_id': journal['case_id'], 'archived_date': datetime.now().isoformat(timespec='seconds'),
+                     'files': [{'member': entry['member'], 'size': entry['size'], 'sha256': entry['blob_hash'],
+                                'attachments': entry['attachments']} for entry in journal['entries']]}
+            with zipfile.ZipFile(part_path, 'a', allowZip64=True) as archive:
+                archive.writestr(ARCHIVE_INDEX_NAME, json.dumps(index, ensure_ascii=False, indent=2),
+                                 compress_type=zipfile.ZIP_DEFLATED)
+
+    @staticmethod
+    def _write_member(archive, entry, compression):
+        """نسخ ملف إلى الأرشيف على دفعات وإرجاع CRC محتواه الأصلي"""
+        stat = os.stat(entry['path'])
+        info = zipfile.ZipInfo(entry['member'], date_time=max(time.localtime(stat.st_mtime)[:6], (1980, 1, 1, 0, 0, 0)))
+        extension = os.path.splitext(entry['path'])[1].lower()
+        info.compress_type = zipfile.ZIP_STORED if extension in COMPRESSED_EXTENSIONS else compression
+        crc = 0
+        with open(entry['path'], 'rb') as source, \
+                archive.open(info, 'w', force_zip64=stat.st_size > zipfile.ZIP64_LIMIT) as target:
+            while True:
+                chunk = source.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                target.write(chunk)
+        return crc
+
+    @staticmethod
+    def _verify(journal, part_path):
+        """قراءة كل ملف من الأرشيف ومطابقة CRC والحجم مع الملف الأصلي"""
+        with zipfile.ZipFile(part_path) as archive:
+            bad_member = archive.testzip()
+            if bad_member:
+                raise ArchiveError(f"CRC غير مطابق في {bad_member}")
+            for entry in journal['entries']:
+                try:
+                    info = archive.getinfo(entry['member'])
+                except KeyError:
+                    raise ArchiveError(f"الملف {entry['member']} غير موجود في الأرشيف")
+                # CRC غير مسجل إذا انقطعت الأرشفة بعد إضافة الملف مباشرة
+                expected = entry['crc'] if entry['crc'] is not None else _file_crc(entry['path'])
+                if info.file_size != entry['size'] or info.CRC != expected:
+                    raise ArchiveError(f"الملف {entry['member']} تغير أثناء الأرشفة")
+
+    def _release_sources(self, journal, journal_path):
+        """حذف الملفات الأصلية غير المستخدمة في مرفقات أخرى وإرجاع البايتات المحررة"""
+        for entry in journal['entries']:
+            if entry.get('released'):
+                continue
+            if entry['blob_hash']:
+                in_use = self.database.count_unarchived_references(blob_hash=entry['blob_hash'])
+            else:
+                in_use = self.database.count_unarchived_references(file_path=entry['stored_path'])
+            entry['released'] = True
+            if not in_use and os.path.exists(entry['path']):
+                try:
+                    os.remove(entry['path'])
+                    entry['freed'] = entry['size']
+                except OSError as e:
+                    print(f"خطأ في حذف الملف المؤرشف {entry['path']}: {e}")
+            self._write_journal(journal_path, journal)
+        try:
+            # مجلد الحالة القديم (files/case_<id>) إذا أصبح فارغاً
+            os.rmdir(os.path.join(self.files_root, f"case_{journal['case_id']}"))
+        except OSError:
+            pass
+        return sum(entry.get('freed', 0) for entry in journal['entries'])
+
+    def _pending_journals(self):
+        journals = []
+        if not os.path.isdir(self.archive_root):
+            return journals
+        for year_entry in os.scandir(self.archive_root):
+            if year_entry.is_dir():
+                journals.extend(entry.path for entry in os.scandir(year_entry.path)
+                                if entry.name.endswith(JOURNAL_SUFFIX))
+        return sorted(journals)
+
+    @staticmethod
+    def _read_journal(journal_path):
+        try:
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"خطأ في قراءة سجل الأرشفة {journal_path}: {e}")
+            return None
+
+    @staticmethod
+    def _write_journal(journal_path, journal):
+        # الكتابة في ملف مؤقت ثم استبداله حتى لا يبقى سجل نصف مكتوب
+        temp_path = journal_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(journal, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, journal_path)
+
+
+def extract_attachment(database, attachment_id, project_root, cache_folder=DEFAULT_EXTRACT_FOLDER):
+    """استخراج ملف مرفق مؤرشف لفتحه وإرجاع مساره (None إذا لم يكن المرفق مؤرشفاً)
+
+    الملف المستخرج سابقاً يُعاد استخدامه. zipfile يتحقق من CRC عند نهاية القراءة.
+    """
+    archived = database.get_archived_attachment(attachment_id)
+    if not archived:
+        return None
+    case_id, archive_path, member = archived
+    target = os.path.join(cache_folder, f"case_{case_id}", member)
+    with zipfile.ZipFile(resolve_stored_path(archive_path, project_root)) as archive:
+        info = archive.getinfo(member)
+        if os.path.isfile(target) and os.path.getsize(target) == info.file_size:
+            # تحديث وقت التعديل حتى لا يُحذف الملف المستخدم حديثاً
+            os.utime(target)
+            return target
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = target + PART_SUFFIX
+        with archive.open(info) as source, open(temp_path, 'wb') as out:
+            shutil.copyfileobj(source, out, COPY_CHUNK_SIZE)
+    os.replace(temp_path, target)
+    return target
+
+
+def purge_extract_cache(cache_folder=DEFAULT_EXTRACT_FOLDER, max_age=EXTRACT_MAX_AGE):
+    """حذف الملفات المستخرجة التي لم تُستخدم منذ max_age ثانية، وإرجاع البايتات المحررة"""
+    if not os.path.isdir(cache_folder):
+        return 0
+    freed = 0
+    cutoff = time.time() - max_age
+    for case_entry in os.scandir(cache_folder):
+        if not case_entry.is_dir():
+            continue
+        for entry in os.scandir(case_entry.path):
+            try:
+                stat = entry.stat()
+                if stat.st_mtime < cutoff:
+                    os.remove(entry.path)
+                    freed += stat.st_size
+            except OSError:
+                # الملف مفتوح في برنامج آخر
+                pass
+        try:
+            os.rmdir(case_entry.path)
+        except OSError:
+            pass
+    return freed
+
+
+if __name__ == "__main__":
+    commands = ("archive", "extract")
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("الاستخدام: python customer_issues_archiver.py archive [files_path] [--before=السنة] [--lzma]")
+        print("           python customer_issues_archiver.py extract <رقم_المرفق>")
+        sys.exit(1)
+    from customer_issues_database import enhanced_db
+    from customer_issues_file_manager import FileManager, PROJECT_ROOT
+    if sys.argv[1] == "extract":
+        path = extract_attachment(enhanced_db, int(sys.argv[2]), PROJECT_ROOT)
+        print(path if path else "المرفق غير مؤرشف")
+        sys.exit(0)
+    arguments = [arg for arg in sys.argv[2:] if not arg.startswith('--')]
+    before = [arg.split('=', 1)[1] for arg in sys.argv[2:] if arg.startswith('--before=')]
+    files_path = os.path.abspath(arguments[0] if arguments else os.path.join(PROJECT_ROOT, "files"))
+    format_size = FileManager(files_path).format_size
+    archiver = CaseArchiver(enhanced_db, files_path, PROJECT_ROOT, 'lzma' if '--lzma' in sys.argv else 'deflate')
+    result = archiver.archive_closed_cases(before[0] if before else None)
+    print(f"الحالات المؤرشفة: {result['cases']} - المرفقات: {result['files']} - المستكملة: {result['resumed']} ({result['seconds']} ثانية)")
+    print(f"الحجم الأصلي: {format_size(result['original_bytes'])} - حجم الأرشيفات: {format_size(result['archive_bytes'])}")
+    print(f"المساحة الموفرة: {format_size(result['reclaimed_bytes'])}")
+    if result['failed']:
+        print(f"تعذرت أرشفة الحالات: {', '.join(str(case_id) for case_id in result['failed'])}")
@@ -0,0 +1,86 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundTask:
+    """مهمة خلفية يمكن إلغاؤها (تُهمل نتيجتها عند الإلغاء)"""
+
+    def __init__(self, on_done=None, on_error=None):
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        """إلغاء المهمة: لن يتم استدعاء on_done أو on_error"""
+        self.cancelled = True
+
+
+class BackgroundRunner:
+    """تشغيل المهام في خيوط خلفية وتسليم نتائجها إلى خيط الواجهة
+
+    Tk لا يسمح بتعديل الواجهة من خيوط أخرى، لذلك توضع النتائج في طابور
+    ويتم تسليمها بـ root.after أثناء وجود مهام قيد التنفيذ فقط.
+    """
+
+    def __init__(self, root, max_workers=2, poll_ms=30):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._results = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._poll_job = None
+
+    def submit(self, function, *args, on_done=None, on_error=None):
+        """تشغيل function(*args) في الخلفية واستدعاء on_done(result) في خيط الواجهة"""
+        task = BackgroundTask(on_done, on_error)
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._run, task, function, args)
+        self._schedule_poll()
+        return task
+
+    def _run(self, task, function, args):
+        if task.cancelled:
+            self._results.put((task, None, None))
+            return
+        try:
+            self._results.put((task, function(*args), None))
+        except Exception as e:
+            self._results.put((task, None, e))
+
+    def _schedule_poll(self):
+        if self._poll_job is None:
+            try:
+                self._poll_job = self.root.after(self.poll_ms, self._poll)
+            except Exception:
+                # النافذة أُغلقت
+                self._poll_job = None
+
+    def _poll(self):
+        self._poll_job = None
+        while True:
+            try:
+                task, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._pending -= 1
+            task.done = True
+            if task.cancelled:
+                continue
+            if error is not None:
+                if task.on_error:
+                    task.on_error(error)
+                else:
+                    print(f"خطأ في مهمة خلفية: {error}")
+            elif task.on_done:
+                task.on_done(result)
+        if self._pending > 0:
+            self._schedule_poll()
+
+    def shutdown(self):
+        """إيقاف الخيوط الخلفية دون انتظار المهام الجارية"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,241 @@
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+from datetime import datetime, timedelta
+
+from customer_issues_ingest import ingest_file, discard_stale_parts
+
+# اسم مجلد ملفات المحتوى داخل مجلد المرفقات
+BLOB_FOLDER = "blobs"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# ملف المحتوى الجديد لا يُحذف قبل هذه المدة حتى لو لم يُربط بعد بمرفق
+GC_GRACE_PERIOD = timedelta(hours=1)
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    """بصمة SHA-256 للملف وحجمه"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def resolve_stored_path(file_path, project_root):
+    """تحويل المسار المخزن في قاعدة البيانات إلى مسار على هذا الجهاز
+
+    المسارات القديمة قد تكون نسبية (files\\case_5\\...) أو بفواصل ويندوز.
+    """
+    if not file_path:
+        return None
+    path = str(file_path)
+    if os.sep != '\\':
+        path = path.replace('\\', os.sep)
+    if not os.path.isabs(path):
+        path = os.path.join(project_root, path)
+    return os.path.abspath(path)
+
+
+def is_within(path, root):
+    """هل المسار داخل المجلد root"""
+    try:
+        return os.path.commonpath([os.path.abspath(path), os.path.abspath(root)]) == os.path.abspath(root)
+    except ValueError:
+        # قرصان مختلفان في ويندوز
+        return False
+
+
+class BlobStore:
+    """مخزن المرفقات حسب المحتوى: ملف واحد لكل بصمة SHA-256
+
+    الملف يُخزن في blobs/<أول حرفين>/<البصمة><الامتداد> (الامتداد لفتحه بالبرنامج
+    المناسب). كل مرفق في جدول attachments يشير إلى البصمة في blob_hash، وعدد
+    المراجع في attachment_blobs يحدد الملفات التي لم يعد يشير إليها أحد لتحذفها
+    collect_garbage().
+    """
+
+    def __init__(self, database, root):
+        self.database = database
+        self.root = os.path.abspath(root)
+
+    def path_for(self, sha256, extension=''):
+        return os.path.join(self.root, sha256[:2], sha256 + extension.lower())
+
+    def existing_blob(self, sha256):
+        """مسار ملف المحتوى المسجل إذا كان موجوداً على القرص
+
+        إعادة الاستخدام تُحدّث تاريخ التسجيل أولاً حتى لا يحذف التنظيف الملف قبل
+        إضافة المرفق الذي سيشير إليه.
+        """
+        blob = self.database.get_blob(sha256)
+        if blob and self.database.touch_blob(sha256) and os.path.exists(blob[1]):
+            return blob[1]
+        return None
+
+    def put_file(self, source_path, move=False):
+        """إضافة ملف إلى المخزن (أو إعادة الملف الموجود بنفس المحتوى)
+
+        تُرجع dict: sha256 وpath وsize وstored (False إذا كان المحتوى مخزناً مسبقاً).
+        move=True ينقل الملف بدلاً من نسخه (للترحيل داخل نفس القرص).
+        """
+        if not move:
+            # النسخ يحسب البصمة في نفس القراءة (مع استكمال نسخ سابق منقطع)
+            return ingest_file(self, source_path)
+
+        sha256, size = hash_file(source_path)
+        existing = self.existing_blob(sha256)
+        if existing:
+            return {'sha256': sha256, 'path': existing, 'size': size, 'stored': False}
+
+        target = self.path_for(sha256, os.path.splitext(source_path)[1])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        os.close(fd)
+        shutil.move(source_path, temp_path)
+        return self.adopt_file(temp_path, sha256, size, os.path.splitext(source_path)[1])
+
+    def adopt_file(self, temp_path, sha256, size, extension=''):
+        """نقل ملف مؤقت مكتمل ببصمة معروفة إلى مكانه في المخزن وتسجيله
+
+        إذا كان المحتوى مخزناً مسبقاً يُحذف الملف المؤقت ويُعاد الملف الموجود.
+        """
+        existing = self.existing_blob(sha256)
+        if existing:
+            os.remove(temp_path)
+            return {'sha256': sha256, 'path': existing, 'size': size, 'stored': False}
+        target = self.path_for(sha256, extension)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # الاسم النهائي لا يظهر إلا بعد اكتمال النسخ
+        os.replace(temp_path, target)
+        self.database.register_blob(sha256, target, size)
+        # تسجيل سابق لنفس البصمة بملف مفقود يُوجه إلى الملف الجديد
+        self.database.update_blob_path(sha256, target)
+        return {'sha256': sha256, 'path': target, 'size': size, 'stored': True}
+
+    def collect_garbage(self, dry_run=False, grace_period=GC_GRACE_PERIOD):
+        """حذف ملفات المحتوى التي لا يشير إليها أي مرفق
+
+        يُعاد حساب المراجع من جدول المرفقات أولاً حتى لا يُحذف ملف مستخدم بسبب
+        عدد مراجع غير دقيق. الملفات المسجلة أو المعاد استخدامها خلال grace_period
+        تُترك لأن إضافة مرفقها قد تكون جارية. تُرجع عدد الملفات والبايتات المحررة.
+        """
+        removed = 0
+        freed = 0
+        created_before = (datetime.now() - grace_period).strftime("%Y-%m-%d %H:%M:%S")
+        for sha256, blob_path, size in self.database.recount_orphaned_blobs(created_before):
+            if dry_run:
+                removed += 1
+                freed += size or 0
+                continue
+            try:
+                # التسجيل يُحذف أولاً بنفس الشروط: ملف أُعيد استخدامه بعد اختياره يبقى
+                if not self.database.delete_blob_record(sha256, created_before):
+                    continue
+                if blob_path and os.path.exists(blob_path):
+                    os.remove(blob_path)
+                    freed += size or 0
+                removed += 1
+            except OSError as e:
+                print(f"خطأ في حذف ملف المحتوى {sha256}: {e}")
+        if not dry_run:
+            # نسخ منقطعة لم يُعد لاستكمالها أحد
+            freed += discard_stale_parts(self.root)
+        return {'removed': removed, 'freed_bytes': freed}
+
+    def migrate_files_tree(self, files_root, project_root, dry_run=False):
+        """ترحيل المرفقات المنسوخة سابقاً في مجلدات case_<id> إلى المخزن مع إزالة التكرار
+
+        المرفقات المرتبطة بملفات خارج files_root لا تُنقل (النظام لا يملكها).
+        تُرجع تقريراً بعدد المرفقات المرحّلة والمكررة والمفقودة والمساحة الموفرة.
+        """
+        files_root = os.path.abspath(files_root)
+        report = {'migrated': 0, 'duplicates': 0, 'missing': 0, 'external': 0,
+                  'bytes_before': 0, 'bytes_after': 0, 'saved_bytes': 0}
+        seen = {}
+        moved = {}
+        for attachment_id, case_id, file_name, file_path in self.database.get_unhashed_attachments():
+            path = resolve_stored_path(file_path, project_root)
+            if not path or not is_within(path, files_root):
+                report['external'] += 1
+                continue
+            if path in moved:
+                # مرفق آخر يشير إلى نفس الملف الذي نُقل للتو
+                if not dry_run:
+                    self.database.link_attachment_blob(attachment_id, moved[path]['sha256'], moved[path]['path'])
+                report['migrated'] += 1
+                continue
+            if not os.path.isfile(path):
+                report['missing'] += 1
+                continue
+            if dry_run:
+                sha256, size = hash_file(path)
+                report['bytes_before'] += size
+                if sha256 in seen or self.existing_blob(sha256):
+                    report['duplicates'] += 1
+                else:
+                    report['bytes_after'] += size
+                seen[sha256] = path
+                moved[path] = None
+                report['migrated'] += 1
+                continue
+            try:
+                blob = self.put_file(path, move=True)
+            except OSError as e:
+                print(f"خطأ في ترحيل المرفق {attachment_id}: {e}")
+                continue
+            report['bytes_before'] += blob['size']
+            if blob['stored']:
+                report['bytes_after'] += blob['size']
+            else:
+                # نسخة مكررة من محتوى مخزن: تُحذف ويشير المرفق إلى الملف المخزن
+                report['duplicates'] += 1
+                os.remove(path)
+            self.database.link_attachment_blob(attachment_id, blob['sha256'], blob['path'])
+            moved[path] = blob
+            report['migrated'] += 1
+        if not dry_run:
+            self._remove_empty_case_folders(files_root)
+        report['saved_bytes'] = report['bytes_before'] - report['bytes_after']
+        return report
+
+    def _remove_empty_case_folders(self, files_root):
+        for entry in os.scandir(files_root):
+            if entry.is_dir() and entry.name.startswith('case_'):
+                try:
+                    os.rmdir(entry.path)
+                except OSError:
+                    # المجلد يحتوي ملفات غير مسجلة في قاعدة البيانات
+                    pass
+
+
+if __name__ == "__main__":
+    commands = ("migrate", "gc")
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("الاستخدام: python customer_issues_blob_store.py migrate [files_path] [--dry-run]")
+        print("           python customer_issues_blob_store.py gc [files_path] [--dry-run]")
+        sys.exit(1)
+    from customer_issues_database import enhanced_db
+    from customer_issues_file_manager import FileManager, PROJECT_ROOT
+    arguments = [arg for arg in sys.argv[2:] if arg != '--dry-run']
+    dry_run = '--dry-run' in sys.argv
+    files_path = os.path.abspath(arguments[0] if arguments else os.path.join(PROJECT_ROOT, "files"))
+    store = BlobStore(enhanced_db, os.path.join(files_path, BLOB_FOLDER))
+    format_size = FileManager(files_path).format_size
+    if sys.argv[1] == "migrate":
+        result = store.migrate_files_tree(files_path, PROJECT_ROOT, dry_run=dry_run)
+        print(f"المرفقات المرحّلة: {result['migrated']} - المكررة: {result['duplicates']}")
+        print(f"المفقودة: {result['missing']} - المرتبطة من خارج المجلد: {result['external']}")
+        print(f"الحجم قبل: {format_size(result['bytes_before'])} - بعد: {format_size(result['bytes_after'])}")
+        print(f"المساحة الموفرة: {format_size(result['saved_bytes'])}")
+    else:
+        result = store.collect_garbage(dry_run=dry_run)
+        print(f"ملفات المحتوى المحذوفة: {result['removed']} - المساحة المحررة: {format_size(result['freed_bytes'])}")
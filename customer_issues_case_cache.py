@@ -0,0 +1,178 @@
+import sys
+from collections import OrderedDict
+
+from customer_issues_compression import LazyText
+
+
+def estimate_size(value):
+    """تقدير تقريبي لحجم القيمة في الذاكرة بالبايت (للتقارير فقط)"""
+    if isinstance(value, LazyText):
+        return sys.getsizeof(value) + value.stored_size
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class CaseDataCache:
+    """ذاكرة مؤقتة محدودة (LRU) لحزم بيانات الحالات
+
+    لكل حالة حزمة {اسم الجزء: البيانات}: 'details' لتفاصيل الحالة و'attachments'
+    و'correspondences' و'audit_log' للتبويبات. عند تجاوز max_cases تُحذف الحالة
+    الأقدم استخداماً. الصلاحية تُلغى من سجل التغييرات (change_feed): أي تغيير في
+    صفوف حالة يحذف حزمتها. القراءة من الذاكرة لا تستعلم السجل، والمزامنة تتم
+    دورياً بـ fetch_changes في الخلفية ثم apply_changes في خيط الواجهة. لكل حالة رقم جيل يزيد عند الإلغاء، حتى لا تُخزن
+    نتيجة تحميل بدأ قبل التغيير.
+    """
+
+    def __init__(self, database, max_cases=200):
+        self.database = database
+        self.max_cases = max_cases
+        self.version = database.get_data_version()
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def sync(self):
+        """قراءة التغييرات الجديدة من سجل التغييرات وإلغاء بيانات الحالات المتأثرة"""
+        self.apply_changes(self.fetch_changes())
+
+    def fetch_changes(self):
+        """قراءة سجل التغييرات منذ آخر مزامنة (يمكن تنفيذها في خيط خلفي)
+
+        تُرجع (الإصدار المقروء منه، التغييرات، الإصدار الجديد) لتمريرها إلى apply_changes.
+        """
+        since = self.version
+        changes, version = self.database.get_changes_since(since)
+        return since, changes, version
+
+    def apply_changes(self, result):
+        """إلغاء بيانات الحالات المتأثرة بنتيجة fetch_changes (في خيط الواجهة)"""
+        since, changes, version = result
+        if since != self.version:
+            # نتيجة مزامنة أقدم من آخر مزامنة طُبقت
+            return
+        if changes is None:
+            # السجل لا يغطي الفترة منذ آخر مزامنة
+            self.clear()
+        else:
+            for case_id in {change['case_id'] for change in changes}:
+                self.invalidate(case_id)
+        self.version = version
+
+    def generation(self, case_id):
+        """رقم جيل بيانات الحالة (يُحفظ عند بدء التحميل ويُمرر إلى put)"""
+        return self._epoch, self._generations.get(case_id, 0)
+
+    def contains(self, case_id, part):
+        """هل البيانات مخزنة (بدون احتسابها في نسبة الإصابة)"""
+        return part in self._entries.get(case_id, {})
+
+    def get(self, case_id, part):
+        """البيانات المخزنة أو None"""
+        bundle = self._entries.get(case_id)
+        if bundle is None or part not in bundle:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(case_id)
+        return bundle[part]
+
+    def put(self, case_id, part, data, generation=None):
+        """تخزين البيانات إذا لم تتغير الحالة منذ بدء تحميلها"""
+        if generation is not None and generation != self.generation(case_id):
+            return False
+        self._entries.setdefault(case_id, {})[part] = data
+        self._entries.move_to_end(case_id)
+        while len(self._entries) > self.max_cases:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return True
+
+    def invalidate(self, case_id, part=None):
+        """إلغاء بيانات حالة (أو جزء واحد منها)"""
+        if case_id is None:
+            return
+        self._generations[case_id] = self._generations.get(case_id, 0) + 1
+        if part is None:
+            self._entries.pop(case_id, None)
+        elif case_id in self._entries:
+            self._entries[case_id].pop(part, None)
+
+    def clear(self):
+        """إلغاء جميع البيانات المخزنة"""
+        self._epoch += 1
+        self._entries.clear()
+
+    def stats(self):
+        """إحصائيات الاستخدام: نسبة الإصابة وعدد الحالات والحجم التقريبي"""
+        lookups = self.hits + self.misses
+        return {
+            'cases': len(self._entries),
+            'max_cases': self.max_cases,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'approx_bytes': sum(estimate_size(bundle) for bundle in self._entries.values())
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"الحالات المخزنة: {stats['cases']}/{stats['max_cases']} - "
+                f"نسبة الإصابة: {stats['hit_rate'] * 100:.1f}% - "
+                f"الحجم التقريبي: {stats['approx_bytes'] / 1024:.1f} KB")
+
+
+class CasePrefetcher:
+    """تحميل بيانات الحالات المجاورة للحالة المحددة مسبقاً في الخلفية
+
+    عند التنقل بالأسهم تكون الحالة التالية غالباً في الذاكرة المؤقتة بالفعل.
+    الطلبات السابقة التي لم تبدأ بعد تُلغى عند تغير التحديد.
+    """
+
+    def __init__(self, cache, runner, fetchers, radius=3):
+        self.cache = cache
+        self.runner = runner
+        self.fetchers = fetchers
+        self.radius = radius
+        self.requested = 0
+        self.completed = 0
+        self._tasks = []
+
+    def prefetch_around(self, case_ids, index, parts=('details',)):
+        """تحميل الأجزاء المطلوبة لـ radius حالة قبل وبعد الموضع index"""
+        self.cancel()
+        neighbours = []
+        for distance in range(1, self.radius + 1):
+            for position in (index + distance, index - distance):
+                if 0 <= position < len(case_ids):
+                    neighbours.append(case_ids[position])
+        for case_id in neighbours:
+            for part in parts:
+                if part in self.fetchers and not self.cache.contains(case_id, part):
+                    self._submit(case_id, part)
+
+    def _submit(self, case_id, part):
+        generation = self.cache.generation(case_id)
+        self.requested += 1
+        self._tasks.append(self.runner.submit(
+            self.fetchers[part], case_id,
+            on_done=lambda data: self._on_loaded(case_id, part, data, generation)
+        ))
+
+    def _on_loaded(self, case_id, part, data, generation):
+        self.completed += 1
+        if data is not None:
+            self.cache.put(case_id, part, data, generation)
+
+    def cancel(self):
+        """إلغاء طلبات التحميل المسبق التي لم تنتهِ"""
+        for task in self._tasks:
+            if not task.done:
+                task.cancel()
+        self._tasks = []
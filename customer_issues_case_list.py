@@ -0,0 +1,312 @@
+import bisect
+import tkinter as tk
+
+# ألوان شارة الحالة
+STATUS_COLORS = {
+    'جديدة': '#3498db',
+    'قيد التنفيذ': '#f39c12',
+    'تم حلها': '#27ae60',
+    'مغلقة': '#95a5a6'
+}
+CLOSED_STATUSES = ('تم حلها', 'مغلقة')
+
+CARD_BG = '#ffffff'
+SELECTED_CARD_BG = '#d1e7fd'
+
+
+def case_field(case, key, index):
+    """قراءة حقل من ملخص حالة (dict أو tuple)"""
+    if isinstance(case, dict):
+        return case.get(key) or ''
+    return case[index] if len(case) > index and case[index] is not None else ''
+
+
+def case_key(case):
+    """مفتاح الحالة في القائمة (رقم الحالة)"""
+    return case_field(case, 'id', 0)
+
+
+def _stable_keys(positions):
+    """مفاتيح أطول تسلسل متزايد من المواضع القديمة (العناصر التي لا تحتاج نقلاً)
+
+    positions: قائمة (الموضع القديم، المفتاح) بترتيب القائمة الجديدة.
+    """
+    tails = []
+    tail_items = []
+    previous = {}
+    for old_index, key in positions:
+        slot = bisect.bisect_left(tails, old_index)
+        previous[key] = tail_items[slot - 1] if slot else None
+        if slot == len(tails):
+            tails.append(old_index)
+            tail_items.append(key)
+        else:
+            tails[slot] = old_index
+            tail_items[slot] = key
+    stable = set()
+    key = tail_items[-1] if tail_items else None
+    while key is not None:
+        stable.add(key)
+        key = previous[key]
+    return stable
+
+
+def diff_case_lists(old_cases, new_cases):
+    """أقل مجموعة عمليات لتحويل القائمة القديمة إلى الجديدة
+
+    تُرجع قائمة عمليات: ('remove', موضع قديم, مفتاح)، ('insert', موضع جديد, مفتاح)،
+    ('move', موضع جديد, مفتاح)، ('update', موضع جديد, مفتاح).
+    العناصر المشتركة التي تحافظ على ترتيبها النسبي (أطول تسلسل متزايد) لا تُنقل.
+    """
+    old_positions = {case_key(case): index for index, case in enumerate(old_cases)}
+    new_keys = [case_key(case) for case in new_cases]
+    new_key_set = set(new_keys)
+    operations = [('remove', index, key) for key, index in old_positions.items() if key not in new_key_set]
+    stable = _stable_keys([(old_positions[key], key) for key in new_keys if key in old_positions])
+    for index, key in enumerate(new_keys):
+        if key not in old_positions:
+            operations.append(('insert', index, key))
+            continue
+        if key not in stable:
+            operations.append(('move', index, key))
+        if old_cases[old_positions[key]] != new_cases[index]:
+            operations.append(('update', index, key))
+    return operations
+
+
+def merge_changed_cases(cases, changed_rows, changed_keys, sort_key, reverse=False):
+    """تحديث قائمة مرتبة بالحالات المتغيرة فقط
+
+    تُحذف الحالات المتغيرة من القائمة ثم يُدرج كل صف جديد في موضعه حسب
+    مفتاح الترتيب (بحث ثنائي)، بدلاً من إعادة الاستعلام عن القائمة كاملة.
+    """
+    merged = [case for case in cases if case_key(case) not in changed_keys]
+    for row in changed_rows:
+        row_key = sort_key(row)
+        low, high = 0, len(merged)
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = sort_key(merged[middle])
+            before = middle_key >= row_key if reverse else middle_key <= row_key
+            if before:
+                low = middle + 1
+            else:
+                high = middle
+        merged.insert(low, row)
+    return merged
+
+
+class CaseCard:
+    """بطاقة حالة قابلة لإعادة الاستخدام (تُنشأ عناصرها مرة واحدة وتتغير قيمها فقط)"""
+
+    def __init__(self, parent, on_click):
+        self.index = None
+        self.item = None
+        self.frame = tk.Frame(parent, bg=CARD_BG, relief='solid', bd=1)
+        self.frame.pack_propagate(False)
+        self.name_label = tk.Label(self.frame, font=('Arial', 12, 'bold'), bg=CARD_BG, anchor='e')
+        self.name_label.pack(fill='x', padx=10, pady=(8, 2))
+        self.category_label = tk.Label(self.frame, font=('Arial', 10), fg='#7f8c8d', bg=CARD_BG, anchor='e')
+        self.category_label.pack(fill='x', padx=10)
+        self.status_frame = tk.Frame(self.frame, bg=CARD_BG)
+        self.status_frame.pack(anchor='e', padx=10, pady=3)
+        self.status_badge = tk.Label(self.status_frame, font=('Arial', 9, 'bold'), fg='white', padx=8, pady=2)
+        self.status_badge.pack(side='right')
+        self.modifier_label = tk.Label(self.frame, font=('Arial', 8), fg='#95a5a6', bg=CARD_BG, anchor='e')
+        self.modifier_label.pack(fill='x', padx=10, pady=(0, 6))
+        for widget in (self.frame, self.name_label, self.category_label, self.status_frame,
+                       self.status_badge, self.modifier_label):
+            widget.bind("<Button-1>", lambda event: on_click(self.index))
+
+    def show(self, case, index, selected):
+        """عرض بيانات الحالة في البطاقة"""
+        self.index = index
+        status = case_field(case, 'status', 3)
+        closed = status in CLOSED_STATUSES
+        self.frame.configure(highlightbackground='#e74c3c' if closed else '#3498db',
+                             highlightthickness=2 if closed else 1)
+        self.name_label.configure(text=case_field(case, 'customer_name', 1),
+                                  fg='#e74c3c' if closed else '#2c3e50')
+        self.category_label.configure(text=case_field(case, 'category_name', 4))
+        self.status_badge.configure(text=status, bg=STATUS_COLORS.get(status, '#95a5a6'))
+        modified_by_name = case_field(case, 'modified_by_name', 6)
+        self.modifier_label.configure(text=f"آخر تعديل: {modified_by_name}" if modified_by_name else '')
+        self.set_selected(selected)
+
+    def set_selected(self, selected):
+        """تمييز البطاقة المحددة"""
+        background = SELECTED_CARD_BG if selected else CARD_BG
+        for widget in (self.frame, self.name_label, self.category_label, self.status_frame, self.modifier_label):
+            widget.configure(bg=background)
+
+
+class VirtualCaseList:
+    """قائمة حالات افتراضية على Canvas: تُنشأ بطاقات الجزء الظاهر فقط
+
+    كل البطاقات بارتفاع ثابت، لذلك يُحسب موضع أي حالة مباشرة من ترتيبها،
+    ومنطقة التمرير تساوي عدد الحالات × ارتفاع البطاقة. عند التمرير تُعاد
+    البطاقات الخارجة عن العرض إلى مخزن وتُستخدم للحالات الداخلة.
+    البطاقات الظاهرة مفهرسة برقم الحالة، وعند تغيير القائمة تُطبق الفروق فقط
+    (حذف/نقل/تحديث) مع الحفاظ على موضع التمرير والحالة المحددة.
+    """
+
+    def __init__(self, canvas, scrollbar, on_select, card_height=100, spacing=4, overscan=3):
+        self.canvas = canvas
+        self.scrollbar = scrollbar
+        self.on_select = on_select
+        self.card_height = card_height
+        self.row_height = card_height + spacing
+        self.overscan = overscan
+        self.cases = []
+        self.selected_index = None
+        self.selected_key = None
+        self.last_diff = []
+        self._positions = {}
+        self._visible = {}
+        self._pool = []
+        self._render_job = None
+        self.canvas.configure(yscrollcommand=self._on_view_changed)
+        self.scrollbar.configure(command=self.canvas.yview)
+        self.canvas.bind('<Configure>', self._on_resize, add='+')
+
+    def set_cases(self, cases):
+        """تعيين قائمة الحالات المعروضة وتطبيق الفروق على البطاقات الظاهرة فقط"""
+        anchor = self._scroll_anchor()
+        self.last_diff = diff_case_lists(self.cases, cases)
+        updated = {key for operation, _, key in self.last_diff if operation == 'update'}
+        self.cases = cases
+        self._positions = {case_key(case): index for index, case in enumerate(cases)}
+        self.selected_index = self._positions.get(self.selected_key)
+        if self.selected_index is None:
+            self.selected_key = None
+
+        for key, card in list(self._visible.items()):
+            index = self._positions.get(key)
+            if index is None:
+                self._release(key)
+            elif key in updated:
+                self._place(card, index)
+                card.show(cases[index], index, index == self.selected_index)
+            elif index != card.index:
+                # الحالة لم تتغير لكن موضعها تغير (نقل أو إدراج/حذف قبلها)
+                self._place(card, index)
+                card.index = index
+
+        self._update_scrollregion()
+        self._restore_scroll_anchor(anchor)
+        self.render()
+
+    def _scroll_anchor(self):
+        """أول حالة ظاهرة وإزاحتها، لإعادة التمرير إليها بعد تغيير القائمة"""
+        if not self.cases:
+            return None
+        top = self.canvas.canvasy(0)
+        index = min(int(top // self.row_height), len(self.cases) - 1)
+        return case_key(self.cases[index]), top - index * self.row_height
+
+    def _restore_scroll_anchor(self, anchor):
+        total = len(self.cases) * self.row_height
+        if anchor is None or not total:
+            self.canvas.yview_moveto(0)
+            return
+        key, offset = anchor
+        index = self._positions.get(key)
+        if index is None:
+            # إبقاء موضع التمرير داخل حدود القائمة الجديدة
+            self.canvas.yview_moveto(self.canvas.yview()[0])
+        else:
+            self.canvas.yview_moveto((index * self.row_height + offset) / total)
+
+    def _update_scrollregion(self):
+        width = max(self.canvas.winfo_width(), 1)
+        height = max(len(self.cases) * self.row_height, 1)
+        self.canvas.configure(scrollregion=(0, 0, width, height))
+
+    def _on_view_changed(self, first, last):
+        self.scrollbar.set(first, last)
+        # تجميع عدة أحداث تمرير متتالية في رسم واحد
+        if self._render_job is None:
+            self._render_job = self.canvas.after_idle(self.render)
+
+    def _on_resize(self, event=None):
+        self._update_scrollregion()
+        for card in self._visible.values():
+            self.canvas.itemconfigure(card.item, width=self.canvas.winfo_width())
+        self.render()
+
+    def visible_range(self):
+        """أول وآخر ترتيب حالة يجب رسمها (مع هامش إضافي)"""
+        top = self.canvas.canvasy(0)
+        height = self.canvas.winfo_height()
+        first = max(0, int(top // self.row_height) - self.overscan)
+        last = min(len(self.cases), int((top + height) // self.row_height) + 1 + self.overscan)
+        return first, last
+
+    def render(self):
+        """رسم البطاقات الظاهرة فقط"""
+        self._render_job = None
+        first, last = self.visible_range()
+        for key in [k for k, card in self._visible.items() if card.index < first or card.index >= last]:
+            self._release(key)
+        for index in range(first, last):
+            if case_key(self.cases[index]) not in self._visible:
+                self._materialize(index)
+
+    def _place(self, card, index):
+        self.canvas.coords(card.item, 0, index * self.row_height)
+
+    def _materialize(self, index):
+        card = self._pool.pop() if self._pool else self._new_card()
+        self._place(card, index)
+        self.canvas.itemconfigure(card.item, state='normal', width=self.canvas.winfo_width())
+        card.show(self.cases[index], index, index == self.selected_index)
+        self._visible[case_key(self.cases[index])] = card
+
+    def _release(self, key):
+        card = self._visible.pop(key)
+        self.canvas.itemconfigure(card.item, state='hidden')
+        self._pool.append(card)
+
+    def _new_card(self):
+        card = CaseCard(self.canvas, self._on_card_click)
+        card.item = self.canvas.create_window(0, 0, window=card.frame, anchor='nw',
+                                              width=self.canvas.winfo_width(), height=self.card_height)
+        return card
+
+    def _on_card_click(self, index):
+        if index is not None and index < len(self.cases):
+            self.on_select(index)
+
+    def set_selected(self, index, scroll=True):
+        """تمييز الحالة المحددة وتمريرها إلى مجال العرض"""
+        previous = self._visible.get(self.selected_key)
+        if previous:
+            previous.set_selected(False)
+        if index is None or not 0 <= index < len(self.cases):
+            self.selected_index = self.selected_key = None
+            return
+        self.selected_index = index
+        self.selected_key = case_key(self.cases[index])
+        current = self._visible.get(self.selected_key)
+        if current:
+            current.set_selected(True)
+        if scroll and index is not None:
+            self.see(index)
+
+    def see(self, index):
+        """تمرير القائمة بحيث تظهر الحالة المحددة"""
+        if not self.cases:
+            return
+        total = len(self.cases) * self.row_height
+        top = self.canvas.canvasy(0)
+        height = self.canvas.winfo_height()
+        y = index * self.row_height
+        if y < top:
+            self.canvas.yview_moveto(y / total)
+        elif y + self.row_height > top + height:
+            self.canvas.yview_moveto(max(0, y + self.row_height - height) / total)
+
+    @property
+    def widget_count(self):
+        """عدد البطاقات المنشأة فعلياً (الظاهرة + المخزنة)"""
+        return len(self._visible) + len(self._pool)
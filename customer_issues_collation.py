@@ -0,0 +1,58 @@
+import re
+import sys
+
+# الحركات (التشكيل) والألف الخنجرية والتطويل لا تؤثر على الترتيب
+ARABIC_IGNORED_CHARACTERS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+
+# توحيد أشكال الحروف المتشابهة قبل المقارنة
+ARABIC_LETTER_FORMS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه', 'ى': 'ي', 'ؤ': 'و', 'ئ': 'ي',
+    'ک': 'ك', 'ی': 'ي', 'ھ': 'ه'
+})
+
+# اسم الترتيب المسجل في SQLite
+ARABIC_COLLATION = 'ARABIC'
+
+
+def arabic_sort_key(text):
+    """مفتاح ترتيب النص العربي (بدون تشكيل مع توحيد الهمزات والتاء المربوطة والألف المقصورة)
+
+    الحروف العربية الأساسية مرتبة في Unicode بنفس الترتيب الأبجدي المعتاد
+    (ء ا ب ت ... ن ه و ي) بعد التوحيد، لذلك يكفي مقارنة النص الموحد.
+    """
+    if text is None:
+        return ''
+    text = ARABIC_IGNORED_CHARACTERS.sub('', str(text))
+    return ' '.join(text.translate(ARABIC_LETTER_FORMS).casefold().split())
+
+
+def arabic_collation(first, second):
+    """دالة المقارنة المسجلة في SQLite باسم ARABIC"""
+    first_key = arabic_sort_key(first)
+    second_key = arabic_sort_key(second)
+    return (first_key > second_key) - (first_key < second_key)
+
+
+# أوامر الصيانة التي تحتاج تسجيل ترتيب ARABIC (أدوات sqlite الخارجية تفشل فيها)
+MAINTENANCE_COMMANDS = {
+    'reindex': f"REINDEX {ARABIC_COLLATION}",
+    'vacuum': "VACUUM",
+    'check': "PRAGMA integrity_check"
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in MAINTENANCE_COMMANDS:
+        print("الاستخدام: python customer_issues_collation.py reindex|vacuum|check")
+        sys.exit(1)
+    from customer_issues_database import enhanced_db
+    statement = MAINTENANCE_COMMANDS[sys.argv[1]]
+    for connect in enhanced_db.data_connections():
+        conn = connect()
+        try:
+            rows = conn.execute(statement).fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+        print(f"{statement}: {', '.join(str(row[0]) for row in rows) if rows else 'تم'}")
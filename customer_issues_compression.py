@@ -0,0 +1,226 @@
+import sys
+import lzma
+import time
+import zlib
+import threading
+
+# البايت الأول يحدد طريقة الضغط، لذلك تتعايش الصفوف المضغوطة (BLOB)
+# مع الصفوف القديمة غير المضغوطة (TEXT) في نفس العمود
+MARKER_ZLIB = b'\x01'
+MARKER_LZMA = b'\x02'
+COMPRESSION_MARKERS = {'zlib': MARKER_ZLIB, 'lzma': MARKER_LZMA}
+
+# الأعمدة النصية الطويلة القابلة للضغط
+COMPRESSED_COLUMNS = {
+    'cases': ('problem_description', 'actions_taken'),
+    'correspondences': ('message_content',),
+    'audit_log': ('old_values', 'new_values')
+}
+
+# النصوص الأقصر من هذا الحد لا تستفيد من الضغط
+MIN_COMPRESS_BYTES = 256
+
+
+def is_compressed(value):
+    """هل القيمة نص مضغوط بعلامة معروفة"""
+    return isinstance(value, (bytes, memoryview)) and bytes(value[:1]) in (MARKER_ZLIB, MARKER_LZMA)
+
+
+def compress_text(text, method='zlib', min_bytes=MIN_COMPRESS_BYTES):
+    """ضغط النص إذا كان طويلاً بما يكفي وكان الضغط مفيداً، وإلا إرجاعه كما هو"""
+    if not method or not isinstance(text, str) or not text:
+        return text
+    raw = text.encode('utf-8')
+    if len(raw) < min_bytes:
+        return text
+    if method == 'lzma':
+        data = MARKER_LZMA + lzma.compress(raw)
+    else:
+        data = MARKER_ZLIB + zlib.compress(raw, 9)
+    return data if len(data) < len(raw) else text
+
+
+def decompress_text(value):
+    """فك ضغط القيمة المخزنة (النصوص غير المضغوطة تُرجع كما هي)"""
+    if isinstance(value, LazyText):
+        return str(value)
+    if not is_compressed(value):
+        if isinstance(value, (bytes, memoryview)):
+            return bytes(value).decode('utf-8', errors='replace')
+        return value
+    data = bytes(value)
+    if data[:1] == MARKER_LZMA:
+        return lzma.decompress(data[1:]).decode('utf-8')
+    return zlib.decompress(data[1:]).decode('utf-8')
+
+
+def _decompress_prefix(data, max_bytes):
+    """فك ضغط بداية النص فقط (للمعاينة)"""
+    if data[:1] == MARKER_LZMA:
+        return lzma.LZMADecompressor().decompress(data[1:], max_length=max_bytes)
+    return zlib.decompressobj().decompress(data[1:], max_bytes)
+
+
+class LazyText:
+    """نص مضغوط لا يتم فك ضغطه إلا عند عرضه كاملاً"""
+
+    __slots__ = ('_data', '_text')
+
+    def __init__(self, data):
+        self._data = bytes(data)
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = decompress_text(self._data)
+        return self._text
+
+    def __len__(self):
+        return len(str(self))
+
+    def __bool__(self):
+        return True
+
+    def __getitem__(self, key):
+        return str(self)[key]
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __repr__(self):
+        return f"LazyText({len(self._data)} bytes)"
+
+    @property
+    def stored_size(self):
+        """حجم القيمة المضغوطة"""
+        return len(self._data)
+
+    def preview(self, length):
+        """أول length حرف (مع حرف إضافي لمعرفة إن كان النص أطول) بفك جزئي"""
+        if self._text is not None:
+            return self._text[:length + 1]
+        # الحرف العربي يشغل بايتين في UTF-8، نأخذ هامشاً كافياً
+        prefix = _decompress_prefix(self._data, (length + 1) * 4)
+        return prefix.decode('utf-8', errors='ignore')[:length + 1]
+
+
+def lazy_value(value):
+    """تغليف القيمة المضغوطة بنص كسول"""
+    return LazyText(value) if is_compressed(value) else value
+
+
+def lazy_row(row, indexes):
+    """تغليف الأعمدة المضغوطة في صف نتيجة"""
+    if row is None:
+        return None
+    row = list(row)
+    for index in indexes:
+        if index < len(row):
+            row[index] = lazy_value(row[index])
+    return tuple(row)
+
+
+def text_preview(value, length=50, suffix='...'):
+    """معاينة مختصرة للنص دون فك ضغط النص كاملاً"""
+    if value is None:
+        return ''
+    if isinstance(value, LazyText):
+        text = value.preview(length)
+    else:
+        text = str(value)
+    return text[:length] + suffix if len(text) > length else text
+
+
+class TextRecompressionJob:
+    """مهمة خلفية لإعادة ضغط الصفوف الموجودة بالطريقة المحددة
+
+    تعمل على دفعات صغيرة مع حفظ كل دفعة حتى لا تحجز قاعدة البيانات طويلاً،
+    ويمكن إيقافها واستئنافها لاحقاً (الصفوف المعالجة لا تتغير مرة أخرى).
+    method=None يعني فك ضغط جميع الصفوف.
+    """
+
+    def __init__(self, connection_factories, method='zlib', batch_size=200, pause=0.05):
+        self.connection_factories = connection_factories
+        self.method = method
+        self.batch_size = batch_size
+        self.pause = pause
+        self.rows_scanned = 0
+        self.rows_rewritten = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """تشغيل المهمة في خيط خلفي"""
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """طلب إيقاف المهمة بعد الدفعة الحالية"""
+        self._stop_event.set()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _target_value(self, value):
+        """القيمة الجديدة للعمود حسب طريقة الضغط المطلوبة"""
+        text = decompress_text(value)
+        if self.method:
+            return compress_text(text, self.method)
+        return text
+
+    def run(self):
+        """معالجة جميع الجداول والأعمدة القابلة للضغط"""
+        try:
+            for factory in self.connection_factories:
+                for table, columns in COMPRESSED_COLUMNS.items():
+                    for column in columns:
+                        if self._stop_event.is_set():
+                            return
+                        self._process_column(factory, table, column)
+        except Exception as e:
+            self.error = str(e)
+            print(f"خطأ في إعادة ضغط النصوص: {e}")
+
+    def _process_column(self, factory, table, column):
+        last_id = 0
+        while not self._stop_event.is_set():
+            conn = factory()
+            try:
+                rows = conn.execute(
+                    f"SELECT id, {column} FROM {table} WHERE id > ? AND {column} IS NOT NULL ORDER BY id LIMIT ?",
+                    (last_id, self.batch_size)
+                ).fetchall()
+                if not rows:
+                    return
+                for row_id, value in rows:
+                    self.rows_scanned += 1
+                    new_value = self._target_value(value)
+                    if new_value != value:
+                        self.bytes_before += len(value) if isinstance(value, bytes) else len(value.encode('utf-8'))
+                        self.bytes_after += len(new_value) if isinstance(new_value, bytes) else len(new_value.encode('utf-8'))
+                        conn.execute(f"UPDATE {table} SET {column} = ? WHERE id = ?", (new_value, row_id))
+                        self.rows_rewritten += 1
+                conn.commit()
+                last_id = rows[-1][0]
+            finally:
+                conn.close()
+            time.sleep(self.pause)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "recompress":
+        print("الاستخدام: python customer_issues_compression.py recompress [zlib|lzma|none]")
+        sys.exit(1)
+    from customer_issues_database import enhanced_db
+    target = sys.argv[2] if len(sys.argv) > 2 else 'zlib'
+    job = TextRecompressionJob(enhanced_db.data_connections(), None if target == 'none' else target)
+    job.start().join()
+    print(f"تم فحص {job.rows_scanned} صف وإعادة كتابة {job.rows_rewritten} صف")
+    print(f"الحجم قبل: {job.bytes_before} بايت - بعد: {job.bytes_after} بايت")
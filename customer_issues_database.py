@@ -1,19 +1,74 @@
 import sqlite3
 import os
+import json
 from datetime import datetime
+from customer_issues_compression import compress_text, decompress_text, lazy_row
+from customer_issues_filters import CaseFilter
+from customer_issues_collation import ARABIC_COLLATION, arabic_collation
+from customer_issues_query_guard import guard_connection, is_interrupted
+
+def open_connection(db_path):
+    """فتح اتصال بقاعدة البيانات مع تسجيل الدوال المساعدة"""
+    conn = sqlite3.connect(db_path)
+    # ci_text تفك ضغط الأعمدة النصية المضغوطة داخل استعلامات البحث
+    conn.create_function('ci_text', 1, decompress_text)
+    # ترتيب الأسماء العربية (الفهارس المرتبة بـ COLLATE ARABIC تحتاجه في كل اتصال)
+    conn.create_collation(ARABIC_COLLATION, arabic_collation)
+    # البحث الملغى من الواجهة يوقف الاستعلام الجاري (انظر cancellable_queries)
+    return guard_connection(conn)
+
+# إصدار مخطط قاعدة البيانات (PRAGMA user_version): يُرفع عند أي تغيير في الجداول
+# أو الفهارس أو المشغلات حتى تُعاد التهيئة الكاملة مرة واحدة عند التحديث
+SCHEMA_VERSION = 4
+
+def schema_is_current(cursor):
+    """هل الملف مهيأ بالفعل بالإصدار الحالي من المخطط"""
+    return cursor.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION
+
+def mark_schema_current(cursor):
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+ARABIC_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹', '01234567890123456789')
+
+def normalize_subscriber_number(subscriber_number):
+    """توحيد رقم المشترك (إزالة المسافات والشرطات وتحويل الأرقام العربية)"""
+    if subscriber_number is None:
+        return ''
+    value = str(subscriber_number).translate(ARABIC_DIGITS)
+    return ''.join(value.split()).replace('-', '')
+
+# حالات الشكوى المغلقة (لا يُتوقع إضافة مرفقات لها)
+CLOSED_STATUSES = ('تم حلها', 'مغلقة')
+
+def file_stat(file_path):
+    """(الحجم، وقت التعديل) للملف أو (None, None) إذا لم يكن موجوداً"""
+    try:
+        stat = os.stat(file_path)
+    except (OSError, TypeError, ValueError):
+        return None, None
+    return stat.st_size, stat.st_mtime
 
 class DatabaseManager:
     def delete_case(self, case_id):
         """حذف حالة وجميع بياناتها المرتبطة (المرفقات، المراسلات، سجل التعديلات)"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self.get_connection()
         cursor = conn.cursor()
         try:
             # حذف سجل التعديلات
             cursor.execute("DELETE FROM audit_log WHERE case_id = ?", (case_id,))
-            # حذف المرفقات
+            # حذف المرفقات (مع إنقاص عدد مراجع ملفات المحتوى)
+            cursor.execute('''
+                UPDATE attachment_blobs SET ref_count = ref_count - (
+                    SELECT COUNT(*) FROM attachments a
+                    WHERE a.case_id = ? AND a.blob_hash = attachment_blobs.sha256
+                )
+                WHERE sha256 IN (SELECT blob_hash FROM attachments WHERE case_id = ?)
+            ''', (case_id, case_id))
             cursor.execute("DELETE FROM attachments WHERE case_id = ?", (case_id,))
             # حذف المراسلات
             cursor.execute("DELETE FROM correspondences WHERE case_id = ?", (case_id,))
+            # حذف بيانات أرشيف المرفقات (ملف الأرشيف نفسه تحذفه الواجهة)
+            cursor.execute("DELETE FROM case_archives WHERE case_id = ?", (case_id,))
             # حذف الحالة نفسها
             cursor.execute("DELETE FROM cases WHERE id = ?", (case_id,))
             conn.commit()
@@ -24,15 +79,36 @@ class DatabaseManager:
             return False
         finally:
             conn.close()
-    def __init__(self, db_name="customer_issues_enhanced.db"):
+    def __init__(self, db_name="customer_issues_enhanced.db", text_compression=None):
         self.db_name = db_name
+        # طريقة ضغط النصوص الطويلة عند الكتابة: None أو 'zlib' أو 'lzma'
+        self.text_compression = text_compression
         self.init_database()
     
     def init_database(self):
         """إنشاء قاعدة البيانات والجداول المحسنة"""
-        conn = sqlite3.connect(self.db_name)
+        conn = open_connection(self.db_name)
         cursor = conn.cursor()
         
+        # المسار السريع: الملف مهيأ مسبقاً فلا داعي لإعادة إنشاء الجداول والترحيل
+        if schema_is_current(cursor):
+            self.detect_trigram_index(cursor)
+            conn.close()
+            return
+        
+        self.create_global_tables(cursor)
+        self.create_case_tables(cursor)
+        self.seed_reference_data(cursor)
+        mark_schema_current(cursor)
+        
+        conn.commit()
+        conn.close()
+        
+        # ربط الحالات القديمة بجدول المشتركين
+        self.migrate_subscribers()
+    
+    def create_global_tables(self, cursor):
+        """إنشاء الجداول المرجعية المشتركة (الموظفين والتصنيفات)"""
         # جدول الموظفين
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS employees (
@@ -54,6 +130,32 @@ class DatabaseManager:
             )
         ''')
         
+        # جدول المشتركين (رقم مشترك فريد لكل عميل)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS subscribers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                subscriber_number TEXT UNIQUE NOT NULL,
+                customer_name TEXT,
+                phone TEXT,
+                address TEXT,
+                created_date TEXT,
+                modified_date TEXT
+            )
+        ''')
+        
+        # مخزن المرفقات حسب المحتوى: ملف واحد لكل بصمة SHA-256 مهما تكرر إرفاقه
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attachment_blobs (
+                sha256 TEXT PRIMARY KEY,
+                blob_path TEXT NOT NULL,
+                size INTEGER,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                created_date TEXT
+            )
+        ''')
+    
+    def create_case_tables(self, cursor):
+        """إنشاء جداول الحالات والمراسلات والمرفقات وسجل التعديلات"""
         # جدول الحالات المحسن
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS cases (
@@ -75,12 +177,24 @@ class DatabaseManager:
                 modified_by INTEGER,
                 solved_by INTEGER,
                 solved_date TEXT,
+                subscriber_id INTEGER,
                 FOREIGN KEY (category_id) REFERENCES issue_categories (id),
                 FOREIGN KEY (created_by) REFERENCES employees (id),
                 FOREIGN KEY (modified_by) REFERENCES employees (id),
-                FOREIGN KEY (solved_by) REFERENCES employees (id)
+                FOREIGN KEY (solved_by) REFERENCES employees (id),
+                FOREIGN KEY (subscriber_id) REFERENCES subscribers (id)
             )
         ''')
+        # قواعد البيانات القديمة لا تحتوي على عمود المشترك
+        self.ensure_column(cursor, 'cases', 'subscriber_id', 'INTEGER')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cases_subscriber_id ON cases (subscriber_id)")
+        # فهارس أعمدة الفلترة والترتيب في CaseFilter
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cases_created_date ON cases (created_date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cases_status ON cases (status)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cases_category_id ON cases (category_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cases_modified_by ON cases (modified_by)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cases_modified_created ON cases (modified_date, created_date)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_cases_customer_name ON cases (customer_name COLLATE {ARABIC_COLLATION}, id)")
         
         # جدول المراسلات المحسن
         cursor.execute('''
@@ -110,10 +224,19 @@ class DatabaseManager:
                 description TEXT,
                 upload_date TEXT,
                 uploaded_by INTEGER,
+                blob_hash TEXT,
                 FOREIGN KEY (case_id) REFERENCES cases (id),
                 FOREIGN KEY (uploaded_by) REFERENCES employees (id)
             )
         ''')
+        # بصمة محتوى المرفق في attachment_blobs (فارغة للملفات المرتبطة من خارج النظام)
+        self.ensure_column(cursor, 'attachments', 'blob_hash', 'TEXT')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_attachments_blob_hash ON attachments (blob_hash)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_attachments_case_id ON attachments (case_id)")
+        # اسم ملف المرفق داخل أرشيف الحالة المضغوط (فارغ للمرفقات غير المؤرشفة)
+        self.ensure_column(cursor, 'attachments', 'archive_member', 'TEXT')
+        self.create_storage_index(cursor)
+        self.create_case_archives(cursor)
         
         # جدول سجل التعديلات المحسن
         cursor.execute('''
@@ -130,7 +253,148 @@ class DatabaseManager:
                 FOREIGN KEY (performed_by) REFERENCES employees (id)
             )
         ''')
-        
+        # الفهارس والمشغلات تحتاج إلى وجود جميع جداول الحالات
+        self.create_trigram_index(cursor)
+        self.create_change_feed(cursor)
+    
+    def create_trigram_index(self, cursor):
+        """فهرس ثلاثيات الأحرف (FTS5 trigram) لرقم المشترك والهاتف للبحث بجزء من الرقم
+
+        يُحدَّث الفهرس تلقائياً بالمشغلات. إذا كانت نسخة SQLite لا تدعم FTS5 trigram
+        يستمر البحث بـ LIKE كما كان.
+        """
+        existed = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'cases_trigram'").fetchone()
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS cases_trigram USING fts5(
+                    subscriber_number, phone,
+                    content='cases', content_rowid='id', tokenize='trigram'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            print(f"فهرس البحث الجزئي غير متاح: {e}")
+            self.trigram_available = False
+            return
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS cases_trigram_ai AFTER INSERT ON cases BEGIN
+                INSERT INTO cases_trigram (rowid, subscriber_number, phone)
+                VALUES (new.id, new.subscriber_number, new.phone);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS cases_trigram_ad AFTER DELETE ON cases BEGIN
+                INSERT INTO cases_trigram (cases_trigram, rowid, subscriber_number, phone)
+                VALUES ('delete', old.id, old.subscriber_number, old.phone);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS cases_trigram_au AFTER UPDATE OF subscriber_number, phone ON cases BEGIN
+                INSERT INTO cases_trigram (cases_trigram, rowid, subscriber_number, phone)
+                VALUES ('delete', old.id, old.subscriber_number, old.phone);
+                INSERT INTO cases_trigram (rowid, subscriber_number, phone)
+                VALUES (new.id, new.subscriber_number, new.phone);
+            END
+        ''')
+        if not existed:
+            # بناء الفهرس للحالات الموجودة مسبقاً
+            cursor.execute("INSERT INTO cases_trigram (cases_trigram) VALUES ('rebuild')")
+        self.trigram_available = True
+    
+    def detect_trigram_index(self, cursor):
+        """تحديد توفر فهرس البحث الجزئي في ملف مهيأ مسبقاً"""
+        self.trigram_available = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'cases_trigram'").fetchone() is not None
+    
+    def create_change_feed(self, cursor):
+        """سجل تغييرات تملؤه المشغلات لكل إضافة أو تعديل أو حذف في جداول الحالات
+
+        يُستخدم رقم آخر تغيير كإصدار للبيانات لإبطال الذاكرة المؤقتة وتحديث الواجهة
+        بالحالات المتغيرة فقط، ويشمل التغييرات من أي اتصال أو جهاز آخر.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_feed (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id INTEGER,
+                case_id INTEGER,
+                operation TEXT NOT NULL,
+                changed_at TEXT DEFAULT (datetime('now', 'localtime'))
+            )
+        ''')
+        case_id_columns = {'cases': 'id', 'correspondences': 'case_id', 'attachments': 'case_id', 'audit_log': 'case_id'}
+        for table, case_column in case_id_columns.items():
+            for operation, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_change_{operation.lower()} AFTER {operation} ON {table} BEGIN
+                        INSERT INTO change_feed (table_name, row_id, case_id, operation)
+                        VALUES ('{table}', {row}.id, {row}.{case_column}, '{operation}');
+                    END
+                ''')
+    
+    def create_storage_index(self, cursor):
+        """فهرس التخزين: حجم ملف كل مرفق ووقت تعديله وبصمته
+
+        يُحدّث عند إضافة المرفقات، وتحذف المشغلات صف المرفق المحذوف، ويصحح
+        customer_issues_storage_index أي اختلاف عن الملفات الفعلية في الخلفية.
+        إحصائيات المساحة تُحسب منه بدلاً من المرور على جميع الملفات.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS storage_index (
+                attachment_id INTEGER PRIMARY KEY,
+                case_id INTEGER,
+                size INTEGER,
+                mtime REAL,
+                sha256 TEXT,
+                missing INTEGER DEFAULT 0,
+                checked_date TEXT
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_storage_index_case_id ON storage_index (case_id)")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS storage_index_attachment_delete AFTER DELETE ON attachments BEGIN
+                DELETE FROM storage_index WHERE attachment_id = old.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS storage_index_attachment_update AFTER UPDATE OF case_id, blob_hash ON attachments BEGIN
+                UPDATE storage_index SET case_id = new.case_id, sha256 = COALESCE(new.blob_hash, sha256)
+                WHERE attachment_id = new.id;
+            END
+        ''')
+
+    def create_case_archives(self, cursor):
+        """أرشيفات الحالات المغلقة: ملف مضغوط واحد لمرفقات كل حالة والمساحة الموفرة"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS case_archives (
+                case_id INTEGER PRIMARY KEY,
+                archive_path TEXT NOT NULL,
+                method TEXT,
+                files INTEGER,
+                original_bytes INTEGER,
+                archive_bytes INTEGER,
+                reclaimed_bytes INTEGER DEFAULT 0,
+                archived_date TEXT
+            )
+        ''')
+
+    def trigram_filter(self, column, search_value):
+        """شرط البحث الجزئي في عمود مفهرس (من الفهرس إن أمكن، وإلا LIKE)"""
+        value = search_value.strip()
+        # الفهرس الثلاثي يحتاج ثلاثة أحرف على الأقل
+        if getattr(self, 'trigram_available', False) and len(value) >= 3:
+            phrase = '"' + value.replace('"', '""') + '"'
+            return ("c.id IN (SELECT rowid FROM cases_trigram WHERE cases_trigram MATCH ?)",
+                    (f"{column} : {phrase}",))
+        return f"c.{column} LIKE ?", (f"%{value}%",)
+    
+    def ensure_column(self, cursor, table, column, declaration):
+        """إضافة عمود إلى جدول موجود إذا لم يكن موجوداً"""
+        columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    
+    def seed_reference_data(self, cursor):
+        """إدخال الموظفين والتصنيفات الافتراضية"""
         # إدخال الموظفين الافتراضيين
         default_employees = [
             ('مدير النظام', 'مدير'),
@@ -166,17 +430,29 @@ class DatabaseManager:
                 INSERT OR IGNORE INTO issue_categories (category_name, description, color_code)
                 VALUES (?, ?, ?)
             ''', (cat_name, description, color))
-        
-        conn.commit()
-        conn.close()
     
     def get_connection(self):
         """الحصول على اتصال بقاعدة البيانات"""
-        return sqlite3.connect(self.db_name)
+        return open_connection(self.db_name)
+    
+    def data_connections(self):
+        """دوال فتح الاتصال بكل ملف يحتوي على بيانات الحالات"""
+        return [self.get_connection]
+
+    def database_files(self):
+        """مسارات جميع ملفات قاعدة البيانات (للنسخ الاحتياطي)"""
+        return [self.db_name]
+    
+    def compress(self, text):
+        """ضغط النص الطويل حسب إعداد الضغط"""
+        return compress_text(text, self.text_compression) if self.text_compression else text
     
     def execute_query(self, query, params=None):
         """تنفيذ استعلام قاعدة بيانات"""
-        conn = self.get_connection()
+        return self.run_on_connection(self.get_connection(), query, params)
+    
+    def run_on_connection(self, conn, query, params=None):
+        """تنفيذ استعلام على اتصال محدد ثم إغلاقه"""
         cursor = conn.cursor()
         
         try:
@@ -189,7 +465,8 @@ class DatabaseManager:
             conn.commit()
             return result
         except Exception as e:
-            print(f"خطأ في قاعدة البيانات: {e}")
+            if not is_interrupted(e):
+                print(f"خطأ في قاعدة البيانات: {e}")
             return []
         finally:
             conn.close()
@@ -247,107 +524,52 @@ class DatabaseManager:
             """
             return self.execute_query(query)
     
-    def search_cases(self, search_field, search_value):
+    def get_case_years(self):
+        """الحصول على سنوات الحالات المتاحة (تنازلياً)"""
+        query = "SELECT DISTINCT strftime('%Y', created_date) as year FROM cases ORDER BY year DESC"
+        return [row[0] for row in self.execute_query(query) if row[0]]
+    
+    def search_cases(self, search_field, search_value, limit=None, offset=0):
         """البحث في الحالات (دائماً يرجع قائمة dicts)"""
         columns = ['id', 'customer_name', 'subscriber_number', 'status', 'category_name', 'color_code', 'modified_by_name', 'created_date', 'modified_date']
-        if search_field == "شامل":
-            query = """
-                SELECT DISTINCT c.id, c.customer_name, c.subscriber_number, c.status, 
-                       ic.category_name, ic.color_code, e.name as modified_by_name,
-                       c.created_date, c.modified_date
-                FROM cases c
-                LEFT JOIN issue_categories ic ON c.category_id = ic.id
-                LEFT JOIN employees e ON c.modified_by = e.id
-                LEFT JOIN correspondences co ON c.id = co.case_id
-                LEFT JOIN attachments a ON c.id = a.case_id
-                WHERE c.customer_name LIKE ? OR c.subscriber_number LIKE ? 
-                   OR c.address LIKE ? OR c.problem_description LIKE ?
-                   OR c.actions_taken LIKE ? OR co.message_content LIKE ?
-                   OR a.description LIKE ?
-                ORDER BY c.modified_date DESC, c.created_date DESC
-            """
-            search_pattern = f"%{search_value}%"
-            rows = self.execute_query(query, (search_pattern,) * 7)
-        elif search_field == "اسم العميل":
-            query = """
-                SELECT c.id, c.customer_name, c.subscriber_number, c.status, 
-                       ic.category_name, ic.color_code, e.name as modified_by_name,
-                       c.created_date, c.modified_date
-                FROM cases c
-                LEFT JOIN issue_categories ic ON c.category_id = ic.id
-                LEFT JOIN employees e ON c.modified_by = e.id
-                WHERE c.customer_name LIKE ?
-                ORDER BY c.modified_date DESC, c.created_date DESC
-            """
-            rows = self.execute_query(query, (f"%{search_value}%",))
-        elif search_field == "رقم المشترك":
-            query = """
-                SELECT c.id, c.customer_name, c.subscriber_number, c.status, 
-                       ic.category_name, ic.color_code, e.name as modified_by_name,
-                       c.created_date, c.modified_date
-                FROM cases c
-                LEFT JOIN issue_categories ic ON c.category_id = ic.id
-                LEFT JOIN employees e ON c.modified_by = e.id
-                WHERE c.subscriber_number LIKE ?
-                ORDER BY c.modified_date DESC, c.created_date DESC
-            """
-            rows = self.execute_query(query, (f"%{search_value}%",))
-        elif search_field == "العنوان":
-            query = """
-                SELECT c.id, c.customer_name, c.subscriber_number, c.status, 
-                       ic.category_name, ic.color_code, e.name as modified_by_name,
-                       c.created_date, c.modified_date
-                FROM cases c
-                LEFT JOIN issue_categories ic ON c.category_id = ic.id
-                LEFT JOIN employees e ON c.modified_by = e.id
-                WHERE c.address LIKE ?
-                ORDER BY c.modified_date DESC, c.created_date DESC
-            """
-            rows = self.execute_query(query, (f"%{search_value}%",))
-        elif search_field == "تصنيف المشكلة":
-            query = """
-                SELECT c.id, c.customer_name, c.subscriber_number, c.status, 
-                       ic.category_name, ic.color_code, e.name as modified_by_name,
-                       c.created_date, c.modified_date
-                FROM cases c
-                LEFT JOIN issue_categories ic ON c.category_id = ic.id
-                LEFT JOIN employees e ON c.modified_by = e.id
-                WHERE ic.category_name = ?
-                ORDER BY c.modified_date DESC, c.created_date DESC
-            """
-            rows = self.execute_query(query, (search_value,))
-        elif search_field == "حالة المشكلة":
-            query = """
-                SELECT c.id, c.customer_name, c.subscriber_number, c.status, 
-                       ic.category_name, ic.color_code, e.name as modified_by_name,
-                       c.created_date, c.modified_date
-                FROM cases c
-                LEFT JOIN issue_categories ic ON c.category_id = ic.id
-                LEFT JOIN employees e ON c.modified_by = e.id
-                WHERE c.status = ?
-                ORDER BY c.modified_date DESC, c.created_date DESC
-            """
-            rows = self.execute_query(query, (search_value,))
-        elif search_field == "اسم الموظف":
-            query = """
-                SELECT c.id, c.customer_name, c.subscriber_number, c.status, 
-                       ic.category_name, ic.color_code, e.name as modified_by_name,
-                       c.created_date, c.modified_date
-                FROM cases c
-                LEFT JOIN issue_categories ic ON c.category_id = ic.id
-                LEFT JOIN employees e ON c.modified_by = e.id
-                WHERE e.name = ?
-                ORDER BY c.modified_date DESC, c.created_date DESC
-            """
-            rows = self.execute_query(query, (search_value,))
-        else:
-            rows = []
+        search_query = self.build_search_query(search_field, search_value, limit, offset)
+        if not search_query:
+            return []
+        query, params = search_query
+        rows = self.execute_query(query, params)
         return [dict(zip(columns, row)) for row in rows]
     
+    def build_search_query(self, search_field, search_value, limit=None, offset=0):
+        """بناء استعلام البحث ومعاملاته حسب نوع البحث (بدون تنفيذه)"""
+        case_filter = CaseFilter(search_type=search_field, search_text=search_value, limit=limit, offset=offset)
+        return case_filter.compile(self)
+
+    def query_cases(self, case_filter):
+        """الحالات المطابقة لفلتر CaseFilter (قائمة dicts)"""
+        columns = ['id', 'customer_name', 'subscriber_number', 'status', 'category_name', 'color_code', 'modified_by_name', 'created_date', 'modified_date']
+        compiled = case_filter.compile(self)
+        if not compiled:
+            return []
+        query, params = compiled
+        return [dict(zip(columns, row)) for row in self.execute_query(query, params)]
+    
+    def count_cases(self, case_filter):
+        """عدد الحالات المطابقة لفلتر CaseFilter"""
+        compiled = case_filter.compile_count(self)
+        if not compiled:
+            return 0
+        query, params = compiled
+        result = self.execute_query(query, params)
+        return result[0][0] if result else 0
+    
     def get_case_details(self, case_id):
         """الحصول على تفاصيل حالة محددة"""
+        # الأعمدة محددة صراحة حتى لا تتغير الفهارس عند إضافة أعمدة جديدة للجدول
         query = """
-            SELECT c.*, ic.category_name, ic.color_code,
+            SELECT c.id, c.customer_name, c.subscriber_number, c.phone, c.address, c.category_id, c.status,
+                   c.problem_description, c.actions_taken, c.last_meter_reading, c.last_reading_date,
+                   c.debt_amount, c.created_date, c.created_by, c.modified_date, c.modified_by,
+                   c.solved_by, c.solved_date, ic.category_name, ic.color_code,
                    creator.name as created_by_name,
                    modifier.name as modified_by_name,
                    solver.name as solved_by_name
@@ -359,7 +581,8 @@ class DatabaseManager:
             WHERE c.id = ?
         """
         result = self.execute_query(query, (case_id,))
-        return result[0] if result else None
+        # problem_description و actions_taken قد تكون مضغوطة
+        return lazy_row(result[0], (7, 8)) if result else None
     
     def get_case_correspondences(self, case_id):
         """الحصول على مراسلات الحالة"""
@@ -370,14 +593,15 @@ class DatabaseManager:
             WHERE co.case_id = ?
             ORDER BY co.sent_date DESC
         """
-        return self.execute_query(query, (case_id,))
+        return [lazy_row(row, (5,)) for row in self.execute_query(query, (case_id,))]
     
     def get_case_attachments(self, case_id):
         """الحصول على مرفقات الحالة مع تحديد الأعمدة بشكل صريح لتجنب الأخطاء."""
         query = """
             SELECT 
                 a.id, a.case_id, a.file_name, a.file_path, a.file_type, 
-                a.description, a.upload_date, a.uploaded_by, e.name as uploaded_by_name
+                a.description, a.upload_date, a.uploaded_by, e.name as uploaded_by_name, a.blob_hash,
+                a.archive_member
             FROM attachments a
             LEFT JOIN employees e ON a.uploaded_by = e.id
             WHERE a.case_id = ?
@@ -394,7 +618,7 @@ class DatabaseManager:
             WHERE al.case_id = ?
             ORDER BY al.timestamp DESC
         """
-        return self.execute_query(query, (case_id,))
+        return [lazy_row(row, (6, 7)) for row in self.execute_query(query, (case_id,))]
     
     def get_categories(self):
         """الحصول على تصنيفات المشاكل"""
@@ -437,16 +661,22 @@ class DatabaseManager:
             INSERT INTO audit_log (case_id, action_type, action_description, performed_by, timestamp, old_values, new_values)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         """
-        self.execute_query(query, (case_id, action_type, action_description, performed_by, timestamp, str(old_values) if old_values else None, str(new_values) if new_values else None))
+        self.execute_query(query, (case_id, action_type, action_description, performed_by, timestamp,
+                                   self.compress(str(old_values)) if old_values else None,
+                                   self.compress(str(new_values)) if new_values else None))
     
     def add_case(self, case_data):
-        """إضافة حالة جديدة"""
+        """إضافة حالة جديدة وإرجاع رقمها
+
+        المشترك يُضاف أو يُحدّث في نفس المعاملة، وأي خطأ يُرفع للمستدعي.
+        """
         query = '''
             INSERT INTO cases (
                 customer_name, subscriber_number, phone, address, category_id, status, 
                 problem_description, actions_taken, last_meter_reading, last_reading_date, 
-                debt_amount, created_date, created_by, modified_date, modified_by, solved_by, solved_date
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                debt_amount, created_date, created_by, modified_date, modified_by, solved_by, solved_date,
+                subscriber_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         '''
         params = (
             case_data.get('customer_name'),
@@ -455,8 +685,8 @@ class DatabaseManager:
             case_data.get('address'),
             case_data.get('category_id'),
             case_data.get('status', 'جديدة'),
-            case_data.get('problem_description'),
-            case_data.get('actions_taken'),
+            self.compress(case_data.get('problem_description')),
+            self.compress(case_data.get('actions_taken')),
             case_data.get('last_meter_reading'),
             case_data.get('last_reading_date'),
             case_data.get('debt_amount', 0),
@@ -467,15 +697,26 @@ class DatabaseManager:
             case_data.get('solved_by'),
             case_data.get('solved_date')
         )
-        self.execute_query(query, params)
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params + (self.ensure_subscriber(cursor, case_data),))
+            conn.commit()
+            return cursor.lastrowid
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
 
     def update_case(self, case_id, case_data):
-        """تحديث بيانات حالة"""
+        """تحديث بيانات حالة (مع المشترك في نفس المعاملة، وأي خطأ يُرفع للمستدعي)"""
         query = '''
             UPDATE cases SET
                 customer_name=?, subscriber_number=?, phone=?, address=?, category_id=?, status=?,
                 problem_description=?, actions_taken=?, last_meter_reading=?, last_reading_date=?,
-                debt_amount=?, modified_date=?, modified_by=?, solved_by=?, solved_date=?
+                debt_amount=?, modified_date=?, modified_by=?, solved_by=?, solved_date=?,
+                subscriber_id=?
             WHERE id=?
         '''
         params = (
@@ -485,36 +726,86 @@ class DatabaseManager:
             case_data.get('address'),
             case_data.get('category_id'),
             case_data.get('status'),
-            case_data.get('problem_description'),
-            case_data.get('actions_taken'),
+            self.compress(case_data.get('problem_description')),
+            self.compress(case_data.get('actions_taken')),
             case_data.get('last_meter_reading'),
             case_data.get('last_reading_date'),
             case_data.get('debt_amount'),
             case_data.get('modified_date'),
             case_data.get('modified_by'),
             case_data.get('solved_by'),
-            case_data.get('solved_date'),
-            case_id
+            case_data.get('solved_date')
         )
-        self.execute_query(query, params)
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params + (self.ensure_subscriber(cursor, case_data), case_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
 
     def add_attachment(self, attachment_data):
-        """إضافة مرفق جديد"""
-        query = '''
-            INSERT INTO attachments (
-                case_id, file_name, file_path, file_type, description, upload_date, uploaded_by
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        '''
-        params = (
-            attachment_data.get('case_id'),
-            attachment_data.get('file_name'),
-            attachment_data.get('file_path'),
-            attachment_data.get('file_type'),
-            attachment_data.get('description'),
-            attachment_data.get('upload_date'),
-            attachment_data.get('uploaded_by')
-        )
-        self.execute_query(query, params)
+        """إضافة مرفق جديد (وزيادة عدد مراجع ملف المحتوى إن وجد) وإرجاع رقمه"""
+        ids = DatabaseManager.add_attachments(self, [attachment_data])
+        return ids[0] if ids else None
+
+    def add_attachments(self, attachments, audit_entries=None):
+        """إضافة عدة مرفقات في معاملة واحدة وإرجاع أرقامها
+
+        عدد مراجع ملفات المحتوى يُحدّث في نفس المعاملة، وكذلك سجل التعديلات
+        audit_entries: [(case_id, action_type, action_description, performed_by), ...].
+        إذا فشل أي صف لا يُضاف شيء.
+        """
+        # قراءة أحجام الملفات قبل بدء المعاملة (لا عمليات قرص أثناء قفل الكتابة)
+        stats = [file_stat(attachment_data.get('file_path')) for attachment_data in attachments]
+        checked_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            ids = []
+            references = {}
+            for attachment_data, (size, mtime) in zip(attachments, stats):
+                cursor.execute('''
+                    INSERT INTO attachments (
+                        case_id, file_name, file_path, file_type, description, upload_date, uploaded_by, blob_hash
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    attachment_data.get('case_id'),
+                    attachment_data.get('file_name'),
+                    attachment_data.get('file_path'),
+                    attachment_data.get('file_type'),
+                    attachment_data.get('description'),
+                    attachment_data.get('upload_date'),
+                    attachment_data.get('uploaded_by'),
+                    attachment_data.get('blob_hash')
+                ))
+                ids.append(cursor.lastrowid)
+                cursor.execute('''
+                    INSERT OR REPLACE INTO storage_index (attachment_id, case_id, size, mtime, sha256, missing, checked_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (cursor.lastrowid, attachment_data.get('case_id'), size, mtime, attachment_data.get('blob_hash'),
+                      1 if size is None else 0, checked_date))
+                if attachment_data.get('blob_hash'):
+                    references[attachment_data['blob_hash']] = references.get(attachment_data['blob_hash'], 0) + 1
+            cursor.executemany("UPDATE attachment_blobs SET ref_count = ref_count + ? WHERE sha256 = ?",
+                               [(count, sha256) for sha256, count in references.items()])
+            if audit_entries:
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                cursor.executemany('''
+                    INSERT INTO audit_log (case_id, action_type, action_description, performed_by, timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [tuple(entry) + (timestamp,) for entry in audit_entries])
+            conn.commit()
+            return ids
+        except Exception as e:
+            conn.rollback()
+            print(f"خطأ في إضافة المرفقات: {e}")
+            return []
+        finally:
+            conn.close()
 
     def add_correspondence(self, correspondence_data):
         """إضافة مراسلة جديدة"""
@@ -528,13 +819,138 @@ class DatabaseManager:
             correspondence_data.get('case_sequence_number'),
             correspondence_data.get('yearly_sequence_number'),
             correspondence_data.get('sender'),
-            correspondence_data.get('message_content'),
+            self.compress(correspondence_data.get('message_content')),
             correspondence_data.get('sent_date'),
             correspondence_data.get('created_by'),
             correspondence_data.get('created_date')
         )
         self.execute_query(query, params)
 
+    def get_data_version(self):
+        """إصدار البيانات الحالي (رقم آخر تغيير في سجل التغييرات)"""
+        result = self.execute_query("SELECT seq FROM sqlite_sequence WHERE name = 'change_feed'")
+        return result[0][0] if result else 0
+
+    def get_changes_since(self, version):
+        """التغييرات بعد إصدار محدد: (قائمة التغييرات، الإصدار الجديد)
+
+        تُرجع None بدلاً من القائمة إذا كان الإصدار أقدم من السجل المحفوظ
+        (بعد التنظيف) ويلزم إعادة التحميل الكامل.
+        """
+        oldest = self.execute_query("SELECT MIN(id) FROM change_feed")
+        oldest_id = oldest[0][0] if oldest and oldest[0][0] is not None else None
+        current = self.get_data_version()
+        if oldest_id is not None and version < oldest_id - 1:
+            return None, current
+        rows = self.execute_query(
+            "SELECT id, table_name, row_id, case_id, operation FROM change_feed WHERE id > ? AND id <= ? ORDER BY id",
+            (version, current)
+        )
+        columns = ['id', 'table_name', 'row_id', 'case_id', 'operation']
+        return [dict(zip(columns, row)) for row in rows], current
+
+    def prune_change_feed(self, keep=10000):
+        """حذف التغييرات القديمة مع الاحتفاظ بآخر keep تغيير"""
+        self.execute_query("DELETE FROM change_feed WHERE id <= (SELECT seq FROM sqlite_sequence WHERE name = 'change_feed') - ?", (keep,))
+
+    def execute_query_parts(self, query, params=None):
+        """تنفيذ استعلام قراءة وإرجاع النتائج مجمعة حسب ملف البيانات"""
+        return [self.execute_query(query, params)]
+
+    def upsert_subscriber(self, cursor, subscriber_number, customer_name=None, phone=None, address=None, timestamp=None):
+        """إضافة مشترك أو تحديث بياناته وإرجاع رقمه"""
+        number = normalize_subscriber_number(subscriber_number)
+        if not number:
+            return None
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.execute(
+            "INSERT OR IGNORE INTO subscribers (subscriber_number, customer_name, phone, address, created_date, modified_date) VALUES (?, ?, ?, ?, ?, ?)",
+            (number, customer_name, phone, address, timestamp, timestamp)
+        )
+        cursor.execute('''
+            UPDATE subscribers SET
+                customer_name = COALESCE(NULLIF(?, ''), customer_name),
+                phone = COALESCE(NULLIF(?, ''), phone),
+                address = COALESCE(NULLIF(?, ''), address),
+                modified_date = ?
+            WHERE subscriber_number = ?
+        ''', (customer_name, phone, address, timestamp, number))
+        row = cursor.execute("SELECT id FROM subscribers WHERE subscriber_number = ?", (number,)).fetchone()
+        return row[0] if row else None
+
+    def ensure_subscriber(self, cursor, case_data):
+        """ضمان وجود المشترك الخاص ببيانات الحالة داخل معاملة الحالة وإرجاع رقمه"""
+        return self.upsert_subscriber(
+            cursor,
+            case_data.get('subscriber_number'),
+            case_data.get('customer_name'),
+            case_data.get('phone'),
+            case_data.get('address'),
+            case_data.get('modified_date') or case_data.get('created_date')
+        )
+
+    def migrate_subscribers(self):
+        """ربط الحالات غير المرتبطة بجدول المشتركين مع دمج الأرقام المكررة
+
+        الأحدث تعديلاً يحدد اسم المشترك وهاتفه وعنوانه. تُرجع عدد الحالات المرتبطة.
+        """
+        linked = 0
+        for factory in self.data_connections():
+            conn = factory()
+            try:
+                cursor = conn.cursor()
+                rows = cursor.execute('''
+                    SELECT id, subscriber_number, customer_name, phone, address, modified_date, created_date
+                    FROM cases
+                    WHERE subscriber_id IS NULL
+                    ORDER BY modified_date, created_date
+                ''').fetchall()
+                for case_id, number, name, phone, address, modified_date, created_date in rows:
+                    subscriber_id = self.upsert_subscriber(cursor, number, name, phone, address, modified_date or created_date)
+                    if subscriber_id:
+                        cursor.execute("UPDATE cases SET subscriber_id = ? WHERE id = ?", (subscriber_id, case_id))
+                        linked += 1
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"خطأ في ترحيل المشتركين: {e}")
+            finally:
+                conn.close()
+        return linked
+
+    def get_subscriber_history(self, subscriber_number):
+        """سجل حالات المشترك وعدد الحالات المفتوحة وإجمالي المديونية باستعلام واحد مفهرس
+
+        المجاميع باستعلامات فرعية على فهرس subscriber_id (دوال النافذة OVER تحتاج SQLite 3.25).
+        """
+        query = """
+            SELECT s.id, s.subscriber_number, s.customer_name, s.phone, s.address,
+                   c.id, c.customer_name, c.subscriber_number, c.status,
+                   ic.category_name, ic.color_code, e.name as modified_by_name,
+                   c.created_date, c.modified_date,
+                   (SELECT COUNT(*) FROM cases oc
+                    WHERE oc.subscriber_id = s.id AND oc.status NOT IN ('تم حلها', 'مغلقة')) AS open_cases,
+                   (SELECT TOTAL(dc.debt_amount) FROM cases dc WHERE dc.subscriber_id = s.id) AS total_debt
+            FROM subscribers s
+            LEFT JOIN cases c ON c.subscriber_id = s.id
+            LEFT JOIN issue_categories ic ON c.category_id = ic.id
+            LEFT JOIN employees e ON c.modified_by = e.id
+            WHERE s.subscriber_number = ?
+            ORDER BY c.modified_date DESC, c.created_date DESC
+        """
+        case_columns = ['id', 'customer_name', 'subscriber_number', 'status', 'category_name', 'color_code', 'modified_by_name', 'created_date', 'modified_date']
+        history = {'subscriber': None, 'cases': [], 'open_cases': 0, 'total_debt': 0.0}
+        for rows in self.execute_query_parts(query, (normalize_subscriber_number(subscriber_number),)):
+            if not rows:
+                continue
+            if history['subscriber'] is None:
+                history['subscriber'] = dict(zip(['id', 'subscriber_number', 'customer_name', 'phone', 'address'], rows[0][:5]))
+            history['open_cases'] += rows[0][14]
+            history['total_debt'] += rows[0][15]
+            history['cases'].extend(dict(zip(case_columns, row[5:14])) for row in rows if row[5] is not None)
+        history['cases'].sort(key=lambda c: (c['modified_date'] or '', c['created_date'] or ''), reverse=True)
+        return history
+
     def get_all_cases(self):
         """الحصول على جميع الحالات كقوائم dict"""
         query = '''
@@ -555,7 +971,7 @@ class DatabaseManager:
         """الحصول على مرفقات الحالة (واجهة مختصرة)"""
         # يعيد قائمة dicts متوافقة مع الواجهة
         rows = self.get_case_attachments(case_id)
-        columns = ['id', 'case_id', 'file_name', 'file_path', 'file_type', 'description', 'upload_date', 'uploaded_by', 'uploaded_by_name']
+        columns = ['id', 'case_id', 'file_name', 'file_path', 'file_type', 'description', 'upload_date', 'uploaded_by', 'uploaded_by_name', 'blob_hash', 'archive_member']
         return [dict(zip(columns, row)) for row in rows]
 
     def get_correspondences(self, case_id):
@@ -565,14 +981,372 @@ class DatabaseManager:
         return [dict(zip(columns, row)) for row in rows]
 
     def delete_attachment(self, attachment_id):
-        """حذف مرفق حسب رقم المرفق"""
-        query = "DELETE FROM attachments WHERE id = ?"
-        self.execute_query(query, (attachment_id,))
+        """حذف مرفق حسب رقم المرفق (مع إنقاص عدد مراجع ملف المحتوى)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE attachment_blobs SET ref_count = ref_count - 1
+                WHERE sha256 = (SELECT blob_hash FROM attachments WHERE id = ?)
+            ''', (attachment_id,))
+            cursor.execute("DELETE FROM attachments WHERE id = ?", (attachment_id,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"خطأ في حذف المرفق {attachment_id}: {e}")
+        finally:
+            conn.close()
+
+    # ---- مخزن المرفقات حسب المحتوى ----
+
+    def get_blob(self, sha256):
+        """بيانات ملف المحتوى (sha256, blob_path, size, ref_count) أو None"""
+        result = self.execute_query(
+            "SELECT sha256, blob_path, size, ref_count FROM attachment_blobs WHERE sha256 = ?", (sha256,))
+        return result[0] if result else None
+
+    def register_blob(self, sha256, blob_path, size):
+        """تسجيل ملف محتوى جديد (بدون مراجع حتى يُضاف مرفق يشير إليه)"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.execute_query('''
+            INSERT OR IGNORE INTO attachment_blobs (sha256, blob_path, size, ref_count, created_date)
+            VALUES (?, ?, ?, 0, ?)
+        ''', (sha256, blob_path, size, now))
+        # تسجيل سابق لنفس البصمة يُعامل كاستخدام جديد (مهلة حماية من التنظيف)
+        self.touch_blob(sha256)
+
+    def touch_blob(self, sha256):
+        """تحديث created_date لملف محتوى أُعيد استخدامه حتى تحميه مهلة التنظيف
+
+        تُرجع False إذا لم يعد الملف مسجلاً (حذفه التنظيف).
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute("UPDATE attachment_blobs SET created_date = ? WHERE sha256 = ?",
+                                  (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), sha256))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def update_blob_path(self, sha256, blob_path):
+        self.execute_query("UPDATE attachment_blobs SET blob_path = ? WHERE sha256 = ?", (blob_path, sha256))
+
+    def update_blob_refs(self, cursor):
+        """ضبط عدد مراجع كل ملف محتوى من جدول المرفقات (المصدر الموثوق) داخل معاملة المستدعي"""
+        cursor.execute('''
+            UPDATE attachment_blobs SET ref_count = (
+                SELECT COUNT(*) FROM attachments a WHERE a.blob_hash = attachment_blobs.sha256
+            )
+        ''')
+
+    def recount_orphaned_blobs(self, created_before=None):
+        """إعادة حساب المراجع واختيار ملفات المحتوى التي لا يشير إليها أي مرفق في معاملة واحدة
+
+        المعاملة تبدأ بقفل كتابة (BEGIN IMMEDIATE) حتى لا تُكتب زيادة مرجع من
+        add_attachments بين العد والاختيار. تُرجع (sha256, blob_path, size) للملفات
+        المسجلة قبل created_before فقط إن حُدد.
+        """
+        query = "SELECT sha256, blob_path, size FROM attachment_blobs WHERE ref_count <= 0"
+        params = ()
+        if created_before:
+            query += " AND created_date < ?"
+            params = (created_before,)
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            self.update_blob_refs(cursor)
+            orphans = cursor.execute(query, params).fetchall()
+            conn.commit()
+            return orphans
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def delete_blob_record(self, sha256, created_before=None):
+        """حذف تسجيل ملف محتوى غير مستخدم، وإرجاع False إذا أُعيد استخدامه منذ اختياره"""
+        query = "DELETE FROM attachment_blobs WHERE sha256 = ? AND ref_count <= 0"
+        params = (sha256,)
+        if created_before:
+            query += " AND created_date < ?"
+            params += (created_before,)
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(query, params)
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def find_cases_by_keys(self, case_ids=(), subscriber_numbers=()):
+        """مطابقة أرقام حالات وأرقام مشتركين مع الحالات الموجودة
+
+        تُرجع (مجموعة أرقام الحالات الموجودة، {رقم المشترك: أحدث حالة له}).
+        """
+        existing = set()
+        latest = {}
+        case_ids = sorted({int(case_id) for case_id in case_ids})
+        numbers = sorted({normalize_subscriber_number(number) for number in subscriber_numbers} - {''})
+        for start in range(0, len(case_ids), 500):
+            chunk = case_ids[start:start + 500]
+            rows = self.execute_query(
+                f"SELECT id FROM cases WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            existing.update(row[0] for row in rows)
+        for start in range(0, len(numbers), 500):
+            chunk = numbers[start:start + 500]
+            rows = self.execute_query(f'''
+                SELECT s.subscriber_number, c.id, COALESCE(c.modified_date, c.created_date)
+                FROM cases c JOIN subscribers s ON c.subscriber_id = s.id
+                WHERE s.subscriber_number IN ({','.join('?' * len(chunk))})
+            ''', chunk)
+            for number, case_id, modified in rows:
+                if number not in latest or (modified or '') > latest[number][1]:
+                    latest[number] = (case_id, modified or '')
+        return existing, {number: value[0] for number, value in latest.items()}
+
+    def get_attached_blobs(self, case_ids):
+        """أزواج (رقم الحالة، بصمة المحتوى) لمرفقات الحالات المحددة"""
+        case_ids = sorted({int(case_id) for case_id in case_ids})
+        pairs = set()
+        for start in range(0, len(case_ids), 500):
+            chunk = case_ids[start:start + 500]
+            rows = self.execute_query(
+                f"SELECT case_id, blob_hash FROM attachments WHERE blob_hash IS NOT NULL AND case_id IN ({','.join('?' * len(chunk))})",
+                chunk)
+            pairs.update((case_id, blob_hash) for case_id, blob_hash in rows)
+        return pairs
+
+    def get_storage_index_rows(self):
+        """المرفقات مع بيانات فهرس التخزين الحالية (للمطابقة مع الملفات)
+
+        (attachment_id, case_id, file_path, blob_hash, size, mtime, sha256, missing، هل له صف في الفهرس)
+        المرفقات المؤرشفة لا تُرجع لأن ملفاتها الأصلية حُذفت عمداً.
+        """
+        return self.execute_query('''
+            SELECT a.id, a.case_id, a.file_path, a.blob_hash, s.size, s.mtime, s.sha256, s.missing,
+                   s.attachment_id IS NOT NULL
+            FROM attachments a
+            LEFT JOIN storage_index s ON s.attachment_id = a.id
+            WHERE a.archive_member IS NULL
+            ORDER BY a.file_path
+        ''')
+
+    def update_storage_index(self, entries):
+        """كتابة صفوف فهرس التخزين في معاملة واحدة
+
+        entries: [(attachment_id, case_id, size, mtime, sha256, missing), ...]
+        """
+        checked_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = self.get_connection()
+        try:
+            conn.executemany('''
+                INSERT OR REPLACE INTO storage_index (attachment_id, case_id, size, mtime, sha256, missing, checked_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [tuple(entry) + (checked_date,) for entry in entries])
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"خطأ في تحديث فهرس التخزين: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def relink_attachment(self, attachment_id, case_id, file_path, size, mtime, sha256):
+        """ربط مرفق بالمسار الجديد لملفه (بعد نقله) وتحديث فهرس التخزين"""
+        checked_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = self.get_connection()
+        try:
+            conn.execute("UPDATE attachments SET file_path = ? WHERE id = ?", (file_path, attachment_id))
+            conn.execute('''
+                INSERT OR REPLACE INTO storage_index (attachment_id, case_id, size, mtime, sha256, missing, checked_date)
+                VALUES (?, ?, ?, ?, ?, 0, ?)
+            ''', (attachment_id, case_id, size, mtime, sha256, checked_date))
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"خطأ في إعادة ربط المرفق: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def get_case_storage(self, case_id):
+        """ملفات مرفقات الحالة من فهرس التخزين"""
+        rows = self.execute_query('''
+            SELECT a.id, a.file_name, a.file_path, a.file_type, s.size, s.mtime, s.missing
+            FROM attachments a
+            LEFT JOIN storage_index s ON s.attachment_id = a.id
+            WHERE a.case_id = ?
+            ORDER BY a.upload_date DESC
+        ''', (case_id,))
+        columns = ['id', 'file_name', 'file_path', 'file_type', 'size', 'mtime', 'missing']
+        return [dict(zip(columns, row)) for row in rows]
+
+    def get_storage_totals(self, case_id=None):
+        """إجمالي المساحة من فهرس التخزين (لحالة واحدة أو للكل مع التوزيع على السنوات)
+
+        bytes: مجموع أحجام المرفقات، unique_bytes: المساحة الفعلية (الملف المشترك
+        بين عدة مرفقات يُحسب مرة واحدة)، unindexed: مرفقات لم تُفحص ملفاتها بعد.
+        ملفات المرفقات المؤرشفة لا تُحسب في unique_bytes بل في archive_bytes
+        (حجم ملفات الأرشيف)، وreclaimed_bytes هي المساحة التي وفرتها الأرشفة.
+        """
+        where, params = ("WHERE a.case_id = ?", (case_id,)) if case_id is not None else ("", ())
+        by_year = {}
+        for year, files, size, missing, unindexed in self.execute_query(f'''
+            SELECT strftime('%Y', c.created_date), COUNT(a.id), COALESCE(SUM(s.size), 0),
+                   COALESCE(SUM(s.missing), 0), SUM(s.attachment_id IS NULL)
+            FROM attachments a
+            JOIN cases c ON c.id = a.case_id
+            LEFT JOIN storage_index s ON s.attachment_id = a.id
+            {where}
+            GROUP BY 1
+        ''', params):
+            totals = by_year.setdefault(year, {'files': 0, 'bytes': 0, 'missing': 0, 'unindexed': 0})
+            totals['files'] += files
+            totals['bytes'] += size
+            totals['missing'] += missing
+            totals['unindexed'] += unindexed or 0
+        unique = {}
+        on_disk = f"{where} AND" if where else "WHERE"
+        for key, size in self.execute_query(f'''
+            SELECT COALESCE(s.sha256, a.file_path), MAX(s.size)
+            FROM attachments a
+            JOIN storage_index s ON s.attachment_id = a.id
+            {on_disk} a.archive_member IS NULL
+            GROUP BY 1
+        ''', params):
+            unique[key] = size or 0
+        archives = {'archived_cases': 0, 'archived_files': 0, 'archive_bytes': 0, 'reclaimed_bytes': 0}
+        archive_where = "WHERE case_id = ?" if case_id is not None else ""
+        for row in self.execute_query(f'''
+            SELECT COUNT(*), COALESCE(SUM(files), 0), COALESCE(SUM(archive_bytes), 0), COALESCE(SUM(reclaimed_bytes), 0)
+            FROM case_archives {archive_where}
+        ''', params):
+            for key, value in zip(archives, row):
+                archives[key] += value
+        return {
+            'files': sum(totals['files'] for totals in by_year.values()),
+            'bytes': sum(totals['bytes'] for totals in by_year.values()),
+            'unique_bytes': sum(unique.values()),
+            'missing': sum(totals['missing'] for totals in by_year.values()),
+            'unindexed': sum(totals['unindexed'] for totals in by_year.values()),
+            'by_year': by_year,
+            **archives
+        }
+
+    # ---- أرشفة مرفقات الحالات المغلقة ----
+
+    def get_archive_candidates(self, created_before):
+        """الحالات المغلقة المنشأة قبل التاريخ المحدد ولها مرفقات غير مؤرشفة (id, created_date)"""
+        return self.execute_query(f'''
+            SELECT c.id, c.created_date
+            FROM cases c
+            WHERE c.status IN ({','.join('?' * len(CLOSED_STATUSES))})
+              AND c.created_date < ?
+              AND c.id NOT IN (SELECT case_id FROM case_archives)
+              AND EXISTS (SELECT 1 FROM attachments a WHERE a.case_id = c.id AND a.archive_member IS NULL)
+            ORDER BY c.created_date
+        ''', CLOSED_STATUSES + (created_before,))
+
+    def get_case_archive(self, case_id):
+        """بيانات أرشيف الحالة (case_id, archive_path, method, files, original_bytes, archive_bytes, reclaimed_bytes, archived_date) أو None"""
+        result = self.execute_query("SELECT * FROM case_archives WHERE case_id = ?", (case_id,))
+        return result[0] if result else None
+
+    def get_archived_attachment(self, attachment_id):
+        """(case_id, archive_path, archive_member) للمرفق المؤرشف أو None"""
+        result = self.execute_query('''
+            SELECT a.case_id, ca.archive_path, a.archive_member
+            FROM attachments a
+            JOIN case_archives ca ON ca.case_id = a.case_id
+            WHERE a.id = ? AND a.archive_member IS NOT NULL
+        ''', (attachment_id,))
+        return result[0] if result else None
+
+    def mark_case_archived(self, case_id, archive_path, method, members, original_bytes, archive_bytes):
+        """تسجيل أرشيف الحالة وربط مرفقاتها بملفاتها داخله في معاملة واحدة
+
+        members: {attachment_id: اسم الملف داخل الأرشيف}
+        """
+        conn = self.get_connection()
+        try:
+            conn.executemany("UPDATE attachments SET archive_member = ? WHERE id = ? AND case_id = ?",
+                             [(member, attachment_id, case_id) for attachment_id, member in members.items()])
+            conn.execute('''
+                INSERT OR REPLACE INTO case_archives
+                    (case_id, archive_path, method, files, original_bytes, archive_bytes, reclaimed_bytes, archived_date)
+                VALUES (?, ?, ?, ?, ?, ?, 0, ?)
+            ''', (case_id, archive_path, method, len(members), original_bytes, archive_bytes,
+                  datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"خطأ في تسجيل أرشيف الحالة {case_id}: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def set_archive_reclaimed(self, case_id, reclaimed_bytes):
+        self.execute_query("UPDATE case_archives SET reclaimed_bytes = ? WHERE case_id = ?", (reclaimed_bytes, case_id))
+
+    def count_unarchived_references(self, file_path=None, blob_hash=None):
+        """عدد المرفقات غير المؤرشفة التي تستخدم الملف (حسب المسار أو بصمة المحتوى)"""
+        if blob_hash:
+            condition, value = "blob_hash = ?", blob_hash
+        else:
+            condition, value = "file_path = ?", file_path
+        rows = self.execute_query(
+            f"SELECT COUNT(*) FROM attachments WHERE {condition} AND archive_member IS NULL", (value,))
+        return sum(row[0] for row in rows)
+
+    def get_unhashed_attachments(self):
+        """المرفقات غير المرتبطة بملف محتوى (id, case_id, file_name, file_path)"""
+        return self.execute_query(
+            "SELECT id, case_id, file_name, file_path FROM attachments WHERE blob_hash IS NULL AND archive_member IS NULL ORDER BY id")
+
+    def link_attachment_blob(self, attachment_id, sha256, blob_path):
+        """ربط مرفق موجود بملف محتوى (عند ترحيل الملفات القديمة)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE attachments SET blob_hash = ?, file_path = ? WHERE id = ? AND blob_hash IS NULL",
+                           (sha256, blob_path, attachment_id))
+            if cursor.rowcount:
+                cursor.execute("UPDATE attachment_blobs SET ref_count = ref_count + 1 WHERE sha256 = ?", (sha256,))
+            conn.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            conn.rollback()
+            print(f"خطأ في ربط المرفق {attachment_id}: {e}")
+            return False
+        finally:
+            conn.close()
 
     def delete_correspondence(self, correspondence_id):
         """حذف مراسلة حسب رقم المراسلة"""
         query = "DELETE FROM correspondences WHERE id = ?"
         self.execute_query(query, (correspondence_id,))
 
+def load_database_settings(config_file="config.json"):
+    """قراءة إعدادات قاعدة البيانات من ملف الإعدادات"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def create_database_manager(config_file="config.json"):
+    """إنشاء مدير قاعدة البيانات حسب التخطيط المحدد في الإعدادات (ملف واحد أو ملفات سنوية)"""
+    settings = load_database_settings(config_file)
+    if settings.get('database_layout') == 'sharded':
+        from customer_issues_sharding import ShardedDatabaseManager
+        return ShardedDatabaseManager(settings.get('shards_path', 'shards'), settings.get('text_compression'))
+    return DatabaseManager(text_compression=settings.get('text_compression'))
+
 # إنشاء مثيل قاعدة البيانات المحسنة
-enhanced_db = DatabaseManager()
\ No newline at end of file
+enhanced_db = create_database_manager()
\ No newline at end of file
@@ -1,6 +1,12 @@
 import os
+import re
 import shutil
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from customer_issues_blob_store import BlobStore, BLOB_FOLDER, is_within
+from customer_issues_ingest import ingest_file, IngestCancelled
+from customer_issues_snapshots import SnapshotBackup, DEFAULT_SNAPSHOT_FOLDER, DEFAULT_KEEP_LAST
 
 try:
     import tkinter.filedialog as filedialog
@@ -15,12 +21,65 @@ except ImportError:
 # هذا يضمن أن المسارات ستعمل بشكل صحيح بغض النظر عن مكان تشغيل السكربت
 PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
 
+# رقم الحالة في اسم الملف يجب أن يسبقه "case" أو "حالة" (case_125.jpg، حالة 125.pdf)
+CASE_ID_PATTERN = re.compile(r'(?:case|حالة)[\s_\-#]*(\d+)', re.IGNORECASE)
+# أي سلسلة أرقام بهذا الطول أو أكثر تُطابق مع أرقام المشتركين
+SUBSCRIBER_NUMBER_PATTERN = re.compile(r'\d{4,}')
+
+# ملفات النظام التي لا تُستورد من مجلدات الصور
+IGNORED_IMPORT_FILES = {'thumbs.db', 'desktop.ini', '.ds_store'}
+
+
+def name_match_keys(name):
+    """أرقام الحالات وأرقام المشتركين المحتملة في اسم ملف أو مجلد"""
+    # \d تطابق الأرقام العربية أيضاً، وتوحيدها عند البحث في قاعدة البيانات
+    text = os.path.splitext(name)[0]
+    case_ids = {int(match) for match in CASE_ID_PATTERN.findall(text)}
+    remaining = CASE_ID_PATTERN.sub(' ', text)
+    return case_ids, set(SUBSCRIBER_NUMBER_PATTERN.findall(remaining))
+
+
+def scan_folder(folder, recursive=True, exclude=None):
+    """مسارات ملفات المجلد (بـ os.scandir) مع أسماء المجلدات بينها وبين folder"""
+    files = []
+    pending = [(os.path.abspath(folder), ())]
+    while pending:
+        path, parents = pending.pop()
+        try:
+            entries = list(os.scandir(path))
+        except OSError as e:
+            print(f"خطأ في قراءة المجلد {path}: {e}")
+            continue
+        for entry in entries:
+            if entry.name.startswith('.') or entry.name.lower() in IGNORED_IMPORT_FILES:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if recursive and not (exclude and is_within(entry.path, exclude)):
+                    pending.append((entry.path, parents + (entry.name,)))
+            elif entry.is_file():
+                files.append((entry.path, parents))
+    files.sort()
+    return files
+
+
 class FileManager:
-    def __init__(self, base_path="files"):
+    def __init__(self, base_path="files", database=None):
         # استخدام المسار المطلق دائمًا لضمان الموثوقية
         self.base_path = os.path.join(PROJECT_ROOT, base_path)
+        # مدير قاعدة البيانات لمخزن المرفقات (الافتراضي enhanced_db عند أول استخدام)
+        self.database = database
         self.ensure_base_directory()
     
+    def get_database(self):
+        if self.database is None:
+            from customer_issues_database import enhanced_db
+            self.database = enhanced_db
+        return self.database
+
+    def blob_store(self, attachments_base_path=None):
+        """مخزن المرفقات حسب المحتوى داخل مجلد المرفقات"""
+        return BlobStore(self.get_database(), os.path.join(attachments_base_path or self.base_path, BLOB_FOLDER))
+    
     def ensure_base_directory(self):
         """التأكد من وجود المجلد الأساسي"""
         if not os.path.exists(self.base_path):
@@ -36,38 +95,144 @@ class FileManager:
         return case_folder
     
     def copy_file_to_dedicated_folder(self, source_path, case_id, attachments_base_path, description=""):
-        """نسخ ملف إلى مجلد مخصص ومنظم حسب رقم الحالة."""
+        """نسخ ملف إلى مخزن المرفقات حسب المحتوى داخل المجلد المخصص
+
+        الملف نفسه المرفق بعدة حالات يُخزن مرة واحدة، ولا يوجد تعارض أسماء لأن
+        اسم الملف المخزن هو بصمة محتواه (الاسم الأصلي يبقى في file_name).
+        """
         if not source_path or not os.path.exists(source_path):
             return None
 
-        # إنشاء مجلد الحالة داخل المجلد المخصص
-        case_folder = os.path.join(attachments_base_path, f"case_{case_id}")
-        if not os.path.exists(case_folder):
-            os.makedirs(case_folder)
-
-        file_name = os.path.basename(source_path)
-        # لا يتم تغيير اسم الملف للحفاظ عليه كما هو
-        new_file_path = os.path.join(case_folder, file_name)
-
-        # التحقق إذا كان الملف موجوداً بالفعل
-        if os.path.exists(new_file_path):
-            if not messagebox.askyesno("تأكيد", "ملف بنفس الاسم موجود بالفعل. هل تريد استبداله؟"):
-                return None # أو يمكن إرجاع معلومات الملف الموجود
-
         try:
-            shutil.copy2(source_path, new_file_path)
-            absolute_path = os.path.abspath(new_file_path)
-            return {
-                'file_name': file_name,
-                'file_path': absolute_path, # <-- إرجاع المسار المطلق للملف المنسوخ
-                'file_type': self.get_file_type(file_name),
-                'description': description,
-                'size': self.get_file_size(absolute_path)
-            }
+            blob = self.blob_store(attachments_base_path).put_file(source_path)
+            return self.get_blob_attachment_info(source_path, blob, description)
         except Exception as e:
             messagebox.showerror("خطأ في النسخ", f"فشل نسخ الملف: {e}")
             return None
 
+    def get_blob_attachment_info(self, source_path, blob, description=""):
+        """معلومات مرفق منسوخ إلى مخزن المحتوى (نتيجة put_file أو طابور النسخ)"""
+        file_name = os.path.basename(source_path)
+        return {
+            'file_name': file_name,
+            'file_path': blob['path'], # <-- المسار المطلق لملف المحتوى
+            'file_type': self.get_file_type(file_name),
+            'description': description,
+            'size': self.format_size(blob['size']),
+            'blob_hash': blob['sha256']
+        }
+
+    def match_files_to_cases(self, files):
+        """تحديد حالة كل ملف من رقم الحالة أو رقم المشترك في اسمه
+
+        اسم الملف أولاً ثم أسماء المجلدات من الأقرب للأبعد. الاسم الذي يطابق أكثر
+        من حالة لا يُستخدم. تُرجع (قائمة (المسار، رقم الحالة)، غير المطابقة، الملتبسة).
+        """
+        from customer_issues_database import normalize_subscriber_number
+        keys = {}
+        for path, parents in files:
+            for name in (os.path.basename(path),) + tuple(reversed(parents)):
+                if name not in keys:
+                    case_ids, numbers = name_match_keys(name)
+                    keys[name] = (case_ids, {normalize_subscriber_number(number) for number in numbers})
+        all_case_ids = set().union(*(case_ids for case_ids, _ in keys.values()))
+        all_numbers = set().union(*(numbers for _, numbers in keys.values()))
+        existing, by_subscriber = self.get_database().find_cases_by_keys(all_case_ids, all_numbers)
+
+        matched, unmatched, ambiguous = [], [], []
+        for path, parents in files:
+            for name in (os.path.basename(path),) + tuple(reversed(parents)):
+                case_ids, numbers = keys[name]
+                candidates = (case_ids & existing) | {by_subscriber[number] for number in numbers if number in by_subscriber}
+                if candidates:
+                    break
+            if len(candidates) == 1:
+                matched.append((path, candidates.pop()))
+            elif candidates:
+                ambiguous.append(path)
+            else:
+                unmatched.append(path)
+        return matched, unmatched, ambiguous
+
+    def bulk_import_folder(self, folder, attachments_base_path=None, description="", uploaded_by=1,
+                           recursive=True, max_workers=4, progress=None, cancel_event=None):
+        """استيراد ملفات مجلد كمرفقات للحالات المطابقة لأسمائها
+
+        الملفات تُنسخ وتُحسب بصماتها في مجموعة خيوط محدودة، ثم تُضاف جميع صفوف
+        المرفقات في معاملة واحدة. الملف المرفق بنفس الحالة مسبقاً لا يُضاف مرة أخرى
+        (إعادة استيراد نفس المجلد آمنة). progress(done, total) تُستدعى بعد كل ملف.
+        """
+        database = self.get_database()
+        store = self.blob_store(attachments_base_path)
+        files = scan_folder(folder, recursive, exclude=os.path.dirname(store.root))
+        matched, unmatched, ambiguous = self.match_files_to_cases(files)
+        report = {'scanned': len(files), 'imported': 0, 'already_attached': 0, 'stored_bytes': 0,
+                  'unmatched': unmatched, 'ambiguous': ambiguous, 'failed': []}
+        attached = database.get_attached_blobs({case_id for _, case_id in matched})
+
+        rows = []
+        done = 0
+        if progress:
+            progress(done, len(matched))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(ingest_file, store, path, None, cancel_event): (path, case_id)
+                       for path, case_id in matched}
+            try:
+                for future in as_completed(futures):
+                    path, case_id = futures[future]
+                    done += 1
+                    if progress:
+                        progress(done, len(matched))
+                    try:
+                        blob = future.result()
+                    except IngestCancelled:
+                        continue
+                    except Exception as e:
+                        report['failed'].append((path, str(e)))
+                        continue
+                    if blob['stored']:
+                        report['stored_bytes'] += blob['size']
+                    if (case_id, blob['sha256']) in attached:
+                        report['already_attached'] += 1
+                        continue
+                    attached.add((case_id, blob['sha256']))
+                    rows.append(dict(self.get_blob_attachment_info(path, blob, description), case_id=case_id))
+            finally:
+                if cancel_event is not None and cancel_event.is_set():
+                    # الملفات التي لم تبدأ تُلغى، والجارية تتوقف عند فحص cancel_event
+                    for future in futures:
+                        future.cancel()
+
+        if cancel_event is not None and cancel_event.is_set():
+            # الملفات المنسوخة بالكامل تبقى في المخزن وتُربط عند إعادة الاستيراد
+            raise IngestCancelled(folder)
+
+        upload_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows.sort(key=lambda row: (row['case_id'], row['file_name']))
+        attachments = [{
+            'case_id': row['case_id'],
+            'file_name': row['file_name'],
+            'file_path': row['file_path'],
+            'file_type': row['file_type'],
+            'description': row['description'],
+            'upload_date': upload_date,
+            'uploaded_by': uploaded_by,
+            'blob_hash': row['blob_hash']
+        } for row in rows]
+        counts = {}
+        for row in rows:
+            counts[row['case_id']] = counts.get(row['case_id'], 0) + 1
+        folder_name = os.path.basename(os.path.abspath(folder))
+        audit_entries = [(case_id, "استيراد مرفقات", f"تم استيراد {count} مرفق من المجلد: {folder_name}", uploaded_by)
+                         for case_id, count in counts.items()]
+        if attachments:
+            ids = database.add_attachments(attachments, audit_entries)
+            if len(ids) != len(attachments):
+                raise RuntimeError("فشل حفظ المرفقات في قاعدة البيانات")
+        report['imported'] = len(attachments)
+        report['cases'] = sorted(counts)
+        return report
+
     def get_attachment_info(self, file_path, description=""):
         """الحصول على معلومات المرفق دون نسخه، مع استخدام المسار المطلق."""
         if not file_path or not os.path.exists(file_path):
@@ -246,43 +411,31 @@ class FileManager:
             return None
     
     def get_case_files_info(self, case_id):
-        """الحصول على معلومات ملفات الحالة"""
-        case_folder = os.path.join(self.base_path, f"case_{case_id}")
+        """الحصول على معلومات ملفات الحالة (من فهرس التخزين بدون قراءة المجلدات)"""
         files_info = []
-        
-        if os.path.exists(case_folder):
-            for file_name in os.listdir(case_folder):
-                file_path = os.path.join(case_folder, file_name)
-                if os.path.isfile(file_path):
-                    files_info.append({
-                        'name': file_name,
-                        'path': file_path,
-                        'type': self.get_file_type(file_name),
-                        'size': self.get_file_size(file_path),
-                        'modified_date': datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%d %H:%M:%S")
-                    })
-        
+        for entry in self.get_database().get_case_storage(case_id):
+            files_info.append({
+                'name': entry['file_name'],
+                'path': entry['file_path'],
+                'type': entry['file_type'] or self.get_file_type(entry['file_name']),
+                'size': self.format_size(entry['size']) if entry['size'] is not None else "غير معروف",
+                'modified_date': datetime.fromtimestamp(entry['mtime']).strftime("%Y-%m-%d %H:%M:%S") if entry['mtime'] else "",
+                'missing': bool(entry['missing'])
+            })
         return files_info
     
-    def create_backup(self, case_id, backup_path=None):
-        """إنشاء نسخة احتياطية من ملفات الحالة"""
-        case_folder = os.path.join(self.base_path, f"case_{case_id}")
-        
-        if not os.path.exists(case_folder):
+    def create_backup(self, case_id=None, backup_path=None):
+        """إنشاء لقطة احتياطية لملفات المرفقات (أو لمجلد حالة واحدة)
+
+        الملفات التي لم تتغير منذ اللقطة السابقة تُربط بها بدلاً من نسخها
+        (انظر SnapshotBackup). تُرجع مسار اللقطة أو None عند الفشل.
+        """
+        backup = self.snapshot_backup(case_id, backup_path)
+        if not os.path.exists(backup.source_root):
             return False
-        
-        if not backup_path:
-            backup_path = os.path.join(self.base_path, "backups")
-            if not os.path.exists(backup_path):
-                os.makedirs(backup_path)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_name = f"case_{case_id}_backup_{timestamp}"
-        backup_full_path = os.path.join(backup_path, backup_name)
-        
         try:
-            shutil.copytree(case_folder, backup_full_path)
-            return backup_full_path
+            report = backup.create_snapshot()
+            return backup.snapshot_path(report['name'])
         except Exception as e:
             error_msg = f"فشل في إنشاء النسخة الاحتياطية: {str(e)}"
             if TKINTER_AVAILABLE and messagebox:
@@ -291,43 +444,51 @@ class FileManager:
                 print(f"خطأ: {error_msg}")
             return None
     
-    def cleanup_old_backups(self, days_to_keep=30):
-        """تنظيف النسخ الاحتياطية القديمة"""
-        backup_path = os.path.join(self.base_path, "backups")
-        
-        if not os.path.exists(backup_path):
-            return
-        
-        current_time = datetime.now()
-        cutoff_time = current_time.timestamp() - (days_to_keep * 24 * 60 * 60)
-        
-        for item in os.listdir(backup_path):
-            item_path = os.path.join(backup_path, item)
-            if os.path.isdir(item_path):
-                if os.path.getmtime(item_path) < cutoff_time:
-                    try:
-                        shutil.rmtree(item_path)
-                        print(f"تم حذف النسخة الاحتياطية القديمة: {item}")
-                    except Exception as e:
-                        print(f"فشل في حذف النسخة الاحتياطية: {item} - {e}")
+    def snapshot_backup(self, case_id=None, backup_path=None):
+        """لقطات مجلد المرفقات كاملاً أو مجلد حالة واحدة"""
+        if case_id is None:
+            source = self.base_path
+            backup_root = backup_path or os.path.join(PROJECT_ROOT, DEFAULT_SNAPSHOT_FOLDER)
+        else:
+            source = os.path.join(self.base_path, f"case_{case_id}")
+            backup_root = os.path.join(backup_path or os.path.join(PROJECT_ROOT, "backups", "cases"), f"case_{case_id}")
+        # مجلد النسخ الاحتياطية القديم داخل مجلد المرفقات لا يُنسخ
+        return SnapshotBackup(source, backup_root, exclude=[os.path.join(self.base_path, "backups")])
     
-    def get_storage_info(self):
-        """الحصول على معلومات التخزين"""
-        total_size = 0
-        total_files = 0
+    def cleanup_old_backups(self, days_to_keep=30, case_id=None, keep_last=DEFAULT_KEEP_LAST):
+        """حذف اللقطات الأقدم من days_to_keep يوماً (آخر keep_last لقطة تبقى دائماً)
+
+        تُحذف أيضاً النسخ الكاملة القديمة (case_<id>_backup_<التاريخ>) من مجلد backups.
+        """
+        report = self.snapshot_backup(case_id).prune(keep_last, days_to_keep)
+        for name in report['removed']:
+            print(f"تم حذف النسخة الاحتياطية القديمة: {name}")
         
-        for root, dirs, files in os.walk(self.base_path):
-            for file in files:
-                file_path = os.path.join(root, file)
+        legacy_path = os.path.join(self.base_path, "backups")
+        if not os.path.exists(legacy_path):
+            return report
+        cutoff_time = datetime.now().timestamp() - (days_to_keep * 24 * 60 * 60)
+        for item in os.listdir(legacy_path):
+            item_path = os.path.join(legacy_path, item)
+            if os.path.isdir(item_path) and '_backup_' in item and os.path.getmtime(item_path) < cutoff_time:
                 try:
-                    total_size += os.path.getsize(file_path)
-                    total_files += 1
-                except:
-                    pass
-        
+                    shutil.rmtree(item_path)
+                    print(f"تم حذف النسخة الاحتياطية القديمة: {item}")
+                except Exception as e:
+                    print(f"فشل في حذف النسخة الاحتياطية: {item} - {e}")
+        return report
+    
+    def get_storage_info(self, case_id=None):
+        """الحصول على معلومات التخزين (من فهرس التخزين، لحالة واحدة أو للكل)"""
+        totals = self.get_database().get_storage_totals(case_id)
         return {
-            'total_files': total_files,
-            'total_size': self.format_size(total_size),
+            'total_files': totals['files'],
+            'total_size': self.format_size(totals['bytes']),
+            'stored_size': self.format_size(totals['unique_bytes']),
+            'missing_files': totals['missing'],
+            'unindexed_files': totals['unindexed'],
+            'by_year': {year: {'files': year_totals['files'], 'size': self.format_size(year_totals['bytes'])}
+                        for year, year_totals in totals['by_year'].items()},
             'base_path': self.base_path
         }
     
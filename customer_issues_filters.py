@@ -0,0 +1,274 @@
+from customer_issues_collation import ARABIC_COLLATION, arabic_sort_key
+
+# جداول الاستعلام (الحالات مع التصنيف وآخر موظف عدّلها)
+CASE_FROM = """
+    FROM cases c
+    LEFT JOIN issue_categories ic ON c.category_id = ic.id
+    LEFT JOIN employees e ON c.modified_by = e.id
+"""
+
+# أعمدة ملخص الحالة (نفس ترتيب SUMMARY_COLUMNS في البحث المتوازي)
+CASE_SUMMARY_SELECT = """
+    SELECT c.id, c.customer_name, c.subscriber_number, c.status,
+           ic.category_name, ic.color_code, e.name as modified_by_name,
+           c.created_date, c.modified_date""" + CASE_FROM
+
+# خيارات الترتيب المدعومة
+CASE_ORDER_BY = {
+    'modified_desc': "c.modified_date DESC, c.created_date DESC",
+    'created_desc': "c.created_date DESC, c.id DESC",
+    'created_asc': "c.created_date ASC, c.id ASC",
+    'name_asc': f"c.customer_name COLLATE {ARABIC_COLLATION} ASC, c.id ASC",
+    'name_desc': f"c.customer_name COLLATE {ARABIC_COLLATION} DESC, c.id DESC",
+    'subscriber_asc': "c.subscriber_number ASC, c.id ASC",
+    'subscriber_desc': "c.subscriber_number DESC, c.id DESC",
+    'category_asc': "ic.category_name ASC, c.id ASC",
+    'category_desc': "ic.category_name DESC, c.id DESC",
+    'status_asc': "c.status ASC, c.id ASC",
+    'status_desc': "c.status DESC, c.id DESC"
+}
+
+# مفتاح ترتيب الصفوف في Python لكل خيار (لدمج نتائج عدة ملفات): (الأعمدة، تنازلي)
+CASE_ORDER_KEYS = {
+    'modified_desc': (('modified_date', 'created_date'), True),
+    'created_desc': (('created_date', 'id'), True),
+    'created_asc': (('created_date', 'id'), False),
+    'name_asc': (('customer_name', 'id'), False),
+    'name_desc': (('customer_name', 'id'), True),
+    'subscriber_asc': (('subscriber_number', 'id'), False),
+    'subscriber_desc': (('subscriber_number', 'id'), True),
+    'category_asc': (('category_name', 'id'), False),
+    'category_desc': (('category_name', 'id'), True),
+    'status_asc': (('status', 'id'), False),
+    'status_desc': (('status', 'id'), True)
+}
+
+# أنواع البحث النصي وأعمدتها (LIKE على جزء من النص)
+LIKE_SEARCH_COLUMNS = {
+    'اسم العميل': 'c.customer_name',
+    'العنوان': 'c.address'
+}
+
+# أنواع البحث بالفهرس الثلاثي (جزء من الرقم)
+TRIGRAM_SEARCH_COLUMNS = {
+    'رقم المشترك': 'subscriber_number',
+    'رقم الهاتف': 'phone'
+}
+
+
+def _as_list(value):
+    """تحويل قيمة مفردة أو مجموعة إلى قائمة بدون القيم الفارغة"""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [v for v in value if v not in (None, '')]
+    return [value] if value != '' else []
+
+
+class CaseFilter:
+    """مواصفات فلترة الحالات تُترجم إلى استعلام SQL واحد بمعاملات
+
+    جميع الشروط اختيارية ويتم دمجها بـ AND:
+    - years: سنة أو عدة سنوات إنشاء، أو year_from/year_to لمدى سنوات
+    - statuses / category_ids / category_names: حالة أو تصنيف أو أكثر
+    - employee_id / employee_name: آخر موظف عدّل الحالة
+    - search_type + search_text: نفس أنواع البحث في الشريط الجانبي
+    - date_from / date_to: مدى تاريخ الإنشاء (YYYY-MM-DD شاملاً الطرفين)
+    - case_ids: حالات محددة فقط (لتحديث القائمة بالحالات المتغيرة)
+    شروط السنة والتاريخ تُكتب كمدى على created_date حتى يُستخدم الفهرس.
+    """
+
+    def __init__(self, years=None, year_from=None, year_to=None, statuses=None,
+                 category_ids=None, category_names=None, employee_id=None, employee_name=None,
+                 search_type=None, search_text=None, date_from=None, date_to=None,
+                 case_ids=None, order_by='modified_desc', limit=None, offset=0):
+        self.years = sorted({int(y) for y in _as_list(years)})
+        self.year_from = int(year_from) if year_from else None
+        self.year_to = int(year_to) if year_to else None
+        self.statuses = _as_list(statuses)
+        self.category_ids = _as_list(category_ids)
+        self.category_names = _as_list(category_names)
+        self.employee_id = employee_id
+        self.employee_name = employee_name or None
+        self.search_type = search_type
+        self.search_text = (search_text or '').strip()
+        self.date_from = date_from or None
+        self.date_to = date_to or None
+        self.case_ids = _as_list(case_ids)
+        self.order_by = order_by if order_by in CASE_ORDER_BY else 'modified_desc'
+        self.limit = limit
+        self.offset = offset
+
+    @classmethod
+    def from_sidebar(cls, search_type, search_value, year=None, **kwargs):
+        """إنشاء فلتر من قيم الشريط الجانبي (السنة "الكل" تعني بدون فلترة)"""
+        years = [year] if year and year != "الكل" else None
+        filter_kwargs = {'years': years}
+        search_value = (search_value or '').strip()
+        # التصنيف والحالة والموظف تُختار من قوائم وتطابق القيمة كاملة
+        if search_type == "تصنيف المشكلة":
+            filter_kwargs['category_names'] = search_value or None
+        elif search_type == "حالة المشكلة":
+            filter_kwargs['statuses'] = search_value or None
+        elif search_type == "اسم الموظف":
+            filter_kwargs['employee_name'] = search_value or None
+        else:
+            filter_kwargs['search_type'] = search_type
+            filter_kwargs['search_text'] = search_value
+        filter_kwargs.update(kwargs)
+        return cls(**filter_kwargs)
+
+    def copy(self, **changes):
+        """نسخة من الفلتر مع تعديل بعض القيم"""
+        values = dict(self.__dict__)
+        values.update(changes)
+        return CaseFilter(**values)
+
+    def year_bounds(self):
+        """أصغر وأكبر سنة يغطيها الفلتر (None إذا لم تُحدد)"""
+        low = [y for y in (self.year_from, self.years[0] if self.years else None) if y]
+        high = [y for y in (self.year_to, self.years[-1] if self.years else None) if y]
+        if self.date_from:
+            low.append(int(str(self.date_from)[:4]))
+        if self.date_to:
+            high.append(int(str(self.date_to)[:4]))
+        return (max(low) if low else None, min(high) if high else None)
+
+    def matches_year(self, year):
+        """هل يمكن أن تقع حالات الفلتر في السنة المحددة (لاستبعاد الملفات السنوية)"""
+        year = int(year)
+        if self.years and year not in self.years:
+            return False
+        low, high = self.year_bounds()
+        return (low is None or year >= low) and (high is None or year <= high)
+
+    def sort_key(self):
+        """(دالة مفتاح الترتيب، تنازلي) المطابقة لترتيب الاستعلام"""
+        from customer_issues_parallel_search import SUMMARY_COLUMNS
+        columns, reverse = CASE_ORDER_KEYS[self.order_by]
+        indexes = [SUMMARY_COLUMNS.index(column) for column in columns]
+
+        def value(column, item):
+            # الأسماء تُقارن بنفس ترتيب ARABIC المستخدم في الاستعلام
+            return arabic_sort_key(item) if column == 'customer_name' else (item or '')
+
+        def key(row):
+            if isinstance(row, dict):
+                return tuple(value(column, row.get(column)) for column in columns)
+            return tuple(value(column, row[index]) for column, index in zip(columns, indexes))
+        return key, reverse
+
+    def compile(self, database=None):
+        """ترجمة الفلتر إلى (query, params)
+
+        database: مدير قاعدة البيانات لاستخدام الفهرس الثلاثي في البحث بالأرقام.
+        """
+        where = self._where(database)
+        if where is None:
+            return None
+        where_sql, params = where
+        query = CASE_SUMMARY_SELECT + where_sql
+        query += f" ORDER BY {CASE_ORDER_BY[self.order_by]}"
+        if self.limit:
+            query += " LIMIT ? OFFSET ?"
+            params = params + (self.limit, self.offset)
+        return query, params
+
+    def compile_count(self, database=None):
+        """استعلام عدد الحالات المطابقة (بدون ترتيب أو حد)"""
+        where = self._where(database)
+        if where is None:
+            return None
+        where_sql, params = where
+        return "SELECT COUNT(*)" + CASE_FROM + where_sql, params
+
+    def _where(self, database):
+        """جملة WHERE ومعاملاتها، أو None إذا كان نوع البحث غير معروف"""
+        conditions = []
+        params = []
+
+        if self.years:
+            # مدى لكل سنة بدلاً من strftime حتى يُستخدم فهرس created_date
+            year_conditions = []
+            for year in self.years:
+                year_conditions.append("(c.created_date >= ? AND c.created_date < ?)")
+                params.extend((f"{year}-01-01", f"{year + 1}-01-01"))
+            conditions.append("(" + " OR ".join(year_conditions) + ")")
+        if self.year_from:
+            conditions.append("c.created_date >= ?")
+            params.append(f"{self.year_from}-01-01")
+        if self.year_to:
+            conditions.append("c.created_date < ?")
+            params.append(f"{self.year_to + 1}-01-01")
+        if self.date_from:
+            conditions.append("c.created_date >= ?")
+            params.append(str(self.date_from)[:10])
+        if self.date_to:
+            conditions.append("c.created_date < date(?, '+1 day')")
+            params.append(str(self.date_to)[:10])
+
+        if self.case_ids:
+            conditions.append(f"c.id IN ({', '.join('?' * len(self.case_ids))})")
+            params.extend(self.case_ids)
+        if self.statuses:
+            conditions.append(f"c.status IN ({', '.join('?' * len(self.statuses))})")
+            params.extend(self.statuses)
+        if self.category_ids:
+            conditions.append(f"c.category_id IN ({', '.join('?' * len(self.category_ids))})")
+            params.extend(self.category_ids)
+        if self.category_names:
+            conditions.append(f"ic.category_name IN ({', '.join('?' * len(self.category_names))})")
+            params.extend(self.category_names)
+        if self.employee_id:
+            conditions.append("c.modified_by = ?")
+            params.append(self.employee_id)
+        if self.employee_name:
+            conditions.append("e.name = ?")
+            params.append(self.employee_name)
+
+        if self.search_text:
+            text_condition = self._text_condition(database)
+            if text_condition is None:
+                return None
+            condition, text_params = text_condition
+            conditions.append(condition)
+            params.extend(text_params)
+
+        where_sql = ""
+        if conditions:
+            where_sql = " WHERE " + "\n      AND ".join(conditions)
+        return where_sql, tuple(params)
+
+    def _text_condition(self, database):
+        """شرط البحث النصي حسب نوع البحث"""
+        value = self.search_text
+        pattern = f"%{value}%"
+        if self.search_type == "شامل":
+            # EXISTS بدلاً من JOIN + DISTINCT حتى لا تتكرر صفوف الحالة
+            return ("""(c.customer_name LIKE ? OR c.subscriber_number LIKE ?
+                   OR c.address LIKE ? OR ci_text(c.problem_description) LIKE ?
+                   OR ci_text(c.actions_taken) LIKE ?
+                   OR EXISTS (SELECT 1 FROM correspondences co
+                              WHERE co.case_id = c.id AND ci_text(co.message_content) LIKE ?)
+                   OR EXISTS (SELECT 1 FROM attachments a
+                              WHERE a.case_id = c.id AND a.description LIKE ?))""",
+                    (pattern,) * 7)
+        if self.search_type in LIKE_SEARCH_COLUMNS:
+            return f"{LIKE_SEARCH_COLUMNS[self.search_type]} LIKE ?", (pattern,)
+        if self.search_type in TRIGRAM_SEARCH_COLUMNS:
+            column = TRIGRAM_SEARCH_COLUMNS[self.search_type]
+            if database is not None:
+                return database.trigram_filter(column, value)
+            return f"c.{column} LIKE ?", (pattern,)
+        if self.search_type == "تصنيف المشكلة":
+            return "ic.category_name = ?", (value,)
+        if self.search_type == "حالة المشكلة":
+            return "c.status = ?", (value,)
+        if self.search_type == "اسم الموظف":
+            return "e.name = ?", (value,)
+        return None
+
+    def __repr__(self):
+        values = {k: v for k, v in self.__dict__.items() if v not in (None, '', [], 0)}
+        return f"CaseFilter({values})"
+
@@ -3,6 +3,8 @@ from tkinter import ttk, messagebox, simpledialog
 from datetime import datetime
 import json
 from customer_issues_database import enhanced_db
+from customer_issues_filters import CaseFilter
+from customer_issues_instrumentation import instrumented
 
 class EnhancedFunctions:
     def __init__(self, main_window):
@@ -26,13 +28,7 @@ class EnhancedFunctions:
         """تحميل سنوات البيانات"""
         try:
             # الحصول على السنوات المتاحة
-            query = "SELECT DISTINCT strftime('%Y', created_date) as year FROM cases ORDER BY year DESC"
-            years_data = enhanced_db.execute_query(query)
-            
-            years = ["الكل"]
-            for year_row in years_data:
-                if year_row[0]:
-                    years.append(year_row[0])
+            years = ["الكل"] + enhanced_db.get_case_years()
             
             # إضافة السنة الحالية إذا لم تكن موجودة
             current_year = str(datetime.now().year)
@@ -81,6 +77,9 @@ class EnhancedFunctions:
     def load_cases(self, year=None):
         """تحميل الحالات"""
         try:
+            # الفلتر والإصدار يسمحان بتحديث القائمة لاحقاً بالتغييرات فقط
+            self.main_window.list_filter = CaseFilter.from_sidebar("شامل", "", year)
+            self.main_window.list_version = enhanced_db.get_data_version()
             if year and year != "الكل":
                 cases_data = enhanced_db.get_cases_by_year(int(year))
             else:
@@ -96,95 +95,10 @@ class EnhancedFunctions:
     
     def refresh_cases_display(self):
         """تحديث عرض الحالات"""
-        # مسح العرض الحالي
-        for widget in self.main_window.scrollable_frame.winfo_children():
-            widget.destroy()
-        
-        # عرض الحالات
-        for i, case_data in enumerate(self.main_window.filtered_cases):
-            self.create_case_card(case_data, i)
-        
-        # تحديث منطقة السكرول
-        self.main_window.scrollable_frame.update_idletasks()
-        self.main_window.cases_canvas.configure(scrollregion=self.main_window.cases_canvas.bbox("all"))
-    
-    def create_case_card(self, case_data, index, return_widget=False):
-        """إنشاء بطاقة الحالة"""
-        # دعم dict أو tuple
-        if isinstance(case_data, dict):
-            case_id = case_data.get('id')
-            customer_name = case_data.get('customer_name', '')
-            subscriber_number = case_data.get('subscriber_number', '')
-            status = case_data.get('status', '')
-            category_name = case_data.get('category_name', '')
-            color_code = case_data.get('color_code', '')
-            modified_by_name = case_data.get('modified_by_name', '')
-            created_date = case_data.get('created_date', '')
-            modified_date = case_data.get('modified_date', '')
-        else:
-            case_id, customer_name, subscriber_number, status, category_name, color_code, modified_by_name, created_date, modified_date = case_data
-        
-        # إطار البطاقة
-        card_frame = tk.Frame(self.main_window.scrollable_frame, bg='#ffffff', relief='solid', bd=1)
-        card_frame.pack(fill='x', padx=5, pady=2)
-        
-        # لون الحدود حسب الحالة
-        if status in ['تم حلها', 'مغلقة']:
-            card_frame.configure(highlightbackground='#e74c3c', highlightthickness=2)
-        else:
-            card_frame.configure(highlightbackground='#3498db', highlightthickness=1)
-        
-        # اسم العميل
-        name_label = tk.Label(card_frame, text=customer_name, 
-                             font=('Arial', 12, 'bold'), 
-                             fg='#e74c3c' if status in ['تم حلها', 'مغلقة'] else '#2c3e50',
-                             bg='#ffffff')
-        name_label.pack(anchor='e', padx=10, pady=(10, 5))
-        
-        # تصنيف المشكلة (اعرض الاسم فقط)
-        if category_name:
-            category_label = tk.Label(card_frame, text=category_name,
-                                    font=('Arial', 10), fg='#7f8c8d', bg='#ffffff')
-            category_label.pack(anchor='e', padx=10)
-        
-        # شارة الحالة
-        status_frame = tk.Frame(card_frame, bg='#ffffff')
-        status_frame.pack(anchor='e', padx=10, pady=5)
-        
-        status_colors = {
-            'جديدة': '#3498db',
-            'قيد التنفيذ': '#f39c12',
-            'تم حلها': '#27ae60',
-            'مغلقة': '#95a5a6'
-        }
-        status_color = status_colors.get(status, '#95a5a6')
-        
-        status_badge = tk.Label(status_frame, text=status,
-                               font=('Arial', 9, 'bold'), fg='white',
-                               bg=status_color, padx=8, pady=2)
-        status_badge.pack(side='right')
-        
-        # آخر مُعدِّل
-        if modified_by_name:
-            modifier_label = tk.Label(card_frame, text=f"آخر تعديل: {modified_by_name}",
-                                    font=('Arial', 8), fg='#95a5a6', bg='#ffffff')
-            modifier_label.pack(anchor='e', padx=10, pady=(0, 10))
-        
-        # ربط النقر
-        def on_card_click(event, case_id=case_id):
-            self.select_case(case_id)
-        
-        card_frame.bind("<Button-1>", on_card_click)
-        name_label.bind("<Button-1>", on_card_click)
-        if category_name:
-            category_label.bind("<Button-1>", on_card_click)
-        status_badge.bind("<Button-1>", on_card_click)
-        if modified_by_name:
-            modifier_label.bind("<Button-1>", on_card_click)
-        
-        if return_widget:
-            return card_frame
+        # القائمة الافتراضية ترسم البطاقات الظاهرة فقط (انظر customer_issues_case_list)
+        self.main_window.update_cases_list()
     
+    @instrumented('load_case')
     def select_case(self, case_id):
         """اختيار حالة"""
         self.main_window.current_case_id = case_id
@@ -197,8 +111,8 @@ class EnhancedFunctions:
     def load_case_details(self, case_id):
         """تحميل تفاصيل الحالة"""
         try:
-            # تحميل البيانات الأساسية
-            case_details = enhanced_db.get_case_details(case_id)
+            # تحميل البيانات الأساسية (من الذاكرة المؤقتة عند التنقل بين الحالات)
+            case_details = self.main_window.get_case_details(case_id)
             
             if case_details:
                 # تحديث رأس العرض
@@ -212,14 +126,8 @@ class EnhancedFunctions:
                 # ملء البيانات الأساسية
                 self.fill_basic_data(case_details)
                 
-                # تحميل المرفقات
-                self.load_case_attachments(case_id)
-                
-                # تحميل المراسلات
-                self.load_case_correspondences(case_id)
-                
-                # تحميل سجل التعديلات
-                self.load_case_audit_log(case_id)
+                # المرفقات والمراسلات وسجل التعديلات تُحمّل عند فتح تبويبها
+                self.main_window.show_case_tabs(case_id)
         
         except Exception as e:
             print(f"خطأ في تحميل تفاصيل الحالة: {e}")
@@ -251,8 +159,9 @@ class EnhancedFunctions:
         # ملء الحقول النصية متعددة الأسطر
         text_areas = {
             'address': case_details[4] or '',
-            'problem_description': case_details[7] or '',
-            'actions_taken': case_details[8] or ''
+            # فك ضغط النص الكامل هنا فقط عند عرضه
+            'problem_description': str(case_details[7] or ''),
+            'actions_taken': str(case_details[8] or '')
         }
         
         for field_name, value in text_areas.items():
@@ -274,76 +183,6 @@ class EnhancedFunctions:
         if status_widget:
             status_widget.set(case_details[6] or '') # تحديث القيمة أو إفراغها
     
-    def load_case_attachments(self, case_id):
-        """تحميل مرفقات الحالة (النسخة المصححة)."""
-        try:
-            # مسح الجدول الحالي
-            for item in self.main_window.attachments_tree.get_children():
-                self.main_window.attachments_tree.delete(item)
-            
-            # get_attachments تعيد الآن قائمة من القواميس (dict) بالأسماء الصحيحة
-            attachments = enhanced_db.get_attachments(case_id)
-            
-            for att in attachments:
-                # إدخال البيانات بالترتيب الصحيح والمتوقع للجدول
-                self.main_window.attachments_tree.insert('', 'end', values=(
-                    att.get('id'),
-                    att.get('file_type'),
-                    att.get('file_name'),
-                    att.get('description'),
-                    att.get('upload_date'),
-                    att.get('uploaded_by_name'),
-                    att.get('file_path')  # المسار الكامل للملف
-                ))
-        
-        except Exception as e:
-            print(f"خطأ في تحميل المرفقات: {e}")
-    
-    def load_case_correspondences(self, case_id):
-        """تحميل مراسلات الحالة"""
-        try:
-            # مسح الجدول الحالي
-            for item in self.main_window.correspondences_tree.get_children():
-                self.main_window.correspondences_tree.delete(item)
-            
-            # تحميل المراسلات
-            correspondences = enhanced_db.get_case_correspondences(case_id)
-            
-            for correspondence in correspondences:
-                self.main_window.correspondences_tree.insert('', 'end', values=(
-                    correspondence[0],  # ID
-                    correspondence[2],  # case_sequence_number
-                    correspondence[3],  # yearly_sequence_number
-                    correspondence[4],  # sender
-                    correspondence[5][:50] + '...' if len(correspondence[5]) > 50 else correspondence[5],  # message_content (مقطوع)
-                    correspondence[6],  # sent_date
-                    correspondence[9] or ''  # created_by_name
-                ))
-        
-        except Exception as e:
-            print(f"خطأ في تحميل المراسلات: {e}")
-    
-    def load_case_audit_log(self, case_id):
-        """تحميل سجل تعديلات الحالة"""
-        try:
-            # مسح الجدول الحالي
-            for item in self.main_window.audit_tree.get_children():
-                self.main_window.audit_tree.delete(item)
-            
-            # تحميل سجل التعديلات
-            audit_logs = enhanced_db.get_case_audit_log(case_id)
-            
-            for log in audit_logs:
-                self.main_window.audit_tree.insert('', 'end', values=(
-                    log[5],  # timestamp
-                    log[7] or '',  # performed_by_name
-                    log[2],  # action_type
-                    log[3]   # action_description
-                ))
-        
-        except Exception as e:
-            print(f"خطأ في تحميل سجل التعديلات: {e}")
-    
     def filter_by_year(self, event=None):
         """فلترة حسب السنة"""
         selected_year = self.main_window.year_var.get()
@@ -408,7 +247,8 @@ class EnhancedFunctions:
         else:
             # تنفيذ البحث
             try:
-                search_results = enhanced_db.search_cases(search_type, search_value.strip())
+                case_filter = CaseFilter.from_sidebar(search_type, search_value, self.main_window.year_var.get())
+                search_results = enhanced_db.query_cases(case_filter)
                 self.main_window.filtered_cases = search_results
             except Exception as e:
                 print(f"خطأ في البحث: {e}")
@@ -0,0 +1,296 @@
+import os
+import sys
+import time
+import socket
+import hashlib
+import threading
+
+from customer_issues_background import BackgroundRunner
+
+# مجلد الملفات الجزئية داخل مخزن المحتوى (blobs/incoming)
+INCOMING_FOLDER = "incoming"
+PART_SUFFIX = ".part"
+
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+# الملفات الجزئية التي لم تُستكمل خلال هذه المدة تُحذف عند تنظيف المخزن
+PART_MAX_AGE = 7 * 24 * 3600
+
+
+class IngestCancelled(Exception):
+    """أُلغي النسخ (الملف الجزئي يبقى لاستكماله لاحقاً)"""
+
+
+class SourceChanged(Exception):
+    """تغير الملف المصدر أثناء النسخ"""
+
+
+def part_path_for(store_root, source_path):
+    """مسار الملف الجزئي لنسخ source_path
+
+    الاسم ثابت لنفس الملف (المسار والحجم ووقت التعديل) على نفس الجهاز، لذلك
+    يُستكمل النسخ المنقطع عند إضافة الملف مرة أخرى، ولا تتعارض أجهزة مختلفة
+    تنسخ إلى مجلد مرفقات مشترك.
+    """
+    source_path = os.path.abspath(source_path)
+    stat = os.stat(source_path)
+    key = f"{socket.gethostname()}|{source_path}|{stat.st_size}|{stat.st_mtime_ns}"
+    name = hashlib.sha1(key.encode('utf-8')).hexdigest() + PART_SUFFIX
+    return os.path.join(store_root, INCOMING_FOLDER, name)
+
+
+def _kernel_copy(method, source_fd, target_fd, offset, count):
+    """نسخ count بايت من الموضع offset داخل النواة (بدون المرور بذاكرة البرنامج)"""
+    if method == 'copy_file_range':
+        return os.copy_file_range(source_fd, target_fd, count, offset, offset)
+    os.lseek(target_fd, offset, os.SEEK_SET)
+    return os.sendfile(target_fd, source_fd, offset, count)
+
+
+def _copy_methods():
+    methods = []
+    if hasattr(os, 'copy_file_range'):
+        methods.append('copy_file_range')
+    if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        # sendfile إلى ملف عادي مدعوم في لينكس فقط
+        methods.append('sendfile')
+    return methods if hasattr(os, 'pread') else []
+
+
+def stream_copy(source_path, target_path, progress=None, cancel_event=None, chunk_size=COPY_CHUNK_SIZE):
+    """نسخ الملف على دفعات مع حساب بصمة SHA-256 أثناء النسخ
+
+    إذا كان target_path موجوداً (نسخ سابق منقطع) يُستكمل من نهايته. يُستخدم
+    copy_file_range أو sendfile حيث يتوفر، وإلا نسخ عادي بذاكرة واحدة. تُستدعى
+    progress(copied, total) بعد كل دفعة. تُرجع (البصمة، الحجم).
+    """
+    before = os.stat(source_path)
+    total = before.st_size
+    digest = hashlib.sha256()
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+
+    copied = 0
+    if os.path.exists(target_path) and os.path.getsize(target_path) <= total:
+        # البصمة تُكمل من محتوى الجزء المنسوخ سابقاً
+        with open(target_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                copied += len(chunk)
+        mode = 'r+b'
+    else:
+        mode = 'wb'
+
+    methods = _copy_methods()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(source_path, 'rb') as source, open(target_path, mode) as target:
+        source_fd = source.fileno()
+        target_fd = target.fileno()
+        target.seek(copied)
+        target.truncate()
+        if progress:
+            progress(copied, total)
+        while copied < total:
+            if cancel_event is not None and cancel_event.is_set():
+                raise IngestCancelled(source_path)
+            count = min(chunk_size, total - copied)
+            written = None
+            while methods and written is None:
+                try:
+                    written = _kernel_copy(methods[0], source_fd, target_fd, copied, count)
+                except OSError:
+                    # نظام الملفات لا يدعم هذه الطريقة (مثلاً بين قرصين أو على مشاركة شبكة)
+                    methods.pop(0)
+            if written is not None:
+                if written == 0:
+                    raise SourceChanged(source_path)
+                # البصمة تحتاج البيانات نفسها: قراءتها من ذاكرة النظام المؤقتة بعد النسخ مباشرة
+                digest.update(os.pread(source_fd, written, copied))
+            else:
+                source.seek(copied)
+                written = source.readinto(view[:count])
+                if not written:
+                    raise SourceChanged(source_path)
+                target.seek(copied)
+                target.write(view[:written])
+                digest.update(view[:written])
+            copied += written
+            if progress:
+                progress(copied, total)
+        target.flush()
+        os.fsync(target_fd)
+
+    after = os.stat(source_path)
+    if after.st_size != before.st_size or after.st_mtime_ns != before.st_mtime_ns:
+        os.remove(target_path)
+        raise SourceChanged(source_path)
+    return digest.hexdigest(), total
+
+
+def ingest_file(store, source_path, progress=None, cancel_event=None):
+    """نسخ ملف إلى مخزن المحتوى عبر ملف جزئي يُعاد تسميته بعد اكتمال النسخ فقط
+
+    تُرجع نفس نتيجة BlobStore.put_file.
+    """
+    part_path = part_path_for(store.root, source_path)
+    sha256, size = stream_copy(source_path, part_path, progress, cancel_event)
+    return store.adopt_file(part_path, sha256, size, os.path.splitext(source_path)[1])
+
+
+def discard_stale_parts(store_root, max_age=PART_MAX_AGE):
+    """حذف الملفات الجزئية المتروكة منذ أكثر من max_age ثانية، وإرجاع البايتات المحررة"""
+    folder = os.path.join(store_root, INCOMING_FOLDER)
+    if not os.path.isdir(folder):
+        return 0
+    freed = 0
+    cutoff = time.time() - max_age
+    for entry in os.scandir(folder):
+        if not entry.name.endswith(PART_SUFFIX):
+            continue
+        try:
+            stat = entry.stat()
+            if stat.st_mtime < cutoff:
+                os.remove(entry.path)
+                freed += stat.st_size
+        except OSError as e:
+            print(f"خطأ في حذف الملف الجزئي {entry.name}: {e}")
+    return freed
+
+
+class IngestJob:
+    """نسخ مرفق أو استيراد مجلد في الخلفية (التقدم يُقرأ من خيط الواجهة)"""
+
+    def __init__(self, source_path, unit='bytes'):
+        self.source_path = os.path.abspath(source_path)
+        self.file_name = os.path.basename(source_path)
+        # وحدة التقدم: 'bytes' لنسخ ملف و'files' لاستيراد مجلد
+        self.unit = unit
+        self.copied = 0
+        self.total = 0
+        self.started = False
+        self.cancel_event = threading.Event()
+        self.task = None
+
+    @property
+    def fraction(self):
+        return self.copied / self.total if self.total else 0.0
+
+    def update(self, copied, total):
+        # تُستدعى من خيط النسخ: تعيين أرقام فقط
+        self.copied = copied
+        self.total = total
+        self.started = True
+
+    def cancel(self):
+        """إيقاف النسخ عند الدفعة التالية"""
+        self.cancel_event.set()
+        if self.task is not None:
+            self.task.cancel()
+
+
+class AttachmentIngestQueue:
+    """طابور نسخ المرفقات إلى مخزن المحتوى في خيط خلفي
+
+    on_done(job, blob) وon_error(job, error) تُستدعيان في خيط الواجهة، وكذلك
+    on_progress(queue) كل poll_ms أثناء وجود نسخ جارٍ.
+    """
+
+    def __init__(self, root, max_workers=1, poll_ms=100, on_progress=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_progress = on_progress
+        self.runner = BackgroundRunner(root, max_workers=max_workers)
+        self.jobs = []
+        self._poll_job = None
+
+    def submit(self, store, source_path, on_done=None, on_error=None):
+        """إضافة ملف إلى الطابور (None إذا كان نفس الملف قيد النسخ بالفعل)"""
+        source_path = os.path.abspath(source_path)
+        if any(job.source_path == source_path for job in self.jobs):
+            return None
+        job = IngestJob(source_path)
+        job.task = self.runner.submit(
+            ingest_file, store, source_path, job.update, job.cancel_event,
+            on_done=lambda blob: self._finish(job, on_done, blob),
+            on_error=lambda error: self._finish(job, on_error, error)
+        )
+        self.jobs.append(job)
+        self._schedule_poll()
+        return job
+
+    def submit_folder(self, import_folder, folder, on_done=None, on_error=None, **options):
+        """استيراد مجلد في نفس الطابور: import_folder(folder, progress=..., cancel_event=..., **options)"""
+        folder = os.path.abspath(folder)
+        if any(job.source_path == folder for job in self.jobs):
+            return None
+        job = IngestJob(folder, unit='files')
+        job.task = self.runner.submit(
+            lambda: import_folder(folder, progress=job.update, cancel_event=job.cancel_event, **options),
+            on_done=lambda report: self._finish(job, on_done, report),
+            on_error=lambda error: self._finish(job, on_error, error)
+        )
+        self.jobs.append(job)
+        self._schedule_poll()
+        return job
+
+    def _finish(self, job, callback, result):
+        if job in self.jobs:
+            self.jobs.remove(job)
+        self._report()
+        if callback:
+            callback(job, result)
+
+    def _schedule_poll(self):
+        if self._poll_job is None and self.jobs:
+            try:
+                self._poll_job = self.root.after(self.poll_ms, self._poll)
+            except Exception:
+                # النافذة أُغلقت
+                self._poll_job = None
+
+    def _poll(self):
+        self._poll_job = None
+        self._report()
+        self._schedule_poll()
+
+    def _report(self):
+        if self.on_progress:
+            self.on_progress(self)
+
+    def status(self):
+        """(النسخ الجاري أو None، عدد الملفات المنتظرة)"""
+        running = [job for job in self.jobs if job.started]
+        current = running[0] if running else None
+        return current, len(self.jobs) - (1 if current else 0)
+
+    def cancel_all(self):
+        """إيقاف جميع عمليات النسخ (الملفات الجزئية تبقى للاستكمال)"""
+        for job in self.jobs:
+            job.cancel()
+        self.jobs = []
+        self._report()
+
+    @property
+    def active(self):
+        return bool(self.jobs)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("الاستخدام: python customer_issues_ingest.py <ملف> [files_path]")
+        sys.exit(1)
+    from customer_issues_database import enhanced_db
+    from customer_issues_blob_store import BlobStore, BLOB_FOLDER
+    from customer_issues_file_manager import FileManager, PROJECT_ROOT
+    files_path = os.path.abspath(sys.argv[2] if len(sys.argv) > 2 else os.path.join(PROJECT_ROOT, "files"))
+    format_size = FileManager(files_path).format_size
+    started = time.perf_counter()
+    blob = ingest_file(BlobStore(enhanced_db, os.path.join(files_path, BLOB_FOLDER)), sys.argv[1],
+                       progress=lambda copied, total: print(f"\r{format_size(copied)} / {format_size(total)}", end=''))
+    elapsed = time.perf_counter() - started
+    print()
+    print(f"البصمة: {blob['sha256']} - {'جديد' if blob['stored'] else 'موجود مسبقاً'} - {elapsed:.2f} ثانية")
+    print(f"المسار: {blob['path']}")
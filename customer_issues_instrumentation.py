@@ -0,0 +1,214 @@
+import os
+import math
+import json
+import time
+import socket
+import logging
+import threading
+import functools
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# ملف قياسات الواجهة (سطر JSON لكل سجل) لتجميعه من عدة أجهزة
+DEFAULT_LATENCY_LOG = os.path.join('logs', 'ui_latency.jsonl')
+
+_monitor = None
+
+
+def percentile(sorted_values, fraction):
+    """قيمة النسبة المئوية من قائمة مرتبة (أقرب ترتيب)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class UILatencyMonitor:
+    """قياس استجابة حلقة أحداث Tk وزمن إجراءات الواجهة
+
+    - نبضة دورية بـ root.after كل interval_ms: أي تأخير للنبضة أكبر من
+      stall_threshold_ms يُسجل كتجمد مع الإجراءات التي نُفذت خلاله.
+    - الإجراءات المعلمة بـ instrumented() تُقاس أزمنتها وتُكتب النسب المئوية
+      (p50/p90/p99) كل flush_seconds ثانية في ملف JSONL دوّار.
+    - record_latency() لأزمنة تشمل انتظاراً أو عملاً في الخلفية (مثل زمن البحث
+      الكلي): تُكتب في الملخص ولا تدخل في تحديد سبب التجمد.
+    """
+
+    def __init__(self, root, log_path=DEFAULT_LATENCY_LOG, interval_ms=100, stall_threshold_ms=250,
+                 flush_seconds=60, max_bytes=1024 * 1024, backup_count=5):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.stall_threshold_ms = stall_threshold_ms
+        self.flush_seconds = flush_seconds
+        self.workstation = socket.gethostname()
+        self.current_action = None
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._stalls = []
+        self._actions_since_beat = []
+        self._window_start = datetime.now()
+        self._last_flush = time.monotonic()
+        self._expected_beat = None
+        self._job = None
+        self.logger = self._create_logger(log_path, max_bytes, backup_count)
+
+    def _create_logger(self, log_path, max_bytes, backup_count):
+        directory = os.path.dirname(log_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        logger = logging.getLogger(f"customer_issues.ui_latency.{id(self)}")
+        logger.setLevel(logging.INFO)
+        # لا نريد هذه الأسطر في سجل التطبيق العام
+        logger.propagate = False
+        handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        return logger
+
+    def start(self):
+        """بدء النبضات الدورية"""
+        self._expected_beat = time.monotonic() + self.interval_ms / 1000
+        self._job = self.root.after(self.interval_ms, self._heartbeat)
+        return self
+
+    def stop(self):
+        """إيقاف النبضات وكتابة القياسات المتبقية"""
+        if self._job is not None:
+            try:
+                self.root.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+        self.flush()
+        for handler in list(self.logger.handlers):
+            handler.close()
+            self.logger.removeHandler(handler)
+
+    def _heartbeat(self):
+        now = time.monotonic()
+        delay_ms = (now - self._expected_beat) * 1000
+        with self._lock:
+            actions = self._actions_since_beat
+            self._actions_since_beat = []
+        if delay_ms > self.stall_threshold_ms:
+            self._record_stall(delay_ms, actions)
+        if now - self._last_flush >= self.flush_seconds:
+            self.flush()
+        self._expected_beat = now + self.interval_ms / 1000
+        try:
+            self._job = self.root.after(self.interval_ms, self._heartbeat)
+        except Exception:
+            # النافذة أُغلقت
+            self._job = None
+
+    def _record_stall(self, delay_ms, actions):
+        # الإجراء الأطول خلال فترة التجمد هو المسؤول الأرجح
+        culprit = max(actions, key=lambda item: item[1])[0] if actions else self.current_action
+        stall = {
+            'type': 'stall',
+            'workstation': self.workstation,
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'stall_ms': round(delay_ms, 1),
+            'action': culprit,
+            'actions': [{'action': name, 'ms': round(ms, 1)} for name, ms in actions]
+        }
+        self._stalls.append(stall)
+        self.logger.info(json.dumps(stall, ensure_ascii=False))
+
+    def record(self, action, elapsed_ms):
+        """تسجيل زمن تنفيذ إجراء في خيط الواجهة (مرشح لتفسير التجمد)"""
+        with self._lock:
+            self._durations.setdefault(action, []).append(elapsed_ms)
+            self._actions_since_beat.append((action, elapsed_ms))
+
+    def record_latency(self, metric, elapsed_ms):
+        """تسجيل زمن لا يحجز خيط الواجهة (انتظار وعمل في الخلفية)
+
+        يظهر في الملخص فقط ولا يُنسب إليه أي تجمد.
+        """
+        with self._lock:
+            self._durations.setdefault(metric, []).append(elapsed_ms)
+
+    def action(self, name):
+        """سياق لقياس إجراء: with monitor.action('save_changes'): ..."""
+        return _ActionTimer(self, name)
+
+    def summary(self):
+        """النسب المئوية لأزمنة كل إجراء منذ آخر كتابة"""
+        with self._lock:
+            durations = {name: sorted(values) for name, values in self._durations.items() if values}
+        return {
+            name: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 0.50), 1),
+                'p90_ms': round(percentile(values, 0.90), 1),
+                'p99_ms': round(percentile(values, 0.99), 1),
+                'max_ms': round(values[-1], 1)
+            }
+            for name, values in durations.items()
+        }
+
+    def flush(self):
+        """كتابة ملخص الفترة الحالية وبدء فترة جديدة"""
+        actions = self.summary()
+        stalls = self._stalls
+        if actions or stalls:
+            record = {
+                'type': 'summary',
+                'workstation': self.workstation,
+                'window_start': self._window_start.isoformat(timespec='seconds'),
+                'window_end': datetime.now().isoformat(timespec='seconds'),
+                'actions': actions,
+                'stalls': len(stalls),
+                'max_stall_ms': max((stall['stall_ms'] for stall in stalls), default=0)
+            }
+            self.logger.info(json.dumps(record, ensure_ascii=False))
+        with self._lock:
+            self._durations = {}
+        self._stalls = []
+        self._window_start = datetime.now()
+        self._last_flush = time.monotonic()
+
+
+class _ActionTimer:
+    def __init__(self, monitor, name):
+        self.monitor = monitor
+        self.name = name
+        self.previous = None
+        self.started = None
+
+    def __enter__(self):
+        self.previous = self.monitor.current_action
+        self.monitor.current_action = self.name
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.monitor.record(self.name, (time.perf_counter() - self.started) * 1000)
+        self.monitor.current_action = self.previous
+        return False
+
+
+def install_monitor(root, **options):
+    """إنشاء مراقب الواجهة وتشغيله (مرة واحدة لكل تطبيق)"""
+    global _monitor
+    if _monitor is None:
+        _monitor = UILatencyMonitor(root, **options).start()
+    return _monitor
+
+
+def get_monitor():
+    return _monitor
+
+
+def instrumented(action):
+    """مُزخرف لقياس زمن دالة من دوال الواجهة باسم الإجراء (لا يفعل شيئاً قبل install_monitor)"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _monitor is None:
+                return function(*args, **kwargs)
+            with _monitor.action(action):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
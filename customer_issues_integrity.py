@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from customer_issues_blob_store import BlobStore, hash_file, resolve_stored_path
+from customer_issues_storage_index import check_directory_rows
+
+# تقارير الفحص تُحفظ في هذا المجلد (ملف JSON لكل فحص)
+DEFAULT_REPORT_FOLDER = 'logs'
+
+# مجلدات الشبكة بطيئة الاستجابة: عدة مجلدات تُقرأ في نفس الوقت
+DEFAULT_SCAN_WORKERS = 8
+
+
+class AttachmentIntegrityScanner:
+    """فحص ملفات جميع المرفقات وإعادة ربط الملفات المنقولة
+
+    كل مجلد يُقرأ مرة واحدة (os.scandir) والمجلدات تُقرأ بالتوازي. الملف المفقود
+    يُبحث عنه في search_roots: الملفات التي بنفس الحجم فقط تُحسب بصمتها، والملف
+    الذي تطابق بصمته بصمة المرفق يُربط بدلاً من المفقود (أو يُعاد إلى مخزن المحتوى
+    إذا كان المفقود ملف محتوى).
+    """
+
+    def __init__(self, database, project_root, search_roots=(), max_workers=DEFAULT_SCAN_WORKERS):
+        self.database = database
+        self.project_root = project_root
+        self.search_roots = [os.path.abspath(root) for root in search_roots if root and os.path.isdir(root)]
+        self.max_workers = max_workers
+
+    def scan(self, relink=True, progress=None, cancel_event=None):
+        """فحص المرفقات وإرجاع التقرير
+
+        progress(done, total) بعدد المجلدات المفحوصة.
+        """
+        started = time.perf_counter()
+        report = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'search_roots': self.search_roots,
+            'checked': 0, 'ok': 0,
+            'missing': [], 'changed': [], 'relinked': [], 'restored': [], 'unresolved': []
+        }
+        rows_by_directory = {}
+        for row in self.database.get_storage_index_rows():
+            path = resolve_stored_path(row[2], self.project_root)
+            if path:
+                rows_by_directory.setdefault(os.path.dirname(path), []).append((path, row))
+
+        index_updates = []
+        missing = []
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._check_directory, item) for item in rows_by_directory.items()]
+            for future in futures:
+                directory_result = future.result()
+                done += 1
+                if progress:
+                    progress(done, len(rows_by_directory))
+                for status, entry, update in directory_result:
+                    report['checked'] += 1
+                    if update:
+                        index_updates.append(update)
+                    if status == 'ok':
+                        report['ok'] += 1
+                    elif status == 'changed':
+                        report['changed'].append(entry)
+                    else:
+                        missing.append(entry)
+                if cancel_event is not None and cancel_event.is_set():
+                    # المجلدات التي لم تبدأ تُلغى، والجارية تنتهي عند الخروج من with
+                    for pending in futures:
+                        pending.cancel()
+                    break
+        if index_updates:
+            self.database.update_storage_index(index_updates)
+        report['missing'] = [dict(entry) for entry in missing]
+
+        if relink and missing and self.search_roots and not (cancel_event is not None and cancel_event.is_set()):
+            self._relink(missing, report)
+        else:
+            report['unresolved'] = [entry['attachment_id'] for entry in missing]
+        report['seconds'] = round(time.perf_counter() - started, 2)
+        return report
+
+    def _check_directory(self, item):
+        """فحص مرفقات مجلد واحد: [(الحالة، بيانات المرفق، تحديث فهرس التخزين)]"""
+        directory, rows = item
+        results = []
+        # ملفات المخزن تُعاد قراءة بصمتها هنا أيضاً لكشف أي تلف في محتواها
+        for status, path, row, current, current_hash in check_directory_rows(directory, rows, verify_blobs=True):
+            attachment_id, case_id, file_path, blob_hash, size, mtime, sha256, missing, indexed = row
+            entry = {'attachment_id': attachment_id, 'case_id': case_id, 'path': path,
+                     'sha256': sha256 or blob_hash, 'size': size, 'blob': bool(blob_hash)}
+            if status == 'missing':
+                update = None if indexed and missing else (attachment_id, case_id, size, mtime, entry['sha256'], 1)
+                results.append(('missing', entry, update))
+                continue
+            if status == 'unchanged':
+                results.append(('ok', entry, None))
+                continue
+            if status == 'unreadable':
+                results.append(('missing', entry, None))
+                continue
+            expected = sha256 or blob_hash
+            status = 'changed' if expected and current_hash != expected else 'ok'
+            if status == 'changed':
+                entry['current_sha256'] = current_hash
+                entry['current_size'] = current[0]
+            if status == 'changed' and blob_hash:
+                # ملف المحتوى يجب ألا يتغير أبداً: يبقى الفهرس كما هو فيظهر في كل فحص حتى يُصلح
+                results.append((status, entry, None))
+                continue
+            # الملف المرتبط المعدل يُبلغ عنه مرة واحدة ويصبح محتواه الجديد هو المرجع
+            results.append((status, entry, (attachment_id, case_id, current[0], current[1], current_hash, 0)))
+        return results
+
+    def _relink(self, missing, report):
+        """البحث عن الملفات المفقودة في search_roots بالحجم ثم البصمة"""
+        wanted_sizes = {entry['size'] for entry in missing if entry['sha256'] and entry['size'] is not None}
+        candidates = {}
+        for root in self.search_roots:
+            for path, size in self._walk_files(root):
+                if size in wanted_sizes:
+                    candidates.setdefault(size, []).append(path)
+
+        hashes = {}
+        to_hash = [path for paths in candidates.values() for path in paths]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for path, digest in zip(to_hash, executor.map(self._safe_hash, to_hash)):
+                if digest:
+                    hashes.setdefault(digest, []).append(path)
+
+        for entry in missing:
+            matches = hashes.get(entry['sha256']) if entry['sha256'] else None
+            if not matches:
+                report['unresolved'].append(entry['attachment_id'])
+                continue
+            # الملف الذي بنفس اسم المفقود مفضل عند وجود عدة نسخ
+            same_name = [path for path in matches if os.path.basename(path) == os.path.basename(entry['path'])]
+            found = (same_name or matches)[0]
+            try:
+                if entry['blob']:
+                    self._restore_blob(entry, found)
+                    report['restored'].append({'attachment_id': entry['attachment_id'], 'path': entry['path'], 'source': found})
+                else:
+                    stat = os.stat(found)
+                    self.database.relink_attachment(entry['attachment_id'], entry['case_id'], found,
+                                                    stat.st_size, stat.st_mtime, entry['sha256'])
+                    report['relinked'].append({'attachment_id': entry['attachment_id'], 'old_path': entry['path'], 'new_path': found})
+            except OSError as e:
+                print(f"خطأ في إعادة ربط المرفق {entry['attachment_id']}: {e}")
+                report['unresolved'].append(entry['attachment_id'])
+
+    def _restore_blob(self, entry, source):
+        """إعادة ملف المحتوى المفقود إلى مكانه في المخزن من نسخة مطابقة"""
+        blob_root = os.path.dirname(os.path.dirname(entry['path']))
+        blob = BlobStore(self.database, blob_root).put_file(source)
+        if blob['path'] != entry['path']:
+            os.replace(blob['path'], entry['path'])
+            self.database.update_blob_path(blob['sha256'], entry['path'])
+        stat = os.stat(entry['path'])
+        self.database.update_storage_index([(entry['attachment_id'], entry['case_id'], stat.st_size, stat.st_mtime, entry['sha256'], 0)])
+
+    @staticmethod
+    def _safe_hash(path):
+        try:
+            return hash_file(path)[0]
+        except OSError:
+            return None
+
+    @staticmethod
+    def _walk_files(root):
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                pending.append(entry.path)
+                            elif entry.is_file():
+                                yield entry.path, entry.stat().st_size
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+
+
+def save_report(report, folder=DEFAULT_REPORT_FOLDER):
+    """حفظ تقرير الفحص كملف JSON وإرجاع مساره"""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"attachment_integrity_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def format_report(report):
+    """ملخص نصي للتقرير"""
+    lines = [
+        f"المرفقات المفحوصة: {report['checked']} ({report['seconds']} ثانية)",
+        f"سليمة: {report['ok']}",
+        f"تغير محتواها: {len(report['changed'])}",
+        f"مفقودة: {len(report['missing'])}",
+        f"أعيد ربطها: {len(report['relinked'])} - أعيدت إلى المخزن: {len(report['restored'])}",
+        f"لم يُعثر عليها: {len(report['unresolved'])}"
+    ]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        print("الاستخدام: python customer_issues_integrity.py [مجلد_بحث ...] [--no-relink]")
+        sys.exit(0)
+    from customer_issues_database import enhanced_db
+    from customer_issues_file_manager import PROJECT_ROOT
+    roots = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not roots:
+        try:
+            with open(os.path.join(PROJECT_ROOT, 'config.json'), 'r', encoding='utf-8') as f:
+                roots = json.load(f).get('relink_search_roots', [])
+        except (OSError, ValueError):
+            roots = []
+    scanner = AttachmentIntegrityScanner(enhanced_db, PROJECT_ROOT, roots)
+    result = scanner.scan(relink='--no-relink' not in sys.argv)
+    print(format_report(result))
+    print(f"التقرير: {save_report(result)}")
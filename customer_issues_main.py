@@ -14,14 +14,17 @@ VERSION = "3.0.0"
 
 import sys
 import os
+import json
 import logging
 import tkinter as tk
 from tkinter import messagebox
 import sqlite3
-from datetime import datetime
 import shutil
+from datetime import datetime
 import platform
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # إعداد المسارات
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -75,17 +78,82 @@ def check_requirements():
     logging.info("✅ تم فحص جميع المتطلبات بنجاح")
     return True
 
+class StartupTimer:
+    """قياس زمن كل مرحلة من مراحل التشغيل حتى تصبح الواجهة جاهزة للاستخدام"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def phase(self, name, function, *args):
+        """تنفيذ مرحلة وتسجيل زمنها (آمنة للاستدعاء من عدة خيوط)"""
+        phase_start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = (time.perf_counter() - phase_start) * 1000
+            self.phases[name] = elapsed
+            logging.info(f"⏱ مرحلة التشغيل '{name}': {elapsed:.0f} ms")
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def report(self):
+        """تسجيل زمن الجاهزية الكلي وملخص المراحل"""
+        phases = ', '.join(f"{name}={ms:.0f}ms" for name, ms in self.phases.items())
+        logging.info(f"✅ زمن الجاهزية للاستخدام: {self.elapsed_ms():.0f} ms ({phases})")
+
+# النسخة الاحتياطية تُكتب بهذا الامتداد ولا تأخذ اسمها النهائي إلا بعد اكتمالها
+BACKUP_PART_SUFFIX = '.part'
+
+def backup_database_file(db_path, backup_path):
+    """نسخ ملف قاعدة بيانات بواجهة النسخ في SQLite (نسخة متسقة حتى لو كانت الواجهة تكتب في نفس الوقت)"""
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(backup_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def remove_backup_entry(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
 def create_backup():
-    """إنشاء نسخة احتياطية"""
+    """إنشاء نسخة احتياطية من جميع ملفات قاعدة البيانات
+
+    ملف واحد: backups/customer_issues_backup_<الوقت>.db، والملفات السنوية:
+    مجلد backups/customer_issues_backup_<الوقت>/ يحتوي الملف المرجعي وكل ملفات السنوات.
+    النسخة تُكتب باسم مؤقت (.part) وتُعاد تسميتها بعد اكتمالها، والنسخ الناقصة من
+    تشغيل سابق انقطع تُحذف ولا تُحسب ضمن النسخ المحفوظة.
+    """
     try:
+        from customer_issues_database import enhanced_db
+        from customer_issues_sharding import ShardedDatabaseManager
         backup_dir = os.path.join(CURRENT_DIR, 'backups')
         os.makedirs(backup_dir, exist_ok=True)
         
-        db_path = os.path.join(CURRENT_DIR, 'customer_issues_enhanced.db')
-        if os.path.exists(db_path):
+        for entry in os.listdir(backup_dir):
+            if entry.startswith('customer_issues_backup_') and entry.endswith(BACKUP_PART_SUFFIX):
+                remove_backup_entry(os.path.join(backup_dir, entry))
+        
+        db_files = [path for path in enhanced_db.database_files() if os.path.exists(path)]
+        if db_files:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = os.path.join(backup_dir, f'customer_issues_backup_{timestamp}.db')
-            shutil.copy2(db_path, backup_path)
+            if isinstance(enhanced_db, ShardedDatabaseManager):
+                backup_path = os.path.join(backup_dir, f'customer_issues_backup_{timestamp}')
+                part_path = backup_path + BACKUP_PART_SUFFIX
+                os.makedirs(part_path, exist_ok=True)
+                for db_path in db_files:
+                    backup_database_file(db_path, os.path.join(part_path, os.path.basename(db_path)))
+            else:
+                backup_path = os.path.join(backup_dir, f'customer_issues_backup_{timestamp}.db')
+                part_path = backup_path + BACKUP_PART_SUFFIX
+                backup_database_file(db_files[0], part_path)
+            os.replace(part_path, backup_path)
             logging.info(f"تم إنشاء نسخة احتياطية: {backup_path}")
             
             # تنظيف النسخ القديمة (الاحتفاظ بـ 10 نسخ)
@@ -93,8 +161,7 @@ def create_backup():
             if len(backup_files) > 10:
                 backup_files.sort()
                 for old_backup in backup_files[:-10]:
-                    old_path = os.path.join(backup_dir, old_backup)
-                    os.remove(old_path)
+                    remove_backup_entry(os.path.join(backup_dir, old_backup))
                     logging.info(f"تم حذف النسخة الاحتياطية القديمة: {old_backup}")
         
         return True
@@ -102,33 +169,129 @@ def create_backup():
         logging.error(f"خطأ في إنشاء النسخة الاحتياطية: {e}")
         return False
 
-def initialize_system():
-    """تهيئة النظام"""
-    logging.info("بدء تهيئة النظام...")
-    
-    # إنشاء المجلدات الأساسية
+def backup_files_tree(cancel_event=None):
+    """لقطة يومية لمجلدات المرفقات (الملفات غير المتغيرة تُربط باللقطة السابقة بدلاً من نسخها)
+
+    cancel_event يوقف اللقطة الجارية عند إغلاق البرنامج (تُعاد في التشغيل التالي).
+    """
+    try:
+        from customer_issues_snapshots import snapshot_if_due, SnapshotCancelled, DEFAULT_SNAPSHOT_FOLDER
+        sources = {'files': os.path.join(CURRENT_DIR, 'files')}
+        try:
+            with open(os.path.join(CURRENT_DIR, 'config.json'), 'r', encoding='utf-8') as f:
+                attachments_path = json.load(f).get('attachments_path')
+        except (OSError, ValueError):
+            attachments_path = None
+        if attachments_path and os.path.isdir(attachments_path) and \
+                os.path.abspath(attachments_path) != os.path.abspath(sources['files']):
+            sources['attachments'] = attachments_path
+        
+        for name, source in sources.items():
+            if not os.path.isdir(source):
+                continue
+            backup_root = os.path.join(CURRENT_DIR, DEFAULT_SNAPSHOT_FOLDER) if name == 'files' \
+                else os.path.join(CURRENT_DIR, 'backups', name)
+            try:
+                report = snapshot_if_due(source, backup_root, cancel_event=cancel_event)
+            except SnapshotCancelled:
+                logging.info(f"أُوقفت لقطة {name} عند الإغلاق وستُعاد في التشغيل التالي")
+                return True
+            if report:
+                logging.info(f"تم إنشاء لقطة {name}: {report['name']} - منسوخة {report['copied']} "
+                             f"- مرتبطة {report['linked']} - محذوفة {len(report['pruned']['removed'])}")
+        return True
+    except Exception as e:
+        logging.error(f"خطأ في إنشاء لقطة المرفقات: {e}")
+        return False
+
+def run_deferred_backups(timer, cancel_event):
+    timer.phase('backup', create_backup)
+    if not cancel_event.is_set():
+        timer.phase('files_backup', backup_files_tree, cancel_event)
+
+def start_deferred_backup(timer, cancel_event):
+    """النسخة الاحتياطية عند التشغيل تُنفذ في الخلفية بعد ظهور الواجهة
+
+    الخيط ليس daemon حتى لا يُقطع أثناء الكتابة: عند الإغلاق يُضبط cancel_event
+    ثم يُنتظر الخيط (stop_deferred_backup) فتُحذف اللقطة الناقصة ويُحرر قفلها.
+    """
+    thread = threading.Thread(target=run_deferred_backups, args=(timer, cancel_event), name='startup-backup')
+    thread.start()
+    return thread
+
+def stop_deferred_backup(threads, cancel_event):
+    """إيقاف لقطة المرفقات الجارية وانتظار انتهاء خيوط النسخ الاحتياطي"""
+    cancel_event.set()
+    for thread in threads:
+        thread.join()
+
+def prepare_directories():
+    """إنشاء/فحص المجلدات الأساسية"""
     dirs_to_create = ['files', 'backups', 'reports', 'logs']
     for dir_name in dirs_to_create:
         dir_path = os.path.join(CURRENT_DIR, dir_name)
         os.makedirs(dir_path, exist_ok=True)
         logging.info(f"تم إنشاء/فحص المجلد: {dir_path}")
+
+def open_database():
+    """تهيئة قاعدة البيانات (استيراد الوحدة يُنشئ المدير ويتجاوز التهيئة إذا كان المخطط حديثاً)"""
+    from customer_issues_database import enhanced_db
+    return enhanced_db
+
+def warm_up_reference_data():
+    """قراءة البيانات المرجعية مسبقاً حتى تكون صفحات الملف في ذاكرة النظام"""
+    db_manager = open_database()
+    db_manager.get_employees()
+    db_manager.get_categories()
+    db_manager.get_case_years()
+
+def import_main_window():
+    """استيراد وحدة الواجهة الرئيسية ووحداتها التابعة"""
+    from customer_issues_window import EnhancedMainWindow
+    return EnhancedMainWindow
+
+def initialize_system(timer, splash=None):
+    """تهيئة النظام: تنفيذ المراحل المستقلة بالتوازي مع إبقاء شاشة البداية مستجيبة
+
+    تُرجع صنف النافذة الرئيسية أو None عند الفشل.
+    """
+    logging.info("بدء تهيئة النظام...")
     
-    # إنشاء نسخة احتياطية
-    create_backup()
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix='startup') as executor:
+        futures = {
+            'directories': executor.submit(timer.phase, 'directories', prepare_directories),
+            'database': executor.submit(timer.phase, 'database', open_database),
+            'reference_data': executor.submit(timer.phase, 'reference_data', warm_up_reference_data),
+            'window_import': executor.submit(timer.phase, 'window_import', import_main_window)
+        }
+        while not all(future.done() for future in futures.values()):
+            if splash is not None:
+                splash.update()
+            time.sleep(0.02)
     
-    # تهيئة قاعدة البيانات
     try:
-        from customer_issues_database import DatabaseManager
-        db_manager = DatabaseManager()
-        db_manager.init_database()
+        futures['database'].result()
         logging.info("✅ تم تهيئة قاعدة البيانات بنجاح")
     except Exception as e:
         logging.error(f"خطأ في تهيئة قاعدة البيانات: {e}")
         messagebox.showerror("خطأ في قاعدة البيانات", f"فشل في تهيئة قاعدة البيانات:\n{e}")
-        return False
+        return None
+    
+    try:
+        window_class = futures['window_import'].result()
+    except ImportError as e:
+        logging.error(f"خطأ في استيراد الواجهة الرئيسية: {e}")
+        messagebox.showerror("خطأ في النظام", f"فشل في تحميل الواجهة الرئيسية:\n{e}")
+        return None
+    
+    for name in ('directories', 'reference_data'):
+        # فشل هذه المراحل لا يمنع التشغيل
+        error = futures[name].exception()
+        if error:
+            logging.error(f"خطأ في مرحلة التشغيل '{name}': {error}")
     
     logging.info("✅ تم تهيئة النظام بنجاح")
-    return True
+    return window_class
 
 def show_splash_screen():
     """عرض شاشة البداية"""
@@ -250,50 +413,43 @@ def main():
     logging.info(f"إصدار Python: {sys.version}")
     logging.info("=" * 50)
     
-    # إنشاء نافذة root مخفية
+    timer = StartupTimer()
+    backup_cancel = threading.Event()
+    backup_threads = []
+    
+    # إنشاء نافذة root مخفية (تصبح النافذة الرئيسية بعد التهيئة)
     root = tk.Tk()
     root.withdraw()
     
     try:
         # عرض شاشة البداية
-        splash = show_splash_screen()
-        splash.update()
+        splash = timer.phase('splash', show_splash_screen)
         
         # فحص المتطلبات
-        if not check_requirements():
+        if not timer.phase('requirements', check_requirements):
             splash.destroy()
             return 1
         
         # تهيئة النظام
-        splash.update()
-        if not initialize_system():
+        window_class = initialize_system(timer, splash)
+        if window_class is None:
             splash.destroy()
             return 1
         
-        # استيراد وتشغيل الواجهة الرئيسية
-        splash.update()
-        time.sleep(5)  # عرض splash screen لمدة 3 ثواني
-        try:
-            from customer_issues_window import EnhancedMainWindow
-            
-            # إغلاق شاشة البداية
+        # تطبيق النافذة الرئيسية على نفس الجذر المخفي
+        app = timer.phase('main_window', window_class, root)
+        
+        def on_ready():
+            # الصفحة الأولى جاهزة: إغلاق شاشة البداية وإظهار النافذة
             splash.destroy()
-            
-            # إظهار النافذة الرئيسية
-            root.destroy()  # Destroy the hidden root window
-            
-            # تطبيق النافذة الرئيسية
-            app = EnhancedMainWindow()
-            
-            logging.info("✅ تم تشغيل النظام بنجاح")
-            
-            # بدء حلقة الأحداث الرئيسية
-            app.run()
-            
-        except ImportError as e:
-            logging.error(f"خطأ في استيراد الواجهة الرئيسية: {e}")
-            messagebox.showerror("خطأ في النظام", f"فشل في تحميل الواجهة الرئيسية:\n{e}")
-            return 1
+            root.deiconify()
+            timer.report()
+            backup_threads.append(start_deferred_backup(timer, backup_cancel))
+        
+        logging.info("✅ تم تشغيل النظام بنجاح")
+        
+        # بدء حلقة الأحداث الرئيسية
+        app.run(on_ready=on_ready)
         
     except Exception as e:
         logging.error(f"خطأ عام في النظام: {e}")
@@ -301,6 +457,8 @@ def main():
         return 1
     
     finally:
+        # النسخ الجاري في الخلفية يُنهى أولاً حتى لا يُقطع في منتصفه
+        stop_deferred_backup(backup_threads, backup_cancel)
         # إنشاء نسخة احتياطية عند الإغلاق
         create_backup()
         logging.info("تم إغلاق النظام")
@@ -0,0 +1,336 @@
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+
+from customer_issues_filters import CaseFilter
+
+# أعمدة الجدول: (مفتاح الحالة، العنوان، اسم الترتيب في CASE_ORDER_BY بدون الاتجاه)
+DEFAULT_CASE_COLUMNS = (
+    ('customer_name', "اسم العميل", 'name'),
+    ('subscriber_number', "رقم المشترك", 'subscriber'),
+    ('category_name', "تصنيف المشكلة", 'category'),
+    ('status', "حالة المشكلة", 'status'),
+    ('created_date', "تاريخ الإضافة", 'created')
+)
+
+# التواريخ تُعرض افتراضياً من الأحدث
+DESCENDING_FIRST = {'created', 'modified'}
+
+
+class CasePageSource:
+    """مصدر صفحات الحالات لفلتر محدد (العد والصفحات من قاعدة البيانات)"""
+
+    def __init__(self, database, case_filter, page_size=100):
+        self.database = database
+        self.case_filter = case_filter
+        self.page_size = page_size
+
+    def count(self):
+        return self.database.count_cases(self.case_filter)
+
+    def fetch_page(self, page):
+        return self.database.query_cases(
+            self.case_filter.copy(limit=self.page_size, offset=page * self.page_size))
+
+
+class PagedCaseTable:
+    """جدول Treeview افتراضي لعرض أعداد كبيرة من الحالات
+
+    الجدول يحتوي صفوف الجزء الظاهر فقط، وشريط التمرير يمثل العدد الكلي للحالات.
+    عند التمرير تُجلب الصفحات المطلوبة (وصفحة مجاورة) في خيط خلفي وتُحفظ في ذاكرة
+    مؤقتة محدودة، وتظهر الصفوف غير المحملة بعد كـ "…". الترتيب بالنقر على رأس
+    العمود والفلترة بالنص يُنفذان في الاستعلام نفسه.
+    on_first_page تُستدعى مرة واحدة عند رسم أول صفحة (أو فشل تحميلها).
+    """
+
+    def __init__(self, parent, database, runner, case_filter=None, columns=DEFAULT_CASE_COLUMNS,
+                 page_size=100, max_pages=50, column_width=170, filter_delay_ms=300, on_first_page=None):
+        self.database = database
+        self.runner = runner
+        self.base_filter = case_filter or CaseFilter()
+        self.columns = columns
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.filter_delay_ms = filter_delay_ms
+        self.case_filter = self.base_filter
+        self.source = None
+        self.total = None
+        self.top = 0
+        self.rows = 20
+        self.selected_id = None
+        self._pages = OrderedDict()
+        self._pending = {}
+        self._count_task = None
+        self._generation = 0
+        self._filter_job = None
+        self.on_first_page = on_first_page
+
+        self.frame = tk.Frame(parent, bg=parent.cget('bg'))
+        filter_frame = tk.Frame(self.frame, bg=parent.cget('bg'))
+        filter_frame.pack(fill='x', pady=(0, 5))
+        tk.Label(filter_frame, text="تصفية:", bg=parent.cget('bg')).pack(side='right')
+        self.filter_var = tk.StringVar()
+        filter_entry = tk.Entry(filter_frame, textvariable=self.filter_var)
+        filter_entry.pack(side='right', fill='x', expand=True, padx=5)
+        filter_entry.bind('<KeyRelease>', self._on_filter_typed)
+        self.status_label = tk.Label(filter_frame, text="", fg='#7f8c8d', bg=parent.cget('bg'))
+        self.status_label.pack(side='left')
+
+        table_frame = tk.Frame(self.frame)
+        table_frame.pack(fill='both', expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=[column[1] for column in columns],
+                                 show='headings', selectmode='browse')
+        for key, title, order in columns:
+            self.tree.heading(title, text=title, command=lambda order=order: self.sort_by(order))
+            self.tree.column(title, width=column_width)
+        self.scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self._on_scrollbar)
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.scrollbar.pack(side='right', fill='y')
+        self.row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self._scroll_units(-3))
+        self.tree.bind('<Button-5>', lambda e: self._scroll_units(3))
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        for key, delta in (('<Up>', -1), ('<Down>', 1), ('<Prior>', 'page_up'), ('<Next>', 'page_down')):
+            self.tree.bind(key, lambda e, delta=delta: self._on_key(delta))
+        self.frame.bind('<Destroy>', self._on_destroy)
+
+        self.reload()
+
+    def pack(self, **options):
+        self.frame.pack(**options)
+        return self
+
+    # ---- البيانات ----
+
+    def reload(self, case_filter=None):
+        """إعادة التحميل بفلتر جديد (أو نفس الفلتر بعد تغيير البيانات)"""
+        if case_filter is not None:
+            self.case_filter = case_filter
+        self._cancel_pending()
+        self._generation += 1
+        self._pages.clear()
+        self.source = CasePageSource(self.database, self.case_filter, self.page_size)
+        self.total = None
+        self.top = 0
+        generation = self._generation
+        self._count_task = self.runner.submit(
+            self.source.count,
+            on_done=lambda total: self._on_count(generation, total),
+            on_error=lambda error: self._on_error(generation, error)
+        )
+        self._update_status()
+        self.render()
+
+    def sort_by(self, order):
+        """ترتيب حسب عمود (النقر مرة أخرى يعكس الاتجاه)"""
+        current = self.case_filter.order_by
+        if current.startswith(order + '_'):
+            direction = 'asc' if current.endswith('_desc') else 'desc'
+        else:
+            direction = 'desc' if order in DESCENDING_FIRST else 'asc'
+        self.reload(self.case_filter.copy(order_by=f"{order}_{direction}"))
+        for key, title, column_order in self.columns:
+            arrow = ''
+            if column_order == order:
+                arrow = ' ▼' if direction == 'desc' else ' ▲'
+            self.tree.heading(title, text=title + arrow)
+
+    def _on_filter_typed(self, event=None):
+        # الانتظار حتى يتوقف المستخدم عن الكتابة
+        if self._filter_job is not None:
+            self.tree.after_cancel(self._filter_job)
+        self._filter_job = self.tree.after(self.filter_delay_ms, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_job = None
+        text = self.filter_var.get().strip()
+        if text == self.case_filter.search_text:
+            return
+        self.reload(self.case_filter.copy(search_type="شامل" if text else self.base_filter.search_type,
+                                          search_text=text or self.base_filter.search_text))
+
+    def _on_count(self, generation, total):
+        if generation != self._generation or not self.tree.winfo_exists():
+            return
+        self.total = total
+        self._update_status()
+        self.render()
+
+    def _request_page(self, page):
+        if page in self._pages or page in self._pending:
+            return
+        generation = self._generation
+        self._pending[page] = self.runner.submit(
+            self.source.fetch_page, page,
+            on_done=lambda rows: self._on_page(generation, page, rows),
+            on_error=lambda error: self._on_page_error(generation, page, error)
+        )
+
+    def _on_page(self, generation, page, rows):
+        if generation != self._generation or not self.tree.winfo_exists():
+            return
+        self._pending.pop(page, None)
+        self._pages[page] = rows
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        self._update_status()
+        if self._page_range()[0] <= page <= self._page_range()[1]:
+            self.render()
+            self._first_page_shown()
+
+    def _on_page_error(self, generation, page, error):
+        if generation == self._generation:
+            self._pending.pop(page, None)
+        self._on_error(generation, error)
+        self._first_page_shown()
+
+    def _first_page_shown(self):
+        callback, self.on_first_page = self.on_first_page, None
+        if callback:
+            callback()
+
+    def _on_error(self, generation, error):
+        if generation != self._generation or not self.tree.winfo_exists():
+            return
+        print(f"خطأ في تحميل صفحة الحالات: {error}")
+        self.status_label.configure(text="خطأ في التحميل")
+
+    def _cancel_pending(self):
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+        if self._count_task is not None:
+            self._count_task.cancel()
+            self._count_task = None
+
+    def _page_range(self):
+        """الصفحات التي تغطي الصفوف الظاهرة"""
+        return self.top // self.page_size, (self.top + self.rows - 1) // self.page_size
+
+    def row_at(self, index):
+        """بيانات الصف index إذا كانت محملة (None إن لم تُحمل بعد)"""
+        page = self._pages.get(index // self.page_size)
+        if page is None:
+            return None
+        offset = index % self.page_size
+        return page[offset] if offset < len(page) else None
+
+    # ---- العرض ----
+
+    def render(self):
+        """رسم الصفوف الظاهرة وطلب الصفحات الناقصة"""
+        total = self.total if self.total is not None else self.rows
+        self.top = max(0, min(self.top, total - self.rows))
+        first_page, last_page = self._page_range()
+        needed = set(range(first_page, last_page + 2))
+        if first_page > 0:
+            needed.add(first_page - 1)
+        # الصفحات البعيدة التي لم يبدأ تحميلها لم تعد مطلوبة (تمرير سريع)
+        for page in [page for page in self._pending if page not in needed]:
+            self._pending.pop(page).cancel()
+        for page in sorted(needed, key=lambda page: abs(page - first_page)):
+            if self.total is None or page * self.page_size < self.total:
+                self._request_page(page)
+        for page in needed:
+            if page in self._pages:
+                self._pages.move_to_end(page)
+
+        self.tree.delete(*self.tree.get_children())
+        selected_item = None
+        for index in range(self.top, min(self.top + self.rows, total)):
+            case = self.row_at(index)
+            if case is None:
+                values = ("…",) + ("",) * (len(self.columns) - 1)
+                item = self.tree.insert('', 'end', values=values)
+            else:
+                values = [case.get(key) or '' for key, title, order in self.columns]
+                iid = f"case-{case['id']}"
+                # حالة انتقلت بين صفحتين حُملتا في وقتين مختلفين قد تظهر مرتين
+                item = self.tree.insert('', 'end', iid=None if self.tree.exists(iid) else iid, values=values)
+                if case['id'] == self.selected_id:
+                    selected_item = item
+        if selected_item:
+            self.tree.selection_set(selected_item)
+        if self.total:
+            self.scrollbar.set(self.top / self.total, min(1.0, (self.top + self.rows) / self.total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _update_status(self):
+        if self.total is None:
+            text = "جاري العد..."
+        else:
+            text = f"عدد الحالات: {self.total:,}"
+        if self._pending:
+            text += " - جاري التحميل..."
+        self.status_label.configure(text=text)
+
+    def scroll_to(self, top):
+        top = int(top)
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def _scroll_units(self, units):
+        self.scroll_to(max(0, self.top + units))
+        return "break"
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if not self.total:
+            return
+        if action == 'moveto':
+            self.scroll_to(float(amount) * self.total)
+        elif unit == 'pages':
+            self._scroll_units(int(amount) * self.rows)
+        else:
+            self._scroll_units(int(amount))
+
+    def _on_mousewheel(self, event):
+        return self._scroll_units(-3 if event.delta > 0 else 3)
+
+    def _on_resize(self, event):
+        # عدد الصفوف التي تتسع لها مساحة الجدول (بعد سطر العناوين)
+        rows = max(1, (event.height - self.row_height - 4) // self.row_height)
+        if rows != self.rows:
+            self.rows = rows
+            self.render()
+
+    def _on_select(self, event=None):
+        selection = self.tree.selection()
+        if selection and selection[0].startswith('case-'):
+            self.selected_id = int(selection[0][5:])
+
+    def _on_key(self, delta):
+        if delta in ('page_up', 'page_down'):
+            return self._scroll_units(self.rows if delta == 'page_down' else -self.rows)
+        items = self.tree.get_children()
+        selection = self.tree.selection()
+        position = items.index(selection[0]) if selection and selection[0] in items else -1
+        target = position + delta
+        if 0 <= target < len(items):
+            self.tree.selection_set(items[target])
+            self.tree.focus(items[target])
+        else:
+            # الانتقال خارج الجزء الظاهر: تمرير صف واحد ثم تحديد الصف على الحافة
+            self._scroll_units(delta)
+            items = self.tree.get_children()
+            if items:
+                edge = items[0] if delta < 0 else items[-1]
+                self.tree.selection_set(edge)
+                self.tree.focus(edge)
+        self._on_select()
+        return "break"
+
+    def _on_destroy(self, event):
+        if event.widget is self.frame:
+            self._cancel_pending()
+            self._generation += 1
+            if self._filter_job is not None:
+                try:
+                    self.tree.after_cancel(self._filter_job)
+                except Exception:
+                    pass
+                self._filter_job = None
@@ -0,0 +1,101 @@
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from customer_issues_query_guard import current_query_guard, guard_connection, is_interrupted
+
+SUMMARY_COLUMNS = ['id', 'customer_name', 'subscriber_number', 'status', 'category_name', 'color_code', 'modified_by_name', 'created_date', 'modified_date']
+
+
+def summary_sort_key(row):
+    """مفتاح ترتيب صفوف ملخص الحالات (تاريخ التعديل ثم تاريخ الإنشاء)"""
+    if isinstance(row, dict):
+        return (row.get('modified_date') or '', row.get('created_date') or '')
+    return (row[8] or '', row[7] or '')
+
+
+class ParallelSearchExecutor:
+    """تنفيذ استعلام البحث على عدة ملفات قواعد بيانات بالتوازي ودمج النتائج
+
+    sources: قاموس {اسم الملف: دالة تعيد اتصالاً جديداً}، حتى يمكن استخدام
+    ملفات منفصلة أو ملفات سنوية مرفق بها الملف المرجعي.
+    يُستخدم ThreadPool لأن sqlite3 يحرر قفل المفسر أثناء تنفيذ الاستعلام،
+    ولأن الاتصالات لا يمكن تمريرها بين العمليات.
+    """
+
+    def __init__(self, query_builder, sources, max_workers=4):
+        self.query_builder = query_builder
+        self.sources = sources
+        self.max_workers = max_workers
+        self.last_report = {}
+
+    @classmethod
+    def for_files(cls, query_builder, database_files, max_workers=4):
+        """إنشاء منفذ لقائمة ملفات منفصلة"""
+        from customer_issues_database import open_connection
+        sources = {path: (lambda path=path: open_connection(path)) for path in database_files}
+        return cls(query_builder, sources, max_workers)
+
+    def _run_source(self, name, query, params, is_cancelled=None):
+        """تنفيذ الاستعلام على ملف واحد وقياس زمن التنفيذ"""
+        started = time.perf_counter()
+        rows = []
+        error = None
+        conn = None
+        try:
+            conn = guard_connection(self.sources[name](), is_cancelled)
+            rows = conn.execute(query, params).fetchall()
+        except Exception as e:
+            error = str(e)
+            if not is_interrupted(e):
+                print(f"خطأ في البحث في {name}: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return name, rows, elapsed_ms, error
+
+    def search(self, search_field, search_value, page_size=None, offset=0, names=None,
+               sort_key=summary_sort_key, reverse=True):
+        """البحث في الملفات المطلوبة وإرجاع صفحة النتائج مرتبة (قائمة dicts)
+
+        كل ملف يُرجع على الأكثر offset + page_size صفاً مرتبة (الحد يقلل عمل كل
+        ملف فقط)، ثم تُدمج النتائج بكومة (heap) حتى امتلاء الصفحة المطلوبة.
+        الدمج يبدأ بعد انتهاء جميع الملفات لأن أي ملف لم يُرجع نتيجته بعد قد
+        يحتوي صفوفاً تسبق ما وصل، لذلك زمن كل صفحة هو زمن أبطأ ملف (انظر last_report).
+        sort_key/reverse يجب أن يطابقا ترتيب الاستعلام في كل ملف.
+        """
+        if names is None:
+            names = list(self.sources)
+        # كل ملف يحتاج فقط لعدد الصفوف حتى نهاية الصفحة
+        per_source_limit = offset + page_size if page_size else None
+        search_query = self.query_builder(search_field, search_value, per_source_limit, 0)
+        if not search_query or not names:
+            self.last_report = {}
+            return []
+        query, params = search_query
+
+        report = {}
+        results = []
+        # خيوط الملفات لا ترى فحص الإلغاء المسجل لخيط الطلب لذلك يُمرر صراحة
+        is_cancelled = current_query_guard()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(names))) as pool:
+            futures = [pool.submit(self._run_source, name, query, params, is_cancelled) for name in names]
+            for future in futures:
+                name, rows, elapsed_ms, error = future.result()
+                report[name] = {'latency_ms': round(elapsed_ms, 2), 'rows': len(rows), 'error': error}
+                results.append(rows)
+
+        merged = heapq.merge(*results, key=sort_key, reverse=reverse)
+        stop = offset + page_size if page_size else None
+        page = [dict(zip(SUMMARY_COLUMNS, row)) for row in islice(merged, offset, stop)]
+        self.last_report = report
+        return page
+
+    def format_report(self):
+        """نص مختصر بزمن البحث في كل ملف"""
+        return "\n".join(
+            f"{name}: {info['latency_ms']} ms ({info['rows']} صف)" + (f" - خطأ: {info['error']}" if info['error'] else "")
+            for name, info in self.last_report.items()
+        )
@@ -0,0 +1,42 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# عدد تعليمات SQLite بين كل فحص لطلب الإلغاء
+QUERY_GUARD_STEPS = 1000
+
+_guard = threading.local()
+
+
+def current_query_guard():
+    """دالة فحص الإلغاء المسجلة للخيط الحالي (أو None)"""
+    return getattr(_guard, 'is_cancelled', None)
+
+
+@contextmanager
+def cancellable_queries(is_cancelled):
+    """إيقاف استعلامات هذا الخيط بمجرد أن تُرجع is_cancelled() قيمة صحيحة
+
+    الاتصالات المفتوحة داخل الكتلة تفحص الدالة أثناء التنفيذ، والاستعلام
+    الذي يُلغى يفشل بـ OperationalError (interrupted) بدلاً من إكمال المسح.
+    """
+    previous = current_query_guard()
+    _guard.is_cancelled = is_cancelled
+    try:
+        yield
+    finally:
+        _guard.is_cancelled = previous
+
+
+def guard_connection(conn, is_cancelled=None):
+    """ربط الاتصال بدالة فحص الإلغاء (افتراضياً دالة الخيط الحالي)"""
+    if is_cancelled is None:
+        is_cancelled = current_query_guard()
+    if is_cancelled is not None:
+        conn.set_progress_handler(lambda: 1 if is_cancelled() else 0, QUERY_GUARD_STEPS)
+    return conn
+
+
+def is_interrupted(error):
+    """هل الخطأ ناتج عن إيقاف استعلام ملغى"""
+    return isinstance(error, sqlite3.OperationalError) and 'interrupted' in str(error)
@@ -0,0 +1,158 @@
+import time
+from collections import OrderedDict
+
+from customer_issues_background import BackgroundRunner
+from customer_issues_query_guard import cancellable_queries
+from customer_issues_instrumentation import get_monitor
+
+# مفاتيح لا تغير نص البحث (الأسهم ومفاتيح التعديل وغيرها)
+IGNORED_SEARCH_KEYS = {
+    'Up', 'Down', 'Left', 'Right', 'Home', 'End', 'Prior', 'Next',
+    'Shift_L', 'Shift_R', 'Control_L', 'Control_R', 'Alt_L', 'Alt_R',
+    'Caps_Lock', 'Num_Lock', 'Tab', 'Escape', 'Super_L', 'Super_R', 'Menu'
+}
+
+# أنواع البحث التي يمكن تضييق نتائجها في الذاكرة: نوع البحث -> الحقل في ملخص الحالة
+REFINABLE_SEARCH_FIELDS = {
+    'اسم العميل': 'customer_name',
+    'رقم المشترك': 'subscriber_number'
+}
+
+
+class SearchSession:
+    """طبقة بحث أثناء الكتابة: تأخير الطلبات، ذاكرة مؤقتة LRU، وتضييق النتائج السابقة
+
+    - تُنفذ الطلبات بعد توقف الكتابة delay_ms فقط.
+    - النتائج مخزنة بمفتاح (نوع البحث، القيمة، السنة، الترتيب، إصدار البيانات).
+    - إذا كانت القيمة الجديدة تحتوي على القيمة السابقة لنفس النوع والسنة والإصدار
+      تُفلتر النتائج السابقة في الذاكرة دون الرجوع لقاعدة البيانات.
+    - أي بحث جارٍ يُلغى عند طلب بحث أحدث: يتوقف استعلامه في SQLite وتُهمل نتيجته.
+    - زمن كل بحث من بدء تنفيذه حتى انتهاء عرض نتائجه يُسجل في مراقب الواجهة باسم
+      'search_latency' (زمن كلي لا يُنسب إليه تجمد الواجهة).
+    """
+
+    def __init__(self, root, search_function, on_results, version_function=None,
+                 delay_ms=250, cache_size=64, runner=None):
+        self.root = root
+        self.search_function = search_function
+        self.on_results = on_results
+        self.version_function = version_function or (lambda: 0)
+        self.delay_ms = delay_ms
+        self.cache_size = cache_size
+        self.runner = runner or BackgroundRunner(root, max_workers=1)
+        self._cache = OrderedDict()
+        self._pending_job = None
+        self._running_task = None
+        self._last_key = None
+        self._started = None
+        self.stats = {'requests': 0, 'cache_hits': 0, 'refined': 0, 'queries': 0, 'cancelled': 0}
+
+    def request(self, search_type, search_value, year=None, order_by=None, immediate=False):
+        """طلب بحث جديد (يؤجل حتى يتوقف المستخدم عن الكتابة)"""
+        self.stats['requests'] += 1
+        if self._pending_job is not None:
+            self.root.after_cancel(self._pending_job)
+            self._pending_job = None
+        args = (search_type, search_value.strip(), year, order_by)
+        if immediate or self.delay_ms <= 0:
+            self._start(*args)
+        else:
+            self._pending_job = self.root.after(self.delay_ms, self._start, *args)
+
+    def cancel(self):
+        """إلغاء الطلب المؤجل والبحث الجاري"""
+        if self._pending_job is not None:
+            self.root.after_cancel(self._pending_job)
+            self._pending_job = None
+        if self._running_task is not None and not self._running_task.done:
+            self._running_task.cancel()
+            self.stats['cancelled'] += 1
+        self._running_task = None
+
+    @property
+    def last_request(self):
+        """مفتاح آخر نتيجة تم عرضها (نوع البحث، القيمة، السنة، الترتيب، إصدار البيانات)"""
+        return self._last_key
+
+    def invalidate(self):
+        """مسح الذاكرة المؤقتة بالكامل"""
+        self._cache.clear()
+        self._last_key = None
+
+    def _start(self, search_type, search_value, year, order_by):
+        self._pending_job = None
+        self._started = time.perf_counter()
+        key = (search_type, search_value, year, order_by, self.version_function())
+
+        # إلغاء أي بحث سابق لم ينتهِ بعد
+        if self._running_task is not None and not self._running_task.done:
+            self._running_task.cancel()
+            self.stats['cancelled'] += 1
+        self._running_task = None
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            self._deliver(key, self._cache[key])
+            return
+
+        refined = self._refine(key)
+        if refined is not None:
+            self.stats['refined'] += 1
+            self._store(key, refined)
+            self._deliver(key, refined)
+            return
+
+        self.stats['queries'] += 1
+        # المهمة تُعرف بعد submit فقط، والاستعلام قد يبدأ قبل ذلك
+        task_ref = []
+        self._running_task = self.runner.submit(
+            self._run_query, task_ref, search_type, search_value, year, order_by,
+            on_done=lambda results, key=key: self._on_query_done(key, results),
+            on_error=self._on_query_error
+        )
+        task_ref.append(self._running_task)
+
+    def _run_query(self, task_ref, *args):
+        """تنفيذ البحث في الخيط الخلفي مع إيقاف الاستعلام فور إلغاء المهمة"""
+        with cancellable_queries(lambda: bool(task_ref) and task_ref[0].cancelled):
+            return self.search_function(*args)
+
+    def _refine(self, key):
+        """تضييق نتائج البحث السابق في الذاكرة إذا كان البحث الجديد امتداداً له"""
+        search_type, search_value, year, order_by, version = key
+        field = REFINABLE_SEARCH_FIELDS.get(search_type)
+        if not field or not search_value or self._last_key is None:
+            return None
+        last_type, last_value, last_year, last_order, last_version = self._last_key
+        # التصفية في الذاكرة تحافظ على ترتيب النتائج السابقة
+        if (last_type, last_year, last_order, last_version) != (search_type, year, order_by, version):
+            return None
+        if not last_value or last_value not in search_value or self._last_key not in self._cache:
+            return None
+        needle = search_value.casefold()
+        return [case for case in self._cache[self._last_key]
+                if needle in str(case.get(field) or '').casefold()]
+
+    def _on_query_done(self, key, results):
+        self._running_task = None
+        self._store(key, results)
+        self._deliver(key, results)
+
+    def _on_query_error(self, error):
+        self._running_task = None
+        print(f"خطأ في البحث: {error}")
+
+    def _store(self, key, results):
+        self._cache[key] = results
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _deliver(self, key, results):
+        self._last_key = key
+        self.on_results(list(results))
+        monitor = get_monitor()
+        if monitor is not None and self._started is not None:
+            monitor.record_latency('search_latency', (time.perf_counter() - self._started) * 1000)
+        self._started = None
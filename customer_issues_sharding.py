@@ -0,0 +1,574 @@
+import os
+import re
+import sys
+import sqlite3
+import threading
+from datetime import datetime
+
+from customer_issues_database import DatabaseManager, open_connection, schema_is_current, mark_schema_current
+from customer_issues_parallel_search import ParallelSearchExecutor, summary_sort_key
+
+# ملف البيانات المرجعية المشتركة (الموظفين والتصنيفات)
+GLOBAL_DB_NAME = "customer_issues_global.db"
+SHARD_NAME_PATTERN = re.compile(r'^customer_issues_(\d{4})\.db$')
+
+# الجداول المرتبطة بالحالات تُخزن في ملف سنة إنشاء الحالة
+CASE_TABLES = ('cases', 'correspondences', 'attachments', 'audit_log')
+# جداول تابعة للمرفقات بدون معرفات خاصة (في نفس ملف السنة)
+CASE_INDEX_TABLES = ('storage_index', 'case_archives')
+
+# عمود التاريخ الذي يحدد سنة الصف عند عدم معرفة سنة الحالة
+CASE_TABLE_DATE_COLUMNS = {
+    'cases': 'created_date',
+    'correspondences': 'created_date',
+    'attachments': 'upload_date',
+    'audit_log': 'timestamp'
+}
+
+# كل ملف سنوي يبدأ معرفاته من السنة * هذا المدى (مثلاً 2026000001)
+# حتى تبقى المعرفات فريدة عبر الملفات ويمكن معرفة سنة الحالة من رقمها
+SHARD_ID_SPAN = 10 ** 6
+
+WRITE_QUERY_PATTERN = re.compile(
+    r'^\s*(INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)',
+    re.IGNORECASE
+)
+CASE_TABLE_PATTERN = re.compile(r'\b(cases|correspondences|attachments|audit_log|storage_index|case_archives)\b', re.IGNORECASE)
+
+
+class ShardRouter:
+    """تحديد ملف السنة المناسب لكل حالة وفتح الاتصالات بالملفات"""
+
+    def __init__(self, shards_path="shards"):
+        self.shards_path = shards_path
+        self.global_db = os.path.join(shards_path, GLOBAL_DB_NAME)
+        self._case_years = {}
+        self._lock = threading.Lock()
+
+    def shard_path(self, year):
+        """مسار ملف السنة"""
+        return os.path.join(self.shards_path, f"customer_issues_{int(year)}.db")
+
+    def available_years(self):
+        """السنوات التي لها ملفات (تنازلياً)"""
+        if not os.path.isdir(self.shards_path):
+            return []
+        years = []
+        for file_name in os.listdir(self.shards_path):
+            match = SHARD_NAME_PATTERN.match(file_name)
+            if match:
+                years.append(int(match.group(1)))
+        return sorted(years, reverse=True)
+
+    def current_year(self):
+        """سنة الكتابة الحالية"""
+        return datetime.now().year
+
+    def year_for_date(self, date_text):
+        """استخراج السنة من نص التاريخ (أو السنة الحالية)"""
+        if date_text and str(date_text)[:4].isdigit():
+            return int(str(date_text)[:4])
+        return self.current_year()
+
+    def connect_global(self):
+        """اتصال بملف البيانات المرجعية"""
+        return open_connection(self.global_db)
+
+    def connect_shard(self, year):
+        """اتصال بملف السنة مع إرفاق ملف البيانات المرجعية
+
+        أسماء الجداول غير الموجودة في ملف السنة (employees وغيرها) تُحل
+        تلقائياً من الملف المرفق، لذلك تعمل الاستعلامات الحالية بدون تعديل.
+        """
+        conn = open_connection(self.shard_path(year))
+        conn.execute("ATTACH DATABASE ? AS global_db", (self.global_db,))
+        return conn
+
+    def remember_case(self, case_id, year):
+        """حفظ سنة الحالة في الذاكرة"""
+        with self._lock:
+            self._case_years[int(case_id)] = int(year)
+
+    def year_for_case(self, case_id):
+        """تحديد سنة ملف الحالة من رقمها أو من فهرس الترحيل أو بالبحث في الملفات"""
+        if case_id is None:
+            return self.current_year()
+        case_id = int(case_id)
+        with self._lock:
+            if case_id in self._case_years:
+                return self._case_years[case_id]
+
+        years = self.available_years()
+        encoded_year = case_id // SHARD_ID_SPAN
+        if encoded_year in years:
+            self.remember_case(case_id, encoded_year)
+            return encoded_year
+
+        # الحالات المرحّلة من الملف الواحد تحتفظ بأرقامها القديمة
+        conn = self.connect_global()
+        try:
+            row = conn.execute("SELECT year FROM case_shards WHERE case_id = ?", (case_id,)).fetchone()
+        except sqlite3.Error:
+            row = None
+        finally:
+            conn.close()
+        if row:
+            self.remember_case(case_id, row[0])
+            return row[0]
+
+        for year in years:
+            conn = self.connect_shard(year)
+            try:
+                found = conn.execute("SELECT 1 FROM cases WHERE id = ?", (case_id,)).fetchone()
+            finally:
+                conn.close()
+            if found:
+                self.remember_case(case_id, year)
+                return year
+        return self.current_year()
+
+
+class ShardedDatabaseManager(DatabaseManager):
+    """مدير قاعدة بيانات بملف لكل سنة إنشاء وملف مرجعي مشترك"""
+
+    def __init__(self, shards_path="shards", text_compression=None):
+        self.router = ShardRouter(shards_path)
+        self._ensured_years = set()
+        self._local = threading.local()
+        self.last_search_report = {}
+        DatabaseManager.__init__(self, self.router.global_db, text_compression)
+
+    def init_database(self):
+        """إنشاء الملف المرجعي وملف السنة الحالية"""
+        os.makedirs(self.router.shards_path, exist_ok=True)
+        conn = self.router.connect_global()
+        cursor = conn.cursor()
+        if schema_is_current(cursor):
+            conn.close()
+            self.ensure_all_shards()
+            return
+        self.create_global_tables(cursor)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS case_shards (
+                case_id INTEGER PRIMARY KEY,
+                year INTEGER NOT NULL
+            )
+        ''')
+        self.seed_reference_data(cursor)
+        mark_schema_current(cursor)
+        conn.commit()
+        conn.close()
+        self.ensure_all_shards()
+        self.migrate_subscribers()
+
+    def ensure_all_shards(self):
+        """تهيئة ملف السنة الحالية وترقية مخطط ملفات السنوات السابقة
+
+        القراءة الموزعة تفتح ملفات السنوات مباشرة، لذلك يجب أن يكون مخطط كل ملف
+        محدثاً (الفحص سريع للملفات المحدثة مسبقاً).
+        """
+        for year in set(self.router.available_years()) | {self.router.current_year()}:
+            self.ensure_shard(year)
+
+    def ensure_shard(self, year):
+        """إنشاء ملف السنة وجداوله إذا لم يكن موجوداً"""
+        year = int(year)
+        if year in self._ensured_years:
+            return
+        conn = open_connection(self.router.shard_path(year))
+        cursor = conn.cursor()
+        if schema_is_current(cursor):
+            self.detect_trigram_index(cursor)
+        else:
+            self.create_case_tables(cursor)
+            self.seed_shard_sequences(cursor, year)
+            mark_schema_current(cursor)
+        conn.commit()
+        conn.close()
+        self._ensured_years.add(year)
+
+    def seed_shard_sequences(self, cursor, year):
+        """ضبط بداية المعرفات في ملف السنة على مدى السنة"""
+        start = int(year) * SHARD_ID_SPAN
+        for table in CASE_TABLES:
+            cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?", (start, table, start))
+            cursor.execute('''
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+            ''', (table, start, table))
+
+    def get_connection(self):
+        """الحصول على اتصال بملف السنة المثبتة حالياً أو بالملف المرجعي"""
+        year = getattr(self._local, 'year', None)
+        if year is not None:
+            self.ensure_shard(year)
+            return self.router.connect_shard(year)
+        return self.router.connect_global()
+
+    def data_connections(self):
+        """دالة فتح اتصال لكل ملف سنوي"""
+        return [(lambda year=year: self.router.connect_shard(year)) for year in self.router.available_years()]
+
+    def database_files(self):
+        """الملف المرجعي وجميع ملفات السنوات"""
+        return [self.router.global_db] + [self.router.shard_path(year) for year in self.router.available_years()]
+
+    def pinned(self, year, method, *args):
+        """تنفيذ دالة مع توجيه جميع استعلاماتها إلى ملف سنة محدد"""
+        previous = getattr(self._local, 'year', None)
+        self._local.year = year
+        try:
+            return method(*args)
+        finally:
+            self._local.year = previous
+
+    def on_case_shard(self, case_id, method, *args):
+        """تنفيذ دالة على ملف السنة الخاص بالحالة"""
+        return self.pinned(self.router.year_for_case(case_id), method, *args)
+
+    def execute_query(self, query, params=None):
+        """توجيه الاستعلام: الكتابة للملف المناسب والقراءة موزعة على الملفات"""
+        if getattr(self._local, 'year', None) is not None:
+            return self.run_on_connection(self.get_connection(), query, params)
+
+        match = WRITE_QUERY_PATTERN.match(query)
+        if match:
+            table = match.group(2).lower()
+            if table not in CASE_TABLES + CASE_INDEX_TABLES:
+                return self.run_on_connection(self.router.connect_global(), query, params)
+            if match.group(1).upper().startswith(('INSERT', 'REPLACE')):
+                year = self.router.current_year()
+                self.ensure_shard(year)
+                return self.run_on_connection(self.router.connect_shard(year), query, params)
+            # المعرفات فريدة عبر الملفات لذلك يُنفذ التحديث/الحذف على جميعها
+            results = []
+            for year in self.router.available_years():
+                results.extend(self.run_on_connection(self.router.connect_shard(year), query, params))
+            return results
+
+        if not CASE_TABLE_PATTERN.search(query):
+            return self.run_on_connection(self.router.connect_global(), query, params)
+        return self.fan_out(query, params)
+
+    def execute_query_parts(self, query, params=None):
+        """نتائج الاستعلام من كل ملف سنوي على حدة"""
+        if getattr(self._local, 'year', None) is not None:
+            return [self.execute_query(query, params)]
+        return [self.run_on_connection(self.router.connect_shard(year), query, params)
+                for year in self.router.available_years()]
+
+    def fan_out(self, query, params=None, years=None):
+        """تنفيذ استعلام قراءة على ملفات السنوات المطلوبة ودمج النتائج"""
+        if years is None:
+            years = self.router.available_years()
+        results = []
+        for year in years:
+            results.extend(self.run_on_connection(self.router.connect_shard(year), query, params))
+        return results
+
+    # ---- سجل التغييرات ----
+
+    def get_data_version(self):
+        """إصدار البيانات لكل ملف سنوي ((السنة، آخر تغيير), ...)"""
+        return tuple((year, self.pinned(year, DatabaseManager.get_data_version, self))
+                     for year in sorted(self.router.available_years()))
+
+    def get_changes_since(self, version):
+        """التغييرات في جميع الملفات بعد الإصدار المحدد"""
+        previous = dict(version) if isinstance(version, (tuple, list)) else {}
+        changes = []
+        current = []
+        for year in sorted(self.router.available_years()):
+            rows, year_version = self.pinned(year, DatabaseManager.get_changes_since, self, previous.get(year, 0))
+            if rows is None:
+                return None, self.get_data_version()
+            changes.extend(rows)
+            current.append((year, year_version))
+        return changes, tuple(current)
+
+    def prune_change_feed(self, keep=10000):
+        for year in self.router.available_years():
+            self.pinned(year, DatabaseManager.prune_change_feed, self, keep)
+
+    # ---- القراءة ----
+
+    def get_case_years(self):
+        """سنوات الحالات هي سنوات الملفات الموجودة"""
+        return [str(year) for year in self.router.available_years()]
+
+    def get_cases_by_year(self, year=None):
+        """قراءة ملف السنة المطلوبة فقط، أو دمج جميع الملفات"""
+        if year:
+            if int(year) not in self.router.available_years():
+                return []
+            return self.pinned(int(year), DatabaseManager.get_cases_by_year, self, year)
+        rows = DatabaseManager.get_cases_by_year(self)
+        rows.sort(key=summary_sort_key, reverse=True)
+        return rows
+
+    def get_all_cases(self):
+        """جميع الحالات من كل الملفات مرتبة"""
+        columns = ['id', 'customer_name', 'subscriber_number', 'status', 'category_name', 'color_code', 'modified_by_name', 'created_date', 'modified_date']
+        return [dict(zip(columns, row)) for row in self.get_cases_by_year()]
+
+    def search_cases(self, search_field, search_value, limit=None, offset=0):
+        """البحث في جميع الملفات بالتوازي ودمج النتائج المرتبة"""
+        sources = {year: (lambda year=year: self.router.connect_shard(year)) for year in self.router.available_years()}
+        executor = ParallelSearchExecutor(self.build_search_query, sources)
+        results = executor.search(search_field, search_value, limit, offset)
+        self.last_search_report = executor.last_report
+        return results
+
+    def query_cases(self, case_filter):
+        """تنفيذ الفلتر على ملفات السنوات التي يغطيها فقط ودمج النتائج بنفس الترتيب"""
+        years = [year for year in self.router.available_years() if case_filter.matches_year(year)]
+        if not years:
+            self.last_search_report = {}
+            return []
+        sources = {year: (lambda year=year: self.router.connect_shard(year)) for year in years}
+        # كل ملف ينفذ نفس الفلتر مع حد offset + limit ثم تُدمج الصفحة
+        executor = ParallelSearchExecutor(
+            lambda _field, _value, limit, offset: case_filter.copy(limit=limit, offset=offset).compile(self),
+            sources
+        )
+        sort_key, reverse = case_filter.sort_key()
+        results = executor.search(None, None, case_filter.limit, case_filter.offset,
+                                  sort_key=sort_key, reverse=reverse)
+        self.last_search_report = executor.last_report
+        return results
+
+    def count_cases(self, case_filter):
+        """مجموع عدد الحالات المطابقة في ملفات السنوات التي يغطيها الفلتر"""
+        years = [year for year in self.router.available_years() if case_filter.matches_year(year)]
+        return sum(self.pinned(year, DatabaseManager.count_cases, self, case_filter) for year in years)
+
+    def get_case_details(self, case_id):
+        return self.on_case_shard(case_id, DatabaseManager.get_case_details, self, case_id)
+
+    def get_case_correspondences(self, case_id):
+        return self.on_case_shard(case_id, DatabaseManager.get_case_correspondences, self, case_id)
+
+    def get_case_attachments(self, case_id):
+        return self.on_case_shard(case_id, DatabaseManager.get_case_attachments, self, case_id)
+
+    def get_case_audit_log(self, case_id):
+        return self.on_case_shard(case_id, DatabaseManager.get_case_audit_log, self, case_id)
+
+    def get_next_correspondence_numbers(self, case_id):
+        """الرقم التسلسلي من ملف الحالة والرقم السنوي من جميع الملفات"""
+        case_seq_query = "SELECT COALESCE(MAX(case_sequence_number), 0) + 1 FROM correspondences WHERE case_id = ?"
+        case_seq_result = self.on_case_shard(case_id, self.execute_query, case_seq_query, (case_id,))
+        case_sequence = case_seq_result[0][0] if case_seq_result else 1
+
+        current_year = datetime.now().year
+        yearly_seq_query = """
+            SELECT COALESCE(MAX(CAST(SUBSTR(yearly_sequence_number, 1, INSTR(yearly_sequence_number, '-') - 1) AS INTEGER)), 0) + 1
+            FROM correspondences
+            WHERE yearly_sequence_number LIKE ?
+        """
+        yearly_results = self.fan_out(yearly_seq_query, (f"%-{current_year}",))
+        yearly_sequence = max([row[0] for row in yearly_results if row[0]] or [1])
+        return case_sequence, f"{yearly_sequence}-{current_year}"
+
+    # ---- الكتابة ----
+
+    def add_case(self, case_data):
+        """إضافة الحالة في ملف سنة إنشائها"""
+        year = self.router.year_for_date(case_data.get('created_date'))
+        return self.pinned(year, DatabaseManager.add_case, self, case_data)
+
+    def update_case(self, case_id, case_data):
+        return self.on_case_shard(case_id, DatabaseManager.update_case, self, case_id, case_data)
+
+    def delete_case(self, case_id):
+        return self.on_case_shard(case_id, DatabaseManager.delete_case, self, case_id)
+
+    def log_action(self, case_id, action_type, action_description, performed_by, old_values=None, new_values=None):
+        return self.on_case_shard(case_id, DatabaseManager.log_action, self, case_id, action_type,
+                                  action_description, performed_by, old_values, new_values)
+
+    def add_attachment(self, attachment_data):
+        case_id = attachment_data.get('case_id')
+        return self.on_case_shard(case_id, DatabaseManager.add_attachment, self, attachment_data)
+
+    def add_attachments(self, attachments, audit_entries=None):
+        # معاملة واحدة لكل ملف سنة (المرفقات وسجلها في ملف سنة الحالة)
+        by_year = {}
+        for index, attachment_data in enumerate(attachments):
+            year = self.router.year_for_case(attachment_data.get('case_id'))
+            by_year.setdefault(year, ([], [], []))
+            by_year[year][0].append(index)
+            by_year[year][1].append(attachment_data)
+        for entry in audit_entries or []:
+            year = self.router.year_for_case(entry[0])
+            by_year.setdefault(year, ([], [], []))[2].append(entry)
+        ids = [None] * len(attachments)
+        for year, (indexes, rows, entries) in by_year.items():
+            year_ids = self.pinned(year, DatabaseManager.add_attachments, self, rows, entries)
+            for index, attachment_id in zip(indexes, year_ids):
+                ids[index] = attachment_id
+        return [attachment_id for attachment_id in ids if attachment_id is not None]
+
+    def update_storage_index(self, entries):
+        by_year = {}
+        for entry in entries:
+            by_year.setdefault(self.router.year_for_case(entry[1]), []).append(entry)
+        return all([self.pinned(year, DatabaseManager.update_storage_index, self, year_entries)
+                    for year, year_entries in by_year.items()])
+
+    def relink_attachment(self, attachment_id, case_id, file_path, size, mtime, sha256):
+        return self.on_case_shard(case_id, DatabaseManager.relink_attachment, self,
+                                  attachment_id, case_id, file_path, size, mtime, sha256)
+
+    def get_case_storage(self, case_id):
+        return self.on_case_shard(case_id, DatabaseManager.get_case_storage, self, case_id)
+
+    def get_storage_totals(self, case_id=None):
+        if case_id is not None:
+            return self.on_case_shard(case_id, DatabaseManager.get_storage_totals, self, case_id)
+        return DatabaseManager.get_storage_totals(self)
+
+    def get_case_archive(self, case_id):
+        return self.on_case_shard(case_id, DatabaseManager.get_case_archive, self, case_id)
+
+    def mark_case_archived(self, case_id, archive_path, method, members, original_bytes, archive_bytes):
+        return self.on_case_shard(case_id, DatabaseManager.mark_case_archived, self,
+                                  case_id, archive_path, method, members, original_bytes, archive_bytes)
+
+    def set_archive_reclaimed(self, case_id, reclaimed_bytes):
+        return self.on_case_shard(case_id, DatabaseManager.set_archive_reclaimed, self, case_id, reclaimed_bytes)
+
+    def add_correspondence(self, correspondence_data):
+        case_id = correspondence_data.get('case_id')
+        return self.on_case_shard(case_id, DatabaseManager.add_correspondence, self, correspondence_data)
+
+    def delete_attachment(self, attachment_id):
+        # رقم المرفق لا يحدد سنته دائماً (المرفقات المرحّلة)، والحذف لا يؤثر إلا على ملفه
+        for year in self.router.available_years():
+            self.pinned(year, DatabaseManager.delete_attachment, self, attachment_id)
+
+    def link_attachment_blob(self, attachment_id, sha256, blob_path):
+        return any(self.pinned(year, DatabaseManager.link_attachment_blob, self, attachment_id, sha256, blob_path)
+                   for year in self.router.available_years())
+
+    def update_blob_refs(self, cursor):
+        """المرفقات في ملفات السنوات وملفات المحتوى في الملف المرجعي: جمع عدد المراجع من كل ملف
+
+        cursor على الملف المرجعي داخل معاملة كتابة، لذلك لا تُكتب زيادة مرجع جديدة
+        قبل انتهاء العد. أخطاء القراءة تُرفع حتى لا يُعد ملف مستخدم بلا مراجع.
+        """
+        counts = {}
+        for year in self.router.available_years():
+            conn = self.router.connect_shard(year)
+            try:
+                for blob_hash, count in conn.execute(
+                        "SELECT blob_hash, COUNT(*) FROM attachments WHERE blob_hash IS NOT NULL GROUP BY blob_hash"):
+                    counts[blob_hash] = counts.get(blob_hash, 0) + count
+            finally:
+                conn.close()
+        cursor.execute("UPDATE attachment_blobs SET ref_count = 0")
+        cursor.executemany("UPDATE attachment_blobs SET ref_count = ? WHERE sha256 = ?",
+                           [(count, blob_hash) for blob_hash, count in counts.items()])
+
+
+def _table_columns(conn, table):
+    """أسماء أعمدة الجدول"""
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def migrate_to_shards(source_db="customer_issues_enhanced.db", shards_path="shards"):
+    """ترحيل قاعدة بيانات بملف واحد إلى ملفات سنوية مع الحفاظ على المعرفات
+
+    لا يتم تعديل الملف الأصلي. تُعاد إحصائية بعدد الصفوف المرحّلة لكل سنة وجدول.
+    """
+    if not os.path.exists(source_db):
+        raise FileNotFoundError(source_db)
+
+    manager = ShardedDatabaseManager(shards_path)
+    router = manager.router
+    source = open_connection(source_db)
+    global_conn = router.connect_global()
+    summary = {}
+    shard_conns = {}
+
+    def shard_conn(year):
+        if year not in shard_conns:
+            manager.ensure_shard(year)
+            shard_conns[year] = open_connection(router.shard_path(year))
+        return shard_conns[year]
+
+    def copy_row(conn, table, source_columns, row):
+        target_columns = _table_columns(conn, table)
+        values = [(col, val) for col, val in zip(source_columns, row) if col in target_columns]
+        placeholders = ', '.join('?' * len(values))
+        conn.execute(
+            f"INSERT OR REPLACE INTO {table} ({', '.join(col for col, _ in values)}) VALUES ({placeholders})",
+            [val for _, val in values]
+        )
+
+    try:
+        # البيانات المرجعية مع الحفاظ على المعرفات
+        source_tables = [row[0] for row in source.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        for table in ('employees', 'issue_categories', 'subscribers'):
+            if table not in source_tables:
+                continue
+            cursor = source.execute(f"SELECT * FROM {table}")
+            columns = [d[0] for d in cursor.description]
+            count = 0
+            for row in cursor:
+                copy_row(global_conn, table, columns, row)
+                count += 1
+            summary[('global', table)] = count
+
+        # الحالات حسب سنة الإنشاء
+        case_years = {}
+        cursor = source.execute("SELECT * FROM cases")
+        columns = [d[0] for d in cursor.description]
+        for row in cursor:
+            record = dict(zip(columns, row))
+            year = router.year_for_date(record.get('created_date'))
+            case_years[record['id']] = year
+            copy_row(shard_conn(year), 'cases', columns, row)
+            global_conn.execute("INSERT OR REPLACE INTO case_shards (case_id, year) VALUES (?, ?)", (record['id'], year))
+            summary[(year, 'cases')] = summary.get((year, 'cases'), 0) + 1
+
+        # البيانات التابعة تتبع سنة الحالة
+        for table in ('correspondences', 'attachments', 'audit_log') + CASE_INDEX_TABLES:
+            if table not in source_tables:
+                continue
+            cursor = source.execute(f"SELECT * FROM {table}")
+            columns = [d[0] for d in cursor.description]
+            date_column = CASE_TABLE_DATE_COLUMNS.get(table)
+            for row in cursor:
+                record = dict(zip(columns, row))
+                year = case_years.get(record.get('case_id')) or router.year_for_date(record.get(date_column))
+                copy_row(shard_conn(year), table, columns, row)
+                summary[(year, table)] = summary.get((year, table), 0) + 1
+
+        for year, conn in shard_conns.items():
+            manager.seed_shard_sequences(conn.cursor(), year)
+            conn.commit()
+        global_conn.commit()
+    finally:
+        for conn in shard_conns.values():
+            conn.close()
+        global_conn.close()
+        source.close()
+
+    # ربط الحالات التي لم تكن مرتبطة بمشترك في الملف الأصلي
+    manager.migrate_subscribers()
+
+    return summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("الاستخدام: python customer_issues_sharding.py migrate [source_db] [shards_path]")
+        sys.exit(1)
+    source_db = sys.argv[2] if len(sys.argv) > 2 else "customer_issues_enhanced.db"
+    shards_path = sys.argv[3] if len(sys.argv) > 3 else "shards"
+    result = migrate_to_shards(source_db, shards_path)
+    for (year, table), count in sorted(result.items(), key=lambda item: str(item[0])):
+        print(f"{year} - {table}: {count}")
+    print(f"تم الترحيل إلى: {shards_path}")
+    print('لتفعيل الملفات السنوية أضف "database_layout": "sharded" إلى config.json')
@@ -0,0 +1,175 @@
+import os
+import time
+import zlib
+import struct
+import marshal
+
+from customer_issues_database import SCHEMA_VERSION
+
+# لقطة قائمة الحالات المحفوظة عند الإغلاق للرسم الفوري عند التشغيل التالي
+DEFAULT_SNAPSHOT_PATH = os.path.join('cache', 'case_list.snapshot')
+
+# الرأس: العلامة، إصدار التنسيق، CRC32 للمحتوى، طول المحتوى
+SNAPSHOT_MAGIC = b'CISN'
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_HEADER = struct.Struct('<4sHIQ')
+
+# أعمدة ملخص الحالة المخزنة (نفس مفاتيح query_cases) كسجل tuple لكل حالة
+SNAPSHOT_CASE_FIELDS = ('id', 'customer_name', 'subscriber_number', 'status', 'category_name',
+                        'color_code', 'modified_by_name', 'created_date', 'modified_date')
+
+# لا نحفظ أكثر من هذا العدد؛ اللقطة الناقصة تُكمل من قاعدة البيانات في الخلفية
+MAX_SNAPSHOT_CASES = 2000
+
+# اللقطة الأقدم من هذا تُهمل (البيانات المرجعية قد تكون تغيرت)
+MAX_SNAPSHOT_AGE = 30 * 24 * 3600
+
+
+class CaseListSnapshot:
+    """محتوى لقطة قائمة الحالات بعد التحقق منها"""
+
+    def __init__(self, version, cases, complete, years, categories, statuses, view, saved_at):
+        self.version = version
+        self.cases = cases
+        self.complete = complete
+        self.years = years
+        self.categories = categories
+        self.statuses = statuses
+        self.view = view
+        self.saved_at = saved_at
+
+    def __repr__(self):
+        return f"CaseListSnapshot(cases={len(self.cases)}, complete={self.complete}, version={self.version!r})"
+
+
+def database_identity(database):
+    """مسار ملف قاعدة البيانات (اللقطة تخص ملفاً واحداً فقط)"""
+    return os.path.abspath(database.db_name)
+
+
+def _freeze_version(version):
+    # marshal لا يحفظ إلا الأنواع الأساسية: الإصدار رقم أو tuple من (السنة، الرقم)
+    if isinstance(version, (tuple, list)):
+        return tuple((int(year), int(seq)) for year, seq in version)
+    return int(version or 0)
+
+
+def version_is_ahead(saved, current):
+    """هل إصدار اللقطة أحدث من قاعدة البيانات (استُبدل الملف بنسخة أقدم)"""
+    if isinstance(saved, tuple) != isinstance(current, tuple):
+        return True
+    if isinstance(saved, tuple):
+        current_by_year = dict(current)
+        return any(year not in current_by_year or seq > current_by_year[year] for year, seq in saved)
+    return saved > current
+
+
+def save_snapshot(database, cases, years, categories, statuses, view=None, version=None,
+                  path=DEFAULT_SNAPSHOT_PATH, max_cases=MAX_SNAPSHOT_CASES):
+    """حفظ لقطة مدمجة لملخصات الحالات والبيانات المرجعية (كتابة ذرية)
+
+    version هو إصدار البيانات (سجل التغييرات) الذي تطابقه الحالات المعروضة.
+    """
+    records = tuple(
+        tuple(case.get(field) for field in SNAPSHOT_CASE_FIELDS) if isinstance(case, dict) else tuple(case[:len(SNAPSHOT_CASE_FIELDS)])
+        for case in cases[:max_cases]
+    )
+    payload = marshal.dumps({
+        'schema': SCHEMA_VERSION,
+        'database': database_identity(database),
+        'version': _freeze_version(database.get_data_version() if version is None else version),
+        'saved_at': time.time(),
+        'complete': len(cases) <= max_cases,
+        'cases': records,
+        'years': tuple(str(year) for year in years),
+        'categories': tuple(tuple(row) for row in categories),
+        'statuses': tuple(tuple(row) for row in statuses),
+        'view': dict(view or {})
+    })
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, zlib.crc32(payload), len(payload))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(temp_path, path)
+        return True
+    except OSError as e:
+        print(f"خطأ في حفظ لقطة قائمة الحالات: {e}")
+        return False
+
+
+def discard_snapshot(path=DEFAULT_SNAPSHOT_PATH):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _read_payload(path):
+    """قراءة محتوى اللقطة بعد فحص الرأس والطول وCRC (None إذا كانت تالفة)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < SNAPSHOT_HEADER.size:
+        return None
+    magic, file_format, crc, length = SNAPSHOT_HEADER.unpack_from(data)
+    payload = data[SNAPSHOT_HEADER.size:]
+    if magic != SNAPSHOT_MAGIC or file_format != SNAPSHOT_FORMAT or length != len(payload) or zlib.crc32(payload) != crc:
+        return None
+    try:
+        content = marshal.loads(payload)
+    except (EOFError, ValueError, TypeError):
+        return None
+    return content if isinstance(content, dict) else None
+
+
+def load_snapshot(database, path=DEFAULT_SNAPSHOT_PATH, max_age=MAX_SNAPSHOT_AGE):
+    """تحميل اللقطة إذا كانت سليمة وصالحة لقاعدة البيانات الحالية، وإلا حذفها وإرجاع None
+
+    اللقطة الصالحة قد تكون متأخرة عن قاعدة البيانات؛ التغييرات بعد version تُطبق
+    لاحقاً من سجل التغييرات. تُهمل اللقطة إذا كانت تالفة، أو من إصدار مخطط آخر أو
+    ملف آخر، أو قديمة جداً، أو لم يعد سجل التغييرات يغطي الفترة منذ حفظها، أو كان
+    إصدارها أحدث من قاعدة البيانات.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        content = _read_payload(path)
+    except OSError as e:
+        print(f"خطأ في قراءة لقطة قائمة الحالات: {e}")
+        return None
+    reason = None
+    if content is None:
+        reason = "ملف تالف"
+    elif content.get('schema') != SCHEMA_VERSION or content.get('database') != database_identity(database):
+        reason = "لقطة لمخطط أو ملف بيانات آخر"
+    elif time.time() - content.get('saved_at', 0) > max_age:
+        reason = "لقطة قديمة"
+    else:
+        version = content.get('version')
+        if version_is_ahead(version, _freeze_version(database.get_data_version())):
+            reason = "إصدار اللقطة أحدث من قاعدة البيانات"
+        elif database.get_changes_since(version)[0] is None:
+            reason = "سجل التغييرات لا يغطي الفترة منذ حفظ اللقطة"
+    if reason:
+        print(f"تم تجاهل لقطة قائمة الحالات: {reason}")
+        discard_snapshot(path)
+        return None
+    try:
+        return CaseListSnapshot(
+            version=content['version'],
+            cases=[dict(zip(SNAPSHOT_CASE_FIELDS, record)) for record in content['cases']],
+            complete=content['complete'],
+            years=list(content['years']),
+            categories=[tuple(row) for row in content['categories']],
+            statuses=[tuple(row) for row in content['statuses']],
+            view=content.get('view', {}),
+            saved_at=content['saved_at']
+        )
+    except (KeyError, TypeError, ValueError):
+        print("تم تجاهل لقطة قائمة الحالات: محتوى غير مكتمل")
+        discard_snapshot(path)
+        return None
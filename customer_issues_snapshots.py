@@ -0,0 +1,389 @@
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from customer_issues_blob_store import BLOB_FOLDER, HASH_CHUNK_SIZE, is_within
+from customer_issues_ingest import INCOMING_FOLDER
+
+# لقطات مجلد المرفقات (داخل مجلد المشروع)
+DEFAULT_SNAPSHOT_FOLDER = os.path.join('backups', 'files')
+SNAPSHOT_NAME_FORMAT = "%Y%m%d_%H%M%S"
+SNAPSHOT_DATA_FOLDER = "data"
+MANIFEST_NAME = "manifest.json"
+PARTIAL_SUFFIX = ".partial"
+
+LOCK_NAME = ".lock"
+# قفل أقدم من هذا تركته عملية توقفت
+LOCK_MAX_AGE = 6 * 3600
+
+# الإعدادات الافتراضية للاحتفاظ: آخر 7 لقطات وكل لقطات آخر 30 يوماً
+DEFAULT_KEEP_LAST = 7
+DEFAULT_DAYS_TO_KEEP = 30
+# الفاصل بين لقطتين تلقائيتين
+DEFAULT_SNAPSHOT_INTERVAL = timedelta(days=1)
+
+# ملفات وسيطة لعمليات لم تكتمل (نسخ جزئي، أرشفة جارية)
+SKIPPED_SUFFIXES = ('.part', '.tmp', '.journal', '.restore')
+
+
+class SnapshotBusy(Exception):
+    """عملية أخرى تنشئ لقطة أو تحذف لقطات في نفس المجلد"""
+
+
+class SnapshotCancelled(Exception):
+    """أُلغي إنشاء اللقطة"""
+
+
+def _copy_with_hash(source_path, target_path):
+    """نسخ الملف مع حساب بصمته في نفس القراءة (مع الحفاظ على وقت التعديل)"""
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        while True:
+            chunk = source.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            target.write(chunk)
+    shutil.copystat(source_path, target_path)
+    return digest.hexdigest()
+
+
+def _blob_name_hash(relative_path):
+    """بصمة ملف مخزن المحتوى من اسمه (blobs/ab/<البصمة>.ext) بدون قراءته"""
+    parts = relative_path.split('/')
+    if len(parts) != 3 or parts[0] != BLOB_FOLDER:
+        return None
+    stem = os.path.splitext(parts[2])[0]
+    if len(stem) == 64 and all(c in '0123456789abcdef' for c in stem):
+        return stem
+    return None
+
+
+class SnapshotBackup:
+    """لقطات احتياطية لمجلد المرفقات بروابط صلبة (hard links)
+
+    كل لقطة مجلد كامل (<الاسم>/data) مع manifest.json يحفظ حجم كل ملف ووقت
+    تعديله وبصمته. الملف الذي لم يتغير حجمه ووقت تعديله منذ اللقطة السابقة،
+    أو الذي توجد بصمته فيها (ملف منقول أو معاد تسميته)، يُربط بنفس ملف اللقطة
+    السابقة بدلاً من نسخه، فلا تُنسخ إلا الملفات الجديدة أو المعدلة.
+
+    الربط يكون بين اللقطات فقط وليس مع الملفات الأصلية، فتعديل ملف أصلي لا
+    يغير أي لقطة. اللقطة تُكتب باسم .partial ولا تُعتمد إلا بعد كتابة manifest
+    وإعادة تسميتها. حذف أي لقطة لا يفسد غيرها (الملف المرتبط يبقى ما دام له رابط
+    في لقطة أخرى)، وآخر لقطة مكتملة لا تُحذف أبداً لأن اللقطة التالية تُبنى عليها.
+    """
+
+    def __init__(self, source_root, backup_root, exclude=()):
+        self.source_root = os.path.abspath(source_root)
+        self.backup_root = os.path.abspath(backup_root)
+        # مجلد اللقطات نفسه لا يُنسخ إذا كان داخل مجلد المرفقات
+        self.exclude = [os.path.abspath(path) for path in exclude] + [self.backup_root]
+
+    def snapshot_path(self, name):
+        return os.path.join(self.backup_root, name)
+
+    def list_snapshots(self):
+        """أسماء اللقطات المكتملة (من الأقدم للأحدث)"""
+        if not os.path.isdir(self.backup_root):
+            return []
+        return sorted(entry.name for entry in os.scandir(self.backup_root)
+                      if entry.is_dir() and not entry.name.endswith(PARTIAL_SUFFIX)
+                      and os.path.isfile(os.path.join(entry.path, MANIFEST_NAME)))
+
+    def latest(self):
+        snapshots = self.list_snapshots()
+        return snapshots[-1] if snapshots else None
+
+    def load_manifest(self, name):
+        try:
+            with open(os.path.join(self.snapshot_path(name), MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"خطأ في قراءة بيان اللقطة {name}: {e}")
+            return None
+
+    def create_snapshot(self, progress=None, cancel_event=None):
+        """إنشاء لقطة جديدة وإرجاع تقريرها
+
+        progress(files) بعدد الملفات المعالجة.
+        """
+        started = time.perf_counter()
+        with self._lock():
+            self._remove_partials()
+            previous_name = self.latest()
+            previous_manifest = self.load_manifest(previous_name) if previous_name else None
+            previous = previous_manifest['files'] if previous_manifest else {}
+            previous_data = os.path.join(self.snapshot_path(previous_name), SNAPSHOT_DATA_FOLDER) if previous_name else None
+            by_hash = {entry[2]: self._data_path(previous_data, relative)
+                       for relative, entry in previous.items() if entry[2]}
+
+            name = self._new_name()
+            partial = self.snapshot_path(name + PARTIAL_SUFFIX)
+            data = os.path.join(partial, SNAPSHOT_DATA_FOLDER)
+            os.makedirs(data)
+            report = {'name': name, 'previous': previous_name, 'files': 0, 'linked': 0, 'copied': 0,
+                      'hashed': 0, 'linked_bytes': 0, 'copied_bytes': 0}
+            files = {}
+            can_link = True
+            try:
+                for relative, path, stat in self._walk_source():
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise SnapshotCancelled(name)
+                    target = self._data_path(data, relative)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    old = previous.get(relative)
+                    if old and old[0] == stat.st_size and old[1] == stat.st_mtime_ns:
+                        sha256 = old[2]
+                        link_source = self._data_path(previous_data, relative)
+                    else:
+                        sha256 = _blob_name_hash(relative)
+                        link_source = by_hash.get(sha256) if sha256 else None
+
+                    linked = False
+                    if link_source and can_link:
+                        linked, can_link = self._try_link(link_source, target)
+                    if not linked and sha256 is None:
+                        # ملف جديد أو معدل: البصمة تُحسب أثناء نسخه ثم يُربط إذا كان محتواه موجوداً
+                        sha256 = _copy_with_hash(path, target)
+                        report['hashed'] += 1
+                        duplicate = by_hash.get(sha256)
+                        if duplicate and can_link:
+                            os.remove(target)
+                            linked, can_link = self._try_link(duplicate, target)
+                            if not linked:
+                                _copy_with_hash(path, target)
+                    elif not linked:
+                        shutil.copy2(path, target)
+
+                    by_hash.setdefault(sha256, target)
+                    files[relative] = [stat.st_size, stat.st_mtime_ns, sha256]
+                    report['files'] += 1
+                    report['linked' if linked else 'copied'] += 1
+                    report['linked_bytes' if linked else 'copied_bytes'] += stat.st_size
+                    if progress:
+                        progress(report['files'])
+                report['seconds'] = round(time.perf_counter() - started, 2)
+                manifest = {'created': datetime.now().isoformat(timespec='seconds'),
+                            'source': self.source_root, 'report': report, 'files': files}
+                with open(os.path.join(partial, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.rename(partial, self.snapshot_path(name))
+            except BaseException:
+                # لقطة ناقصة لا تصلح للاستعادة ولا كأساس للقطة التالية
+                shutil.rmtree(partial, ignore_errors=True)
+                raise
+        return report
+
+    def restore_snapshot(self, name, target_root=None):
+        """استعادة ملفات لقطة إلى target_root (الافتراضي: مجلد المرفقات نفسه)
+
+        الملفات المطابقة في الحجم ووقت التعديل لا تُنسخ. كل ملف يُطابق مع بصمته في
+        البيان قبل استبدال الملف الحالي. الملفات غير الموجودة في اللقطة لا تُحذف.
+        """
+        manifest = self.load_manifest(name)
+        if manifest is None:
+            raise FileNotFoundError(self.snapshot_path(name))
+        target_root = os.path.abspath(target_root or self.source_root)
+        data = os.path.join(self.snapshot_path(name), SNAPSHOT_DATA_FOLDER)
+        report = {'restored': 0, 'unchanged': 0, 'restored_bytes': 0, 'corrupt': [], 'failed': []}
+        for relative, (size, mtime_ns, sha256) in manifest['files'].items():
+            target = self._data_path(target_root, relative)
+            try:
+                stat = os.stat(target)
+                if stat.st_size == size and stat.st_mtime_ns == mtime_ns:
+                    report['unchanged'] += 1
+                    continue
+            except FileNotFoundError:
+                pass
+            temp_path = target + '.restore'
+            try:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                digest = _copy_with_hash(self._data_path(data, relative), temp_path)
+                if sha256 and digest != sha256:
+                    os.remove(temp_path)
+                    report['corrupt'].append(relative)
+                    continue
+                os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+                os.replace(temp_path, target)
+            except OSError as e:
+                print(f"خطأ في استعادة الملف {relative}: {e}")
+                report['failed'].append(relative)
+                continue
+            report['restored'] += 1
+            report['restored_bytes'] += size
+        return report
+
+    def prune(self, keep_last=DEFAULT_KEEP_LAST, days_to_keep=DEFAULT_DAYS_TO_KEEP):
+        """حذف اللقطات القديمة مع الاحتفاظ بآخر keep_last لقطة وبلقطات آخر days_to_keep يوماً
+
+        آخر لقطة مكتملة تبقى دائماً. المساحة المحررة هي الملفات التي لم يكن لها
+        رابط في لقطة أخرى.
+        """
+        report = {'removed': [], 'freed_bytes': 0}
+        with self._lock():
+            snapshots = self.list_snapshots()
+            if not snapshots:
+                return report
+            keep = set(snapshots[-max(keep_last, 1):])
+            cutoff = (datetime.now() - timedelta(days=days_to_keep)).strftime(SNAPSHOT_NAME_FORMAT)
+            for name in snapshots:
+                if name in keep or name >= cutoff:
+                    continue
+                path = self.snapshot_path(name)
+                freed = 0
+                for directory, _, file_names in os.walk(path):
+                    for file_name in file_names:
+                        try:
+                            stat = os.stat(os.path.join(directory, file_name))
+                            if stat.st_nlink <= 1:
+                                freed += stat.st_size
+                        except OSError:
+                            pass
+                try:
+                    # البيان أولاً: لقطة حُذف جزء منها لا تظهر كلقطة مكتملة
+                    os.remove(os.path.join(path, MANIFEST_NAME))
+                    shutil.rmtree(path)
+                except OSError as e:
+                    print(f"فشل في حذف اللقطة {name}: {e}")
+                    continue
+                report['removed'].append(name)
+                report['freed_bytes'] += freed
+        return report
+
+    def _walk_source(self):
+        """(المسار النسبي بفواصل /، المسار الكامل، stat) لكل ملف في مجلد المرفقات"""
+        incoming = os.path.join(self.source_root, BLOB_FOLDER, INCOMING_FOLDER)
+        pending = [self.source_root]
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except OSError as e:
+                print(f"خطأ في قراءة المجلد {directory}: {e}")
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir():
+                        if entry.path != incoming and not any(is_within(entry.path, path) for path in self.exclude):
+                            pending.append(entry.path)
+                    elif entry.is_file() and not entry.name.endswith(SKIPPED_SUFFIXES):
+                        relative = os.path.relpath(entry.path, self.source_root).replace(os.sep, '/')
+                        yield relative, entry.path, entry.stat()
+                except OSError as e:
+                    print(f"خطأ في قراءة الملف {entry.path}: {e}")
+
+    @staticmethod
+    def _data_path(root, relative):
+        return os.path.join(root, *relative.split('/'))
+
+    @staticmethod
+    def _try_link(source, target):
+        """(هل تم الربط، هل يمكن الربط لاحقاً)"""
+        try:
+            os.link(source, target)
+            return True, True
+        except FileNotFoundError:
+            # ملف اللقطة السابقة غير موجود: يُنسخ من الأصل
+            return False, True
+        except OSError as e:
+            if e.errno == errno.EMLINK:
+                # الحد الأقصى لعدد الروابط لهذا الملف: نسخة جديدة تبدأ سلسلة روابط جديدة
+                return False, True
+            # نظام الملفات لا يدعم الروابط الصلبة (مثل FAT): نسخ كامل لبقية الملفات
+            print(f"تعذر إنشاء رابط صلب، سيتم النسخ بدلاً منه: {e}")
+            return False, False
+
+    def _new_name(self):
+        name = datetime.now().strftime(SNAPSHOT_NAME_FORMAT)
+        candidate, counter = name, 1
+        while os.path.exists(self.snapshot_path(candidate)):
+            candidate = f"{name}_{counter}"
+            counter += 1
+        return candidate
+
+    def _remove_partials(self):
+        for entry in os.scandir(self.backup_root):
+            if entry.is_dir() and entry.name.endswith(PARTIAL_SUFFIX):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    @contextmanager
+    def _lock(self):
+        os.makedirs(self.backup_root, exist_ok=True)
+        lock_path = os.path.join(self.backup_root, LOCK_NAME)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if time.time() - os.path.getmtime(lock_path) < LOCK_MAX_AGE:
+                raise SnapshotBusy(lock_path)
+            os.remove(lock_path)
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.close(fd)
+        try:
+            yield
+        finally:
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+
+def snapshot_if_due(source_root, backup_root, interval=DEFAULT_SNAPSHOT_INTERVAL,
+                    keep_last=DEFAULT_KEEP_LAST, days_to_keep=DEFAULT_DAYS_TO_KEEP, cancel_event=None):
+    """إنشاء لقطة إذا مضى interval منذ آخر لقطة ثم حذف القديمة (None إذا لم يحن الوقت)
+
+    cancel_event يوقف اللقطة الجارية (SnapshotCancelled) مع حذف الجزء المنسوخ وتحرير القفل.
+    """
+    backup = SnapshotBackup(source_root, backup_root)
+    latest = backup.latest()
+    if latest and datetime.now() - datetime.strptime(latest[:15], SNAPSHOT_NAME_FORMAT) < interval:
+        return None
+    report = backup.create_snapshot(cancel_event=cancel_event)
+    report['pruned'] = backup.prune(keep_last, days_to_keep)
+    return report
+
+
+if __name__ == "__main__":
+    commands = ("create", "list", "restore", "prune")
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("الاستخدام: python customer_issues_snapshots.py create|list|prune [files_path]")
+        print("           python customer_issues_snapshots.py restore <اسم_اللقطة> [مجلد_الاستعادة]")
+        sys.exit(1)
+    from customer_issues_file_manager import FileManager, PROJECT_ROOT
+    format_size = FileManager().format_size
+    command = sys.argv[1]
+    files_path = os.path.join(PROJECT_ROOT, "files")
+    if command != "restore" and len(sys.argv) > 2:
+        files_path = os.path.abspath(sys.argv[2])
+    backup = SnapshotBackup(files_path, os.path.join(PROJECT_ROOT, DEFAULT_SNAPSHOT_FOLDER))
+    if command == "create":
+        result = backup.create_snapshot()
+        print(f"اللقطة: {result['name']} - الملفات: {result['files']} ({result['seconds']} ثانية)")
+        print(f"منسوخة: {result['copied']} ({format_size(result['copied_bytes'])}) - "
+              f"مرتبطة: {result['linked']} ({format_size(result['linked_bytes'])})")
+    elif command == "list":
+        for name in backup.list_snapshots():
+            manifest = backup.load_manifest(name)
+            if manifest:
+                stats = manifest['report']
+                print(f"{name}: {stats['files']} ملف - منسوخ {format_size(stats['copied_bytes'])}")
+    elif command == "restore":
+        if len(sys.argv) < 3:
+            print("يرجى تحديد اسم اللقطة")
+            sys.exit(1)
+        result = backup.restore_snapshot(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        print(f"المستعادة: {result['restored']} ({format_size(result['restored_bytes'])}) - بدون تغيير: {result['unchanged']}")
+        if result['corrupt'] or result['failed']:
+            print(f"تالفة في اللقطة: {len(result['corrupt'])} - تعذرت استعادتها: {len(result['failed'])}")
+    else:
+        result = backup.prune()
+        print(f"اللقطات المحذوفة: {len(result['removed'])} - المساحة المحررة: {format_size(result['freed_bytes'])}")
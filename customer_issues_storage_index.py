@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+
+from customer_issues_blob_store import hash_file, resolve_stored_path
+
+# عدد صفوف فهرس التخزين في كل معاملة كتابة أثناء المطابقة
+RECONCILE_BATCH_SIZE = 500
+
+
+def scan_directory(directory):
+    """{اسم الملف: (الحجم، وقت التعديل)} لملفات المجلد بقراءة واحدة (os.scandir)
+
+    في ويندوز يأتي الحجم ووقت التعديل مع قائمة الملفات نفسها بدون استدعاء stat
+    لكل ملف، وهذا ما يجعل المطابقة سريعة على مجلدات الشبكة.
+    """
+    listing = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        listing[entry.name] = (stat.st_size, stat.st_mtime)
+                except OSError:
+                    pass
+    except OSError:
+        # المجلد غير موجود أو غير متاح
+        pass
+    return listing
+
+
+def check_directory_rows(directory, rows, verify_blobs=False):
+    """تصنيف مرفقات مجلد واحد: [(الحالة، المسار، الصف، (الحجم، وقت التعديل)، البصمة الحالية)]
+
+    rows: [(المسار، صف get_storage_index_rows)] لملفات نفس المجلد، والمجلد يُقرأ مرة واحدة.
+    الحالة: 'missing' الملف غير موجود، 'unchanged' الفهرس مطابق، 'stale' تغير الحجم أو
+    وقت التعديل أو لم يُفهرس بعد (مع البصمة الحالية)، 'unreadable' تعذرت قراءة البصمة.
+    ملفات المخزن بصمتها هي اسمها فلا تُقرأ إلا مع verify_blobs.
+    """
+    listing = scan_directory(directory)
+    results = []
+    for path, row in rows:
+        attachment_id, case_id, file_path, blob_hash, size, mtime, sha256, missing, indexed = row
+        current = listing.get(os.path.basename(path))
+        if current is None and os.path.exists(path):
+            # اختلاف حالة الأحرف في اسم الملف (ويندوز)
+            stat = os.stat(path)
+            current = (stat.st_size, stat.st_mtime)
+        if current is None:
+            results.append(('missing', path, row, None, None))
+            continue
+        if indexed and not missing and (size, mtime) == current and sha256:
+            results.append(('unchanged', path, row, current, sha256))
+            continue
+        if blob_hash and not verify_blobs:
+            results.append(('stale', path, row, current, blob_hash))
+            continue
+        try:
+            results.append(('stale', path, row, current, hash_file(path)[0]))
+        except OSError as e:
+            print(f"خطأ في قراءة الملف {path}: {e}")
+            results.append(('unreadable', path, row, current, None))
+    return results
+
+
+def reconcile_storage_index(database, project_root, cancel_event=None, batch_size=RECONCILE_BATCH_SIZE):
+    """مطابقة فهرس التخزين مع الملفات الفعلية وتصحيح أي اختلاف
+
+    كل مجلد يُقرأ مرة واحدة. الملف الذي تغير حجمه أو وقت تعديله تُعاد قراءة
+    بصمته (ملفات المخزن بصمتها هي اسمها فلا تُقرأ). تُرجع تقريراً بالأعداد.
+    """
+    started = time.perf_counter()
+    report = {'checked': 0, 'added': 0, 'updated': 0, 'missing': 0, 'hashed': 0}
+    rows_by_directory = {}
+    for row in database.get_storage_index_rows():
+        path = resolve_stored_path(row[2], project_root)
+        if path:
+            rows_by_directory.setdefault(os.path.dirname(path), []).append((path, row))
+
+    pending = []
+    for directory, rows in rows_by_directory.items():
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        for status, path, row, current, current_hash in check_directory_rows(directory, rows):
+            attachment_id, case_id, file_path, blob_hash, size, mtime, sha256, missing, indexed = row
+            report['checked'] += 1
+            if status == 'missing':
+                report['missing'] += 1
+                if not indexed or not missing:
+                    pending.append((attachment_id, case_id, size, mtime, sha256 or blob_hash, 1))
+                continue
+            if status == 'unchanged':
+                continue
+            if status == 'stale' and not blob_hash:
+                report['hashed'] += 1
+            report['added' if not indexed else 'updated'] += 1
+            pending.append((attachment_id, case_id, current[0], current[1], current_hash, 0))
+            if len(pending) >= batch_size:
+                database.update_storage_index(pending)
+                pending = []
+    if pending:
+        database.update_storage_index(pending)
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    return report
+
+
+if __name__ == "__main__":
+    commands = ("reconcile", "report")
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("الاستخدام: python customer_issues_storage_index.py reconcile|report")
+        sys.exit(1)
+    from customer_issues_database import enhanced_db
+    from customer_issues_file_manager import FileManager, PROJECT_ROOT
+    format_size = FileManager().format_size
+    if sys.argv[1] == "reconcile":
+        result = reconcile_storage_index(enhanced_db, PROJECT_ROOT)
+        print(f"تم فحص {result['checked']} مرفق في {result['seconds']} ثانية")
+        print(f"جديدة: {result['added']} - متغيرة: {result['updated']} - مفقودة: {result['missing']} - أعيدت بصمتها: {result['hashed']}")
+    totals = enhanced_db.get_storage_totals()
+    print(f"المرفقات: {totals['files']} - الحجم: {format_size(totals['bytes'])} - المساحة الفعلية: {format_size(totals['unique_bytes'])}")
+    for year, year_totals in sorted(totals['by_year'].items(), key=lambda item: str(item[0])):
+        print(f"  {year}: {year_totals['files']} مرفق - {format_size(year_totals['bytes'])}")
+    if totals['missing'] or totals['unindexed']:
+        print(f"ملفات مفقودة: {totals['missing']} - لم تُفحص بعد: {totals['unindexed']}")
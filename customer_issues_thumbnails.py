@@ -0,0 +1,327 @@
+import io
+import os
+import sys
+import math
+import hashlib
+import tempfile
+import threading
+import tkinter as tk
+from collections import OrderedDict
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# مصغرات صور المرفقات (ملف PNG لكل محتوى ومقاس)
+DEFAULT_THUMBNAIL_FOLDER = os.path.join('cache', 'thumbnails')
+DEFAULT_THUMBNAIL_SIZE = 96
+
+# الحد الأقصى لحجم مجلد المصغرات؛ الأقدم استخداماً يُحذف عند تجاوزه
+DEFAULT_CACHE_BUDGET = 64 * 1024 * 1024
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+# بدون Pillow يُصغّر Tk نفسه هذه الأنواع فقط (في خيط الواجهة)
+TK_IMAGE_EXTENSIONS = {'.png', '.gif'}
+
+
+def can_thumbnail(file_path):
+    """هل يمكن إنشاء مصغرة لهذا الملف بالمكتبات المتوفرة"""
+    extension = os.path.splitext(str(file_path))[1].lower()
+    return extension in (IMAGE_EXTENSIONS if PIL_AVAILABLE else TK_IMAGE_EXTENSIONS)
+
+
+def thumbnail_key(file_path, blob_hash=None):
+    """مفتاح المصغرة: بصمة المحتوى للمرفقات المنسوخة
+
+    الملفات المرتبطة (بدون blob_hash) تُعرف بمسارها وحجمها ووقت تعديلها، فتتغير
+    المصغرة إذا عُدل الملف.
+    """
+    if blob_hash:
+        return blob_hash
+    stat = os.stat(file_path)
+    identity = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+
+class ThumbnailCache:
+    """ذاكرة مصغرات على القرص بحد أقصى للحجم (LRU)
+
+    ترتيب الاستخدام يُحفظ في وقت تعديل الملف (يُحدّث عند كل استخدام) حتى يبقى
+    صحيحاً بين مرات التشغيل. يمكن استخدامها من عدة خيوط.
+    """
+
+    def __init__(self, root=DEFAULT_THUMBNAIL_FOLDER, max_bytes=DEFAULT_CACHE_BUDGET):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def path_for(self, key, size):
+        return os.path.join(self.root, key[:2], f"{key}_{size}.png")
+
+    def _load(self):
+        # فهرس الملفات الموجودة من الأقدم استخداماً إلى الأحدث (مرة واحدة)
+        if self._entries is not None:
+            return
+        files = []
+        if os.path.isdir(self.root):
+            for folder in os.scandir(self.root):
+                if not folder.is_dir():
+                    continue
+                for entry in os.scandir(folder.path):
+                    if entry.name.endswith('.png'):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, entry.path, stat.st_size))
+        files.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in files)
+        self.total_bytes = sum(self._entries.values())
+
+    def get(self, key, size):
+        """مسار المصغرة المخزنة أو None"""
+        path = self.path_for(key, size)
+        with self._lock:
+            self._load()
+            if path not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            # حُذف الملف من خارج البرنامج
+            self.forget(path)
+            return None
+        return path
+
+    def put(self, key, size, data):
+        """تخزين بيانات PNG للمصغرة (كتابة ذرية) وإرجاع مسارها"""
+        path = self.path_for(key, size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._load()
+            self.total_bytes -= self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self.total_bytes += len(data)
+            self._evict()
+        return path
+
+    def forget(self, path):
+        with self._lock:
+            if self._entries is not None and path in self._entries:
+                self.total_bytes -= self._entries.pop(path)
+
+    def _evict(self):
+        # المصغرة المضافة للتو لا تُحذف حتى لو كانت أكبر من الحد
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def thumbnail_for(self, file_path, blob_hash=None, size=DEFAULT_THUMBNAIL_SIZE):
+        """مسار مصغرة الصورة (من الذاكرة أو بإنشائها بـ Pillow)
+
+        تُرجع None إذا لم تكن Pillow متوفرة والمصغرة غير مخزنة (تُنشأ حينها بـ
+        generate_with_tk في خيط الواجهة).
+        """
+        key = thumbnail_key(file_path, blob_hash)
+        path = self.get(key, size)
+        if path or not PIL_AVAILABLE:
+            return path
+        with Image.open(file_path) as image:
+            # فك ترميز JPEG بدقة أقل مباشرة (أسرع بكثير لصور الكاميرات)
+            image.draft('RGB', (size * 2, size * 2))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG', optimize=True)
+        return self.put(key, size, buffer.getvalue())
+
+    def generate_with_tk(self, master, file_path, blob_hash=None, size=DEFAULT_THUMBNAIL_SIZE):
+        """إنشاء مصغرة PNG/GIF بـ Tk (بدون Pillow؛ في خيط الواجهة فقط)"""
+        key = thumbnail_key(file_path, blob_hash)
+        image = tk.PhotoImage(master=master, file=file_path)
+        factor = max(1, math.ceil(max(image.width(), image.height()) / size))
+        small = image.subsample(factor) if factor > 1 else image
+        fd, temp_path = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        try:
+            small.write(temp_path, format='png')
+            with open(temp_path, 'rb') as f:
+                data = f.read()
+        finally:
+            os.remove(temp_path)
+        return self.put(key, size, data)
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {'files': len(self._entries), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class ThumbnailStrip:
+    """شريط أفقي لمصغرات صور المرفقات
+
+    المصغرات غير المخزنة تُنشأ في خيط خلفي وتظهر عند اكتمالها، والمخزنة تظهر
+    مباشرة. النقر على المصغرة يستدعي on_open(row).
+    """
+
+    def __init__(self, parent, cache, runner, resolve_path, on_open=None, size=DEFAULT_THUMBNAIL_SIZE, bg='#ffffff'):
+        self.cache = cache
+        self.runner = runner
+        self.resolve_path = resolve_path
+        self.on_open = on_open
+        self.size = size
+        self._tasks = []
+        self._photos = {}
+        self._labels = {}
+        self._tk_queue = []
+        self._tk_job = None
+        self._generation = 0
+
+        self.frame = tk.Frame(parent, bg=bg)
+        self.canvas = tk.Canvas(self.frame, height=size + 30, bg=bg, highlightthickness=0)
+        scrollbar = tk.Scrollbar(self.frame, orient='horizontal', command=self.canvas.xview)
+        self.canvas.configure(xscrollcommand=scrollbar.set)
+        self.canvas.pack(side='top', fill='x')
+        scrollbar.pack(side='top', fill='x')
+        self.inner = tk.Frame(self.canvas, bg=bg)
+        self.canvas.create_window((0, 0), window=self.inner, anchor='nw')
+        self.inner.bind('<Configure>', lambda e: self.canvas.configure(scrollregion=self.canvas.bbox('all')))
+        self.frame.bind('<Destroy>', self._on_destroy)
+        self._pack_options = None
+
+    def pack(self, **options):
+        # الشريط يظهر فقط عند وجود صور
+        self._pack_options = options
+        return self
+
+    def clear(self):
+        """إخفاء الشريط وإلغاء المصغرات الجاري إنشاؤها"""
+        self._generation += 1
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._tk_queue = []
+        if self._tk_job is not None:
+            self.frame.after_cancel(self._tk_job)
+            self._tk_job = None
+        for child in self.inner.winfo_children():
+            child.destroy()
+        self._photos.clear()
+        self._labels.clear()
+        self.frame.pack_forget()
+
+    def show(self, rows):
+        """عرض مصغرات الصور من صفوف المرفقات"""
+        self.clear()
+        images = []
+        for row in rows:
+            path = self.resolve_path(row.get('file_path'))
+            if path and can_thumbnail(path):
+                images.append((row, path))
+        if not images:
+            return
+        if self._pack_options is not None:
+            self.frame.pack(**self._pack_options)
+        generation = self._generation
+        for index, (row, path) in enumerate(images):
+            label = tk.Label(self.inner, text=row.get('file_name') or '', compound='top',
+                             wraplength=self.size, bg='#ecf0f1', cursor='hand2', font=('Arial', 8))
+            label.pack(side='right', padx=3, pady=3)
+            label.bind('<Button-1>', lambda e, row=row: self.on_open(row) if self.on_open else None)
+            self._labels[index] = label
+            cached = self.cache.get(row['blob_hash'], self.size) if row.get('blob_hash') else None
+            if cached:
+                self._set_image(generation, index, cached)
+            else:
+                self._tasks.append(self.runner.submit(
+                    self.cache.thumbnail_for, path, row.get('blob_hash'), self.size,
+                    on_done=lambda thumbnail, index=index, row=row, path=path:
+                        self._on_thumbnail(generation, index, row, path, thumbnail),
+                    on_error=lambda error, index=index: self._on_failed(generation, index, error)
+                ))
+
+    def _on_thumbnail(self, generation, index, row, path, thumbnail):
+        if generation != self._generation:
+            return
+        if thumbnail:
+            self._set_image(generation, index, thumbnail)
+        else:
+            # بدون Pillow: صورة واحدة في كل دورة للحفاظ على استجابة الواجهة
+            self._tk_queue.append((index, row, path))
+            if self._tk_job is None:
+                self._tk_job = self.frame.after_idle(self._generate_next_with_tk)
+
+    def _generate_next_with_tk(self):
+        self._tk_job = None
+        if not self._tk_queue:
+            return
+        index, row, path = self._tk_queue.pop(0)
+        try:
+            thumbnail = self.cache.generate_with_tk(self.frame, path, row.get('blob_hash'), self.size)
+            self._set_image(self._generation, index, thumbnail)
+        except (tk.TclError, OSError) as e:
+            self._on_failed(self._generation, index, e)
+        if self._tk_queue:
+            self._tk_job = self.frame.after(10, self._generate_next_with_tk)
+
+    def _set_image(self, generation, index, thumbnail):
+        label = self._labels.get(index)
+        if generation != self._generation or label is None or not label.winfo_exists():
+            return
+        try:
+            photo = tk.PhotoImage(master=label, file=thumbnail)
+        except tk.TclError:
+            # ملف المصغرة تالف: يُحذف ويُعاد إنشاؤه في المرة القادمة
+            self.cache.forget(thumbnail)
+            try:
+                os.remove(thumbnail)
+            except OSError:
+                pass
+            return
+        self._photos[index] = photo
+        label.configure(image=photo)
+
+    def _on_failed(self, generation, index, error):
+        label = self._labels.get(index)
+        if generation == self._generation and label is not None and label.winfo_exists():
+            label.configure(fg='#c0392b')
+        print(f"خطأ في إنشاء مصغرة: {error}")
+
+    def _on_destroy(self, event):
+        if event.widget is self.frame:
+            self._generation += 1
+            for task in self._tasks:
+                task.cancel()
+            self._tasks = []
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("الاستخدام: python customer_issues_thumbnails.py <صورة> [المقاس]")
+        sys.exit(1)
+    cache = ThumbnailCache()
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_THUMBNAIL_SIZE
+    if PIL_AVAILABLE:
+        print(cache.thumbnail_for(sys.argv[1], size=size))
+    else:
+        print(cache.generate_with_tk(tk.Tk(), sys.argv[1], size=size))
+    print(cache.stats())
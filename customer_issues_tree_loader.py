@@ -0,0 +1,64 @@
+import time
+
+
+class ChunkedTreeviewLoader:
+    """تعبئة Treeview على دفعات زمنية حتى لا تتجمد الواجهة مع القوائم الطويلة
+
+    أول first_batch صف تُدرج مباشرة (الصفحة الأولى الظاهرة)، ثم يُدرج الباقي
+    على دفعات لا تتجاوز slice_ms مللي ثانية بين كل منها root.after، فتبقى
+    الواجهة تستجيب للنقر والكتابة أثناء التعبئة. يمكن إلغاء التعبئة في أي وقت.
+    """
+
+    def __init__(self, tree, rows, to_values, first_batch=50, slice_ms=8, on_done=None):
+        self.tree = tree
+        self.rows = rows
+        self.to_values = to_values
+        self.first_batch = first_batch
+        self.slice_ms = slice_ms
+        self.on_done = on_done
+        self.position = 0
+        self.cancelled = False
+        self._job = None
+
+    @property
+    def done(self):
+        return self.position >= len(self.rows)
+
+    def start(self):
+        """مسح الجدول وعرض الصفحة الأولى وجدولة الباقي"""
+        self.tree.delete(*self.tree.get_children())
+        self._insert_until(min(self.first_batch, len(self.rows)))
+        self._schedule()
+        return self
+
+    def cancel(self):
+        """إيقاف التعبئة (الصفوف المدرجة تبقى كما هي)"""
+        self.cancelled = True
+        if self._job is not None:
+            try:
+                self.tree.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+
+    def _insert_until(self, stop):
+        while self.position < stop:
+            self.tree.insert('', 'end', values=self.to_values(self.rows[self.position]))
+            self.position += 1
+
+    def _schedule(self):
+        if self.done:
+            self._job = None
+            if self.on_done:
+                self.on_done()
+        else:
+            self._job = self.tree.after(1, self._step)
+
+    def _step(self):
+        self._job = None
+        if self.cancelled:
+            return
+        deadline = time.perf_counter() + self.slice_ms / 1000
+        while not self.done and time.perf_counter() < deadline:
+            self._insert_until(min(self.position + 10, len(self.rows)))
+        self._schedule()
@@ -4,11 +4,43 @@ from datetime import datetime
 import os
 import json
 from customer_issues_database import enhanced_db
+from customer_issues_compression import text_preview
 from customer_issues_file_manager import FileManager
+from customer_issues_search_session import SearchSession, IGNORED_SEARCH_KEYS
+from customer_issues_filters import CaseFilter
+from customer_issues_case_list import VirtualCaseList, case_key, merge_changed_cases
+from customer_issues_case_cache import CaseDataCache, CasePrefetcher
+from customer_issues_background import BackgroundRunner
+from customer_issues_tree_loader import ChunkedTreeviewLoader
+from customer_issues_instrumentation import install_monitor, instrumented
+from customer_issues_snapshot import load_snapshot, save_snapshot
+from customer_issues_paged_view import PagedCaseTable
+from customer_issues_ingest import AttachmentIngestQueue, IngestCancelled, SourceChanged
+from customer_issues_thumbnails import ThumbnailCache, ThumbnailStrip
+from customer_issues_blob_store import resolve_stored_path
+from customer_issues_file_manager import PROJECT_ROOT
+from customer_issues_storage_index import reconcile_storage_index
+from customer_issues_integrity import AttachmentIntegrityScanner, format_report, save_report, DEFAULT_REPORT_FOLDER
+from customer_issues_archiver import CaseArchiver, extract_attachment, purge_extract_cache
+
+# خيارات الترتيب في الشريط الجانبي وما يقابلها في CaseFilter
+SORT_OPTIONS = {
+    "آخر تعديل": 'modified_desc',
+    "السنة (تنازلي)": 'created_desc',
+    "السنة (تصاعدي)": 'created_asc',
+    "اسم العميل (أ-ي)": 'name_asc',
+    "اسم العميل (ي-أ)": 'name_desc'
+}
+
+# مطابقة فهرس التخزين تبدأ بعد هذه المدة من ظهور الواجهة
+STORAGE_RECONCILE_DELAY_MS = 10000
+# الفترة بين كل مزامنة للذاكرة المؤقتة لتفاصيل الحالات مع سجل التغييرات
+CASE_CACHE_SYNC_MS = 2000
 
 class EnhancedMainWindow:
-    def __init__(self):
-        self.root = tk.Tk()
+    def __init__(self, root=None):
+        # يمكن تمرير نافذة جذر مخفية أُنشئت مسبقاً (شاشة البداية) لتجنب إنشاء Tk ثانية
+        self.root = root if root is not None else tk.Tk()
         self.root.title("نظام إدارة مشاكل العملاء - النسخة المحسنة")
         self.root.geometry("1400x900")
         self.root.configure(bg='#f8f9fa')
@@ -16,13 +48,54 @@ class EnhancedMainWindow:
         # إعداد الخطوط
         self.setup_fonts()
 
+        # قياس استجابة الواجهة وتسجيل حالات التجمد في logs/ui_latency.jsonl
+        self.latency_monitor = install_monitor(self.root)
+        self.root.bind('<Destroy>', self._on_root_destroyed, add='+')
+
         # المتغيرات
         self.file_manager = FileManager()
         self.current_case_id = None
         self.cases_data = []
         self.filtered_cases = []
         self.basic_data_widgets = {}
-        self.scrollable_frame = None
+        self.case_list = None
+        # الفلتر وإصدار البيانات للقائمة المعروضة (لتحديثها بالتغييرات فقط)
+        self.list_filter = None
+        self.list_version = None
+        self.refresh_task = None
+        # تبويبات الحالة تُحمّل عند ظهورها فقط، مع ذاكرة مؤقتة لكل حالة
+        self.case_cache = CaseDataCache(enhanced_db)
+        self.case_tab_frames = {}
+        self.loaded_case_tabs = set()
+        self.case_tab_tasks = {}
+        self.case_tab_loaders = {}
+        self.tab_runner = BackgroundRunner(self.root, max_workers=1)
+        # التحديد يقرأ من الذاكرة فقط، وسجل التغييرات يُقرأ دورياً في الخلفية
+        self.case_cache_sync_task = None
+        self.root.after(CASE_CACHE_SYNC_MS, self.sync_case_cache)
+        # جداول لوحة العرض و"جميع الحالات" تجلب صفحاتها في الخلفية
+        self.page_runner = BackgroundRunner(self.root, max_workers=2)
+        # نسخ المرفقات إلى المجلد المخصص في الخلفية مع عرض التقدم في تبويب المرفقات
+        self.ingest_queue = AttachmentIngestQueue(self.root, on_progress=self.show_ingest_progress)
+        # مصغرات صور المرفقات تُنشأ في الخلفية وتُحفظ في cache/thumbnails
+        self.thumbnail_cache = ThumbnailCache()
+        self.thumbnail_runner = BackgroundRunner(self.root, max_workers=2)
+        # مطابقة فهرس التخزين مع الملفات بعد اكتمال التشغيل
+        self.maintenance_runner = BackgroundRunner(self.root, max_workers=1)
+        self.storage_reconcile_task = None
+        self.blob_gc_task = None
+        self.integrity_scan_task = None
+        self.archive_task = None
+        # استخراج مرفقات الحالات المؤرشفة عند فتحها
+        self.archive_runner = BackgroundRunner(self.root, max_workers=1)
+        # تحميل الحالات المجاورة مسبقاً للتنقل السريع بالأسهم
+        self.prefetcher = CasePrefetcher(
+            self.case_cache, BackgroundRunner(self.root, max_workers=2),
+            dict(self.case_tab_fetchers(), details=enhanced_db.get_case_details)
+        )
+
+        # لقطة قائمة الحالات من آخر إغلاق (تُرسم فوراً عند أول دخول للنظام)
+        self.startup_snapshot = load_snapshot(enhanced_db)
 
         # ربط وظائف النظام
         try:
@@ -31,11 +104,8 @@ class EnhancedMainWindow:
         except Exception as e:
             self.functions = None
 
-        # إنشاء الواجهة
-        self.create_main_layout()
-
-        # تحميل البيانات الأولية بعد إنشاء كل عناصر الواجهة (لضمان وجود scrollable_frame)
-        self.after_main_layout()
+        # الواجهة الرئيسية تُنشأ عند الدخول من لوحة العرض (show_main_window)
+        # لأن run() تبدأ بلوحة العرض وتمسح أي عناصر سابقة
 
         # ربط أحداث الإغلاق
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -58,11 +128,15 @@ class EnhancedMainWindow:
         with open(self.config_file, 'w', encoding='utf-8') as f:
             json.dump(self.settings, f, indent=4, ensure_ascii=False)
 
+    def _on_root_destroyed(self, event):
+        if event.widget is self.root:
+            self.latency_monitor.stop()
+
     def show_settings_window(self):
         """عرض شاشة الإعدادات."""
         win = tk.Toplevel(self.root)
         win.title("الإعدادات")
-        win.geometry("600x200")
+        win.geometry("720x420")
         win.transient(self.root)
         win.grab_set()
 
@@ -82,23 +156,229 @@ class EnhancedMainWindow:
 
         tk.Button(path_frame, text="اختيار...", command=select_path).pack(side='right', padx=(5, 0))
 
+        # مجلدات يُبحث فيها عن المرفقات المنقولة عند فحص السلامة
+        tk.Label(win, text="مجلدات البحث عن المرفقات المنقولة:", font=self.fonts['subheader']).pack(pady=(15, 5))
+
+        roots_frame = tk.Frame(win)
+        roots_frame.pack(fill='x', padx=20)
+
+        roots_list = tk.Listbox(roots_frame, height=4, font=self.fonts['normal'])
+        roots_list.pack(side='left', fill='x', expand=True)
+        for root in self.settings.get('relink_search_roots', []):
+            roots_list.insert('end', root)
+
+        def add_root():
+            path = filedialog.askdirectory(title="اختر مجلد للبحث فيه", parent=win)
+            if path and path not in roots_list.get(0, 'end'):
+                roots_list.insert('end', path)
+
+        def remove_root():
+            for index in reversed(roots_list.curselection()):
+                roots_list.delete(index)
+
+        roots_buttons = tk.Frame(roots_frame)
+        roots_buttons.pack(side='right', padx=(5, 0))
+        tk.Button(roots_buttons, text="إضافة...", command=add_root).pack(fill='x')
+        tk.Button(roots_buttons, text="حذف", command=remove_root).pack(fill='x', pady=(5, 0))
+
         def save_and_close():
             self.settings['attachments_path'] = path_var.get()
+            self.settings['relink_search_roots'] = list(roots_list.get(0, 'end'))
             self.save_settings()
             messagebox.showinfo("تم الحفظ", "تم حفظ الإعدادات بنجاح.", parent=win)
             win.destroy()
 
-        save_btn = tk.Button(win, text="حفظ وإغلاق", command=save_and_close, font=self.fonts['button'], bg='#27ae60', fg='white')
-        save_btn.pack(pady=20)
+        buttons_frame = tk.Frame(win)
+        buttons_frame.pack(pady=20)
+        save_btn = tk.Button(buttons_frame, text="حفظ وإغلاق", command=save_and_close, font=self.fonts['button'], bg='#27ae60', fg='white')
+        save_btn.pack(side='right', padx=5)
+        scan_btn = tk.Button(buttons_frame, text="🔍 فحص سلامة المرفقات", font=self.fonts['button'],
+                             command=lambda: self.start_integrity_scan(list(roots_list.get(0, 'end'))))
+        scan_btn.pack(side='right', padx=5)
+        archive_btn = tk.Button(buttons_frame, text="🗜️ أرشفة الحالات المغلقة", font=self.fonts['button'],
+                                command=lambda: self.start_case_archiving(path_var.get()))
+        archive_btn.pack(side='right', padx=5)
+
+        # إحصائيات الذاكرة المؤقتة لتفاصيل الحالات
+        prefetch = f" - تحميل مسبق: {self.prefetcher.completed}/{self.prefetcher.requested}"
+        tk.Label(win, text=self.case_cache.format_stats() + prefetch, font=self.fonts['small'], fg='#7f8c8d').pack()
 
 
     def after_main_layout(self):
         """تحميل البيانات الأولية بعد إنشاء كل عناصر الواجهة"""
+        if self.storage_reconcile_task is None:
+            self.root.after(STORAGE_RECONCILE_DELAY_MS, self.start_storage_reconcile)
+        if self.restore_snapshot():
+            return
         if hasattr(self, 'functions') and self.functions:
             self.functions.load_initial_data()
         else:
             self.load_initial_data()
     
+    def start_storage_reconcile(self):
+        """تصحيح فهرس التخزين من الملفات الفعلية ثم تنظيف مخزن المحتوى في الخلفية (مرة في كل تشغيل)"""
+        if self.storage_reconcile_task is not None:
+            return
+        self.storage_reconcile_task = self.maintenance_runner.submit(
+            reconcile_storage_index, enhanced_db, PROJECT_ROOT,
+            on_done=lambda report: print(
+                f"فهرس التخزين: فحص {report['checked']} مرفق - جديدة {report['added']} - "
+                f"متغيرة {report['updated']} - مفقودة {report['missing']} ({report['seconds']} ثانية)"),
+            on_error=lambda error: print(f"خطأ في مطابقة فهرس التخزين: {error}")
+        )
+        self.start_blob_gc()
+
+    def start_blob_gc(self):
+        """حذف ملفات المحتوى التي لم يعد يشير إليها أي مرفق (في الخلفية)"""
+        attachments_path = self.settings.get('attachments_path')
+        if self.blob_gc_task is not None or not attachments_path or not os.path.isdir(attachments_path):
+            return
+        self.blob_gc_task = self.maintenance_runner.submit(
+            self.file_manager.blob_store(attachments_path).collect_garbage,
+            on_done=self.on_blob_gc_done, on_error=self.on_blob_gc_error)
+
+    def on_blob_gc_done(self, report):
+        self.blob_gc_task = None
+        if report['removed'] or report['freed_bytes']:
+            print(f"مخزن المحتوى: حذف {report['removed']} ملف غير مستخدم "
+                  f"({self.file_manager.format_size(report['freed_bytes'])})")
+
+    def on_blob_gc_error(self, error):
+        self.blob_gc_task = None
+        print(f"خطأ في تنظيف مخزن المحتوى: {error}")
+
+    def start_integrity_scan(self, search_roots):
+        """فحص ملفات جميع المرفقات وإعادة ربط المنقولة منها في الخلفية"""
+        if self.integrity_scan_task is not None:
+            messagebox.showinfo("فحص السلامة", "الفحص جارٍ بالفعل، ستظهر النتيجة عند انتهائه.")
+            return
+        scanner = AttachmentIntegrityScanner(enhanced_db, PROJECT_ROOT, search_roots)
+
+        def scan():
+            report = scanner.scan()
+            return report, save_report(report, os.path.join(PROJECT_ROOT, DEFAULT_REPORT_FOLDER))
+
+        self.integrity_scan_task = self.maintenance_runner.submit(
+            scan, on_done=self.on_integrity_scan_done, on_error=self.on_integrity_scan_error)
+
+    def on_integrity_scan_done(self, result):
+        self.integrity_scan_task = None
+        report, report_path = result
+        if report['relinked'] or report['restored']:
+            # مسارات المرفقات تغيرت
+            self.case_cache.clear()
+            if self.current_case_id:
+                self.reload_case_tab('attachments')
+        messagebox.showinfo("فحص السلامة", f"{format_report(report)}\n\nالتقرير: {report_path}")
+
+    def on_integrity_scan_error(self, error):
+        self.integrity_scan_task = None
+        messagebox.showerror("خطأ", f"فشل فحص سلامة المرفقات: {error}")
+
+    def start_case_archiving(self, attachments_path):
+        """ضغط مرفقات الحالات المغلقة من السنوات السابقة في أرشيف لكل حالة (في الخلفية)"""
+        if self.archive_task is not None:
+            messagebox.showinfo("الأرشفة", "الأرشفة جارية بالفعل، ستظهر النتيجة عند انتهائها.")
+            return
+        if not attachments_path or not os.path.isdir(attachments_path):
+            messagebox.showerror("خطأ في الإعدادات", "يرجى تحديد مسار صحيح لحفظ المرفقات أولاً.")
+            return
+        if not messagebox.askyesno("الأرشفة", "سيتم ضغط مرفقات الحالات المغلقة من السنوات السابقة وحذف الملفات الأصلية "
+                                              "بعد التحقق من الأرشيف. هل تريد المتابعة؟"):
+            return
+        archiver = CaseArchiver(enhanced_db, attachments_path, PROJECT_ROOT, self.settings.get('archive_compression', 'deflate'))
+        self.archive_task = self.maintenance_runner.submit(
+            archiver.archive_closed_cases, on_done=self.on_case_archiving_done, on_error=self.on_case_archiving_error)
+
+    def on_case_archiving_done(self, report):
+        self.archive_task = None
+        format_size = self.file_manager.format_size
+        lines = [
+            f"الحالات المؤرشفة: {report['cases']} - المرفقات: {report['files']} ({report['seconds']} ثانية)",
+            f"الحجم الأصلي: {format_size(report['original_bytes'])} - حجم الأرشيفات: {format_size(report['archive_bytes'])}",
+            f"المساحة الموفرة: {format_size(report['reclaimed_bytes'])}"
+        ]
+        if report['failed']:
+            lines.append(f"تعذرت أرشفة الحالات: {', '.join(str(case_id) for case_id in report['failed'])}")
+        if report['cases']:
+            self.case_cache.clear()
+        messagebox.showinfo("الأرشفة", "\n".join(lines))
+
+    def on_case_archiving_error(self, error):
+        self.archive_task = None
+        messagebox.showerror("خطأ", f"فشلت أرشفة الحالات: {error}")
+
+    def restore_snapshot(self):
+        """رسم قائمة الحالات فوراً من لقطة آخر إغلاق ثم مطابقتها مع قاعدة البيانات"""
+        snapshot, self.startup_snapshot = self.startup_snapshot, None
+        if snapshot is None:
+            return False
+        year = snapshot.view.get('year', "الكل")
+        sort_label = snapshot.view.get('sort')
+        if sort_label not in SORT_OPTIONS:
+            sort_label = "آخر تعديل"
+        self.year_var.set(year)
+        self.sort_var.set(sort_label)
+        self.year_combo['values'] = ["الكل"] + snapshot.years
+        self.apply_reference_data(snapshot.categories, snapshot.statuses)
+        self.list_filter = CaseFilter.from_sidebar("شامل", "", year, order_by=SORT_OPTIONS[sort_label])
+        self.list_version = snapshot.version
+        self.cases_data = snapshot.cases
+        self.filtered_cases = list(snapshot.cases)
+        self.update_cases_list()
+        self.show_case_tabs()
+        self.root.after_idle(self.reconcile_snapshot, snapshot.complete)
+        return True
+
+    def apply_reference_data(self, categories_rows, status_rows):
+        """تعبئة قوائم التصنيفات والحالات في النموذج"""
+        categories = [row[1] for row in categories_rows]
+        statuses = [row[0] for row in status_rows]
+        for field, values in (('category', categories), ('status', statuses)):
+            combo = self.basic_data_widgets.get(field)
+            if combo:
+                combo['values'] = values
+        if self.functions:
+            self.functions.categories_data = categories
+            self.functions.status_data = statuses
+
+    def on_reference_data_loaded(self, result):
+        if self.case_list is not None and self.case_list.canvas.winfo_exists():
+            self.apply_reference_data(*result)
+
+    def reconcile_snapshot(self, complete):
+        """تطبيق تغييرات قاعدة البيانات منذ حفظ اللقطة على القائمة المعروضة"""
+        if self.case_list is None or not self.case_list.canvas.winfo_exists():
+            return
+        # التصنيفات والحالات تُقرأ في الخلفية وتُطبق على النموذج عند وصولها
+        self.search_session.runner.submit(
+            lambda: (enhanced_db.get_categories(), enhanced_db.get_status_options()),
+            on_done=self.on_reference_data_loaded,
+            on_error=lambda error: print(f"خطأ في تحميل التصنيفات والحالات: {error}")
+        )
+        if complete:
+            # الحالات المتغيرة فقط من سجل التغييرات
+            self.refresh_changed_cases()
+        else:
+            # اللقطة تحتوي بداية القائمة فقط: إكمالها ببحث في الخلفية
+            self.perform_search()
+
+    def save_snapshot(self):
+        """حفظ لقطة القائمة المعروضة والبيانات المرجعية لتسريع التشغيل التالي"""
+        if self.list_filter is None or not hasattr(self, 'year_combo') or not self.year_combo.winfo_exists():
+            return
+        if self.search_value_var.get().strip():
+            # نتائج البحث مؤقتة ولا تُعرض عند التشغيل التالي
+            return
+        save_snapshot(
+            enhanced_db, self.filtered_cases,
+            years=list(self.year_combo['values'])[1:],
+            categories=enhanced_db.get_categories(),
+            statuses=enhanced_db.get_status_options(),
+            view={'year': self.year_var.get(), 'sort': self.sort_var.get()},
+            version=self.list_version
+        )
+
     def setup_fonts(self):
         """إعداد الخطوط"""
         self.fonts = {
@@ -207,7 +487,7 @@ class EnhancedMainWindow:
         self.search_type_combo = ttk.Combobox(search_type_frame, textvariable=self.search_type_var,
                                              state='readonly', width=18)
         self.search_type_combo['values'] = [
-            "شامل", "اسم العميل", "رقم المشترك", "العنوان", 
+            "شامل", "اسم العميل", "رقم المشترك", "رقم الهاتف", "العنوان", 
             "تصنيف المشكلة", "حالة المشكلة", "اسم الموظف"
         ]
         self.search_type_combo.pack(fill='x')
@@ -222,6 +502,12 @@ class EnhancedMainWindow:
                                     font=self.fonts['normal'])
         self.search_entry.pack(fill='x')
         self.search_entry.bind('<KeyRelease>', self.perform_search)
+
+        # البحث أثناء الكتابة يتم في الخلفية مع تأخير وذاكرة مؤقتة للنتائج
+        self.search_session = SearchSession(
+            self.root, self.run_search, self.show_search_results,
+            version_function=enhanced_db.get_data_version
+        )
         
         # سيتم إنشاء الكومبو بوكس ديناميكياً حسب نوع البحث
         self.search_combo = None
@@ -230,8 +516,8 @@ class EnhancedMainWindow:
         sort_frame = tk.Frame(parent, bg='#ffffff')
         sort_frame.pack(fill='x', padx=10, pady=(0, 10))
         tk.Label(sort_frame, text="ترتيب حسب:", font=self.fonts['normal'], bg='#ffffff').pack(side='right')
-        self.sort_var = tk.StringVar(value="السنة (تنازلي)")
-        sort_options = ["السنة (تنازلي)", "السنة (تصاعدي)", "اسم العميل (أ-ي)", "اسم العميل (ي-أ)"]
+        self.sort_var = tk.StringVar(value="آخر تعديل")
+        sort_options = list(SORT_OPTIONS)
         self.sort_combo = ttk.Combobox(sort_frame, textvariable=self.sort_var, values=sort_options, state='readonly', width=18)
         self.sort_combo.pack(side='right', padx=(5, 0))
         self.sort_combo.bind('<<ComboboxSelected>>', self.apply_sorting)
@@ -250,17 +536,12 @@ class EnhancedMainWindow:
             [('Vertical.Scrollbar.trough', {'children': [('Vertical.Scrollbar.thumb', {'expand': '1', 'sticky': 'nswe'})], 'sticky': 'ns'})]
         )
         scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=list_canvas.yview, style='AlwaysOn.TScrollbar')
-        self.scrollable_frame = tk.Frame(list_canvas, bg='#ffffff')
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: list_canvas.configure(scrollregion=list_canvas.bbox("all"))
-        )
-        list_canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        list_canvas.configure(yscrollcommand=scrollbar.set)
         list_canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         self.cases_canvas = list_canvas
         self.cases_scrollbar = scrollbar
+        # القائمة تنشئ بطاقات الحالات الظاهرة فقط وتعيد استخدامها عند التمرير
+        self.case_list = VirtualCaseList(list_canvas, scrollbar, self._on_case_card_selected)
         # دعم تمرير بالماوس
         def _on_mousewheel(event):
             list_canvas.yview_scroll(int(-1*(event.delta/120)), "units")
@@ -268,8 +549,7 @@ class EnhancedMainWindow:
         # دعم تمرير بالأسهم
         list_canvas.bind_all("<Up>", self._on_case_list_up)
         list_canvas.bind_all("<Down>", self._on_case_list_down)
-        self.selected_case_index = 0
-        self.case_card_widgets = []
+        self.selected_case_index = -1
     
     def create_main_display(self, parent):
         """إنشاء منطقة العرض الرئيسية"""
@@ -331,6 +611,9 @@ class EnhancedMainWindow:
         # نوت بوك التبويبات
         self.notebook = ttk.Notebook(tabs_frame)
         self.notebook.pack(fill='both', expand=True)
+        self.notebook.bind('<<NotebookTabChanged>>', self.load_visible_case_tab)
+        self.case_tab_frames = {}
+        self.loaded_case_tabs = set()
         
         # التبويبات
         self.create_basic_data_tab()
@@ -492,6 +775,7 @@ class EnhancedMainWindow:
         """إنشاء تبويب المرفقات"""
         attachments_frame = ttk.Frame(self.notebook)
         self.notebook.add(attachments_frame, text="المرفقات")
+        self.case_tab_frames[str(attachments_frame)] = 'attachments'
         # أزرار المرفقات
         buttons_frame = tk.Frame(attachments_frame, bg='#ffffff')
         buttons_frame.pack(fill='x', padx=10, pady=10)
@@ -500,6 +784,14 @@ class EnhancedMainWindow:
                                       font=self.fonts['button'], bg='#3498db', fg='white',
                                       relief='flat', padx=15, pady=8)
         add_attachment_btn.pack(side='right')
+        import_folder_btn = tk.Button(buttons_frame, text="📁 استيراد مجلد",
+                                      command=self.import_attachments_folder,
+                                      font=self.fonts['button'], bg='#16a085', fg='white',
+                                      relief='flat', padx=15, pady=8)
+        import_folder_btn.pack(side='right', padx=(0, 10))
+        # تقدم نسخ المرفقات الجاري في الخلفية (مخفي عند عدم وجود نسخ)
+        self.ingest_status_label = tk.Label(buttons_frame, text="", font=self.fonts['normal'], bg='#ffffff', fg='#7f8c8d')
+        self.ingest_progress = ttk.Progressbar(buttons_frame, orient='horizontal', length=200, mode='determinate', maximum=100)
         # جدول المرفقات (أضف عمود مسار الملف كعمود مخفي)
         columns = ('ID', 'نوع الملف', 'اسم الملف', 'الوصف', 'تاريخ الرفع', 'الموظف', 'مسار الملف')
         self.attachments_tree = ttk.Treeview(attachments_frame, columns=columns, show='headings', height=15)
@@ -520,12 +812,19 @@ class EnhancedMainWindow:
         attachments_scrollbar.pack(side='right', fill='y', pady=(0, 10))
         # ربط النقر المزدوج
         self.attachments_tree.bind('<Double-1>', self.open_attachment)
+        # شريط مصغرات الصور فوق الجدول (يظهر فقط للحالات التي لها صور)
+        self.thumbnail_strip = ThumbnailStrip(
+            attachments_frame, self.thumbnail_cache, self.thumbnail_runner,
+            resolve_path=lambda file_path: resolve_stored_path(file_path, PROJECT_ROOT),
+            on_open=lambda row: self.open_attachment_file(resolve_stored_path(row.get('file_path'), PROJECT_ROOT), row.get('id'))
+        ).pack(side='top', fill='x', padx=10, pady=(0, 10), before=self.attachments_tree)
         self.attachments_tree.bind('<Button-3>', self.show_attachment_context_menu)
     
     def create_correspondences_tab(self):
         """إنشاء تبويب المراسلات"""
         correspondences_frame = ttk.Frame(self.notebook)
         self.notebook.add(correspondences_frame, text="المراسلات")
+        self.case_tab_frames[str(correspondences_frame)] = 'correspondences'
         # أزرار المراسلات
         buttons_frame = tk.Frame(correspondences_frame, bg='#ffffff')
         buttons_frame.pack(fill='x', padx=10, pady=10)
@@ -563,6 +862,7 @@ class EnhancedMainWindow:
         """إنشاء تبويب سجل التعديلات"""
         audit_frame = ttk.Frame(self.notebook)
         self.notebook.add(audit_frame, text="سجل التعديلات")
+        self.case_tab_frames[str(audit_frame)] = 'audit_log'
         
         # جدول سجل التعديلات
         columns = ('التاريخ والوقت', 'الموظف', 'نوع الإجراء', 'وصف الإجراء')
@@ -644,12 +944,8 @@ class EnhancedMainWindow:
         tk.Button(win, text="إغلاق", command=win.destroy).pack(pady=20)
 
     def filter_by_year(self, event=None):
-        year = self.year_var.get()
-        if year == "الكل":
-            self.filtered_cases = self.cases_data.copy()
-        else:
-            self.filtered_cases = [case for case in self.cases_data if str(case.get('created_date', '')).startswith(year)]
-        self.update_cases_list()
+        # السنة جزء من فلتر البحث ويتم تطبيقها في الاستعلام
+        self.perform_search()
 
     def on_search_type_change(self, event=None):
         # إزالة أي كومبو بوكس سابق
@@ -715,12 +1011,115 @@ class EnhancedMainWindow:
             if not attachments_path or not os.path.isdir(attachments_path):
                 messagebox.showerror("خطأ في الإعدادات", "يرجى تحديد مسار صحيح لحفظ المرفقات من قائمة الإعدادات أولاً.")
                 return
-            file_info = self.file_manager.copy_file_to_dedicated_folder(file_path, self.current_case_id, attachments_path, description)
+            # النسخ في الخلفية؛ الحفظ في قاعدة البيانات عند اكتماله (للحالة التي بدأ منها)
+            case_id = self.current_case_id
+            job = self.ingest_queue.submit(
+                self.file_manager.blob_store(attachments_path), file_path,
+                on_done=lambda job, blob: self.save_attachment_to_db(
+                    self.file_manager.get_blob_attachment_info(file_path, blob, description), emp_name, case_id),
+                on_error=self.on_ingest_error
+            )
+            if job is None:
+                messagebox.showwarning("تنبيه", "هذا الملف قيد النسخ بالفعل.")
+            return
 
         # 5. حفظ في قاعدة البيانات
         if file_info:
             self.save_attachment_to_db(file_info, emp_name)
 
+    def show_ingest_progress(self, ingest_queue):
+        """عرض تقدم نسخ المرفقات في تبويب المرفقات"""
+        try:
+            if not self.ingest_status_label.winfo_exists():
+                return
+            current, waiting = ingest_queue.status()
+            if not ingest_queue.active:
+                self.ingest_progress.pack_forget()
+                self.ingest_status_label.config(text="")
+                return
+            if current is None:
+                text = f"في انتظار النسخ: {waiting} ملف"
+                percent = 0
+            elif current.unit == 'files':
+                percent = current.fraction * 100
+                text = f"استيراد {current.file_name}: {current.copied} من {current.total} ملف"
+                if waiting:
+                    text += f" (+{waiting} في الانتظار)"
+            else:
+                percent = current.fraction * 100
+                text = (f"نسخ {current.file_name}: {self.file_manager.format_size(current.copied)} من "
+                        f"{self.file_manager.format_size(current.total)}")
+                if waiting:
+                    text += f" (+{waiting} في الانتظار)"
+            self.ingest_progress['value'] = percent
+            if not self.ingest_progress.winfo_ismapped():
+                self.ingest_progress.pack(side='left', padx=(0, 10))
+            self.ingest_status_label.config(text=text)
+            if not self.ingest_status_label.winfo_ismapped():
+                self.ingest_status_label.pack(side='left')
+        except (AttributeError, tk.TclError):
+            # تبويب المرفقات لم يُنشأ أو أُغلقت الواجهة
+            pass
+
+    def import_attachments_folder(self):
+        """استيراد مجلد ملفات (صور الفرق الميدانية) وربط كل ملف بالحالة المطابقة لاسمه"""
+        attachments_path = self.settings.get('attachments_path')
+        if not attachments_path or not os.path.isdir(attachments_path):
+            messagebox.showerror("خطأ في الإعدادات", "يرجى تحديد مسار صحيح لحفظ المرفقات من قائمة الإعدادات أولاً.")
+            return
+        folder = filedialog.askdirectory(title="اختر مجلد الملفات المراد استيرادها")
+        if not folder:
+            return
+        if not messagebox.askyesno(
+                "استيراد مجلد",
+                "سيتم ربط كل ملف بالحالة التي يظهر رقمها (case_123 أو حالة 123) أو رقم مشتركها "
+                "في اسم الملف أو اسم المجلد الذي يحتويه.\nهل تريد المتابعة؟"):
+            return
+        details = self.ask_attachment_details()
+        if not details:
+            return
+        emp_id = 1
+        for emp in enhanced_db.get_employees():
+            if emp[1] == details['emp_name']:
+                emp_id = emp[0]
+                break
+        job = self.ingest_queue.submit_folder(
+            self.file_manager.bulk_import_folder, folder,
+            on_done=self.on_folder_imported, on_error=self.on_ingest_error,
+            attachments_base_path=attachments_path, description=details['description'], uploaded_by=emp_id
+        )
+        if job is None:
+            messagebox.showwarning("تنبيه", "هذا المجلد قيد الاستيراد بالفعل.")
+
+    def on_folder_imported(self, job, report):
+        lines = [
+            f"الملفات في المجلد: {report['scanned']}",
+            f"المرفقات المضافة: {report['imported']} (لـ {len(report['cases'])} حالة)",
+            f"مرفقة مسبقاً بنفس الحالة: {report['already_attached']}",
+            f"بدون حالة مطابقة: {len(report['unmatched'])}",
+            f"تطابق أكثر من حالة: {len(report['ambiguous'])}"
+        ]
+        if report['failed']:
+            lines.append(f"فشل نسخها: {len(report['failed'])}")
+        skipped = report['unmatched'] + report['ambiguous'] + [path for path, _ in report['failed']]
+        if skipped:
+            lines.append("")
+            lines.extend(os.path.basename(path) for path in skipped[:10])
+            if len(skipped) > 10:
+                lines.append(f"... و{len(skipped) - 10} ملفات أخرى")
+        if self.current_case_id in report['cases']:
+            self.load_attachments()
+        messagebox.showinfo("نتيجة الاستيراد", "\n".join(lines))
+
+    def on_ingest_error(self, job, error):
+        if isinstance(error, IngestCancelled):
+            return
+        if isinstance(error, SourceChanged):
+            messagebox.showerror("خطأ في النسخ", f"تغير الملف {job.file_name} أثناء نسخه. يرجى إضافته مرة أخرى.")
+        else:
+            # الجزء المنسوخ يبقى ويُستكمل عند إضافة نفس الملف مرة أخرى
+            messagebox.showerror("خطأ في النسخ", f"فشل نسخ الملف {job.file_name}: {error}\nيمكن إعادة المحاولة وسيُستكمل النسخ من حيث توقف.")
+
     def ask_attachment_action(self):
         """نافذة منبثقة لسؤال المستخدم عن نوع الإجراء (ربط أو نسخ)."""
         win = tk.Toplevel(self.root)
@@ -782,8 +1181,9 @@ class EnhancedMainWindow:
         self.root.wait_window(win)
         return details if 'description' in details else None
 
-    def save_attachment_to_db(self, file_info, emp_name):
+    def save_attachment_to_db(self, file_info, emp_name, case_id=None):
         """حفظ معلومات المرفق في قاعدة البيانات (نسخة مصححة)."""
+        case_id = case_id or self.current_case_id
         # البحث عن هوية الموظف
         emp_id = None
         employees = enhanced_db.get_employees() if hasattr(enhanced_db, 'get_employees') else []
@@ -794,13 +1194,14 @@ class EnhancedMainWindow:
         
         # إنشاء قاموس بيانات نقي ومباشر لقاعدة البيانات
         db_data = {
-            'case_id': self.current_case_id,
+            'case_id': case_id,
             'file_name': file_info.get('file_name'),
             'file_path': file_info.get('file_path'),
             'file_type': file_info.get('file_type'),
             'description': file_info.get('description'),
             'upload_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'uploaded_by': emp_id if emp_id else 1 # استخدام ID الموظف
+            'uploaded_by': emp_id if emp_id else 1, # استخدام ID الموظف
+            'blob_hash': file_info.get('blob_hash')
         }
 
         # التحقق من أن المسار سليم قبل الحفظ
@@ -823,9 +1224,10 @@ class EnhancedMainWindow:
 
             action_type = "ربط مرفق" if is_linked else "نسخ مرفق"
             desc = f"تم {action_type.split(' ')[0]} المرفق: {db_data.get('file_name')} بواسطة {emp_name}"
-            enhanced_db.log_action(self.current_case_id, action_type, desc, db_data['uploaded_by'])
+            enhanced_db.log_action(case_id, action_type, desc, db_data['uploaded_by'])
         
-        self.load_attachments()
+        if case_id == self.current_case_id:
+            self.load_attachments()
         messagebox.showinfo("تم بنجاح", "تمت معالجة المرفق بنجاح.")
 
     def open_attachment(self, event=None):
@@ -834,8 +1236,9 @@ class EnhancedMainWindow:
             return
         item = self.attachments_tree.item(selected[0])
         # المسار المخزن في قاعدة البيانات هو المسار المطلق الكامل
-        full_path = item['values'][-1]
-        
+        self.open_attachment_file(item['values'][-1], item['values'][0])
+
+    def open_attachment_file(self, full_path, attachment_id=None):
         print(f"[DEBUG] محاولة فتح المرفق من المسار المطلق: {full_path}")
 
         if os.path.exists(full_path):
@@ -843,6 +1246,13 @@ class EnhancedMainWindow:
                 os.startfile(full_path)
             except Exception as e:
                 messagebox.showerror("خطأ في الفتح", f"لم يتمكن النظام من فتح الملف.\nالمسار: {full_path}\nالخطأ: {e}")
+        elif attachment_id is not None and enhanced_db.get_archived_attachment(attachment_id):
+            # مرفق حالة مؤرشفة: يُستخرج من أرشيفها في الخلفية ثم يُفتح
+            self.archive_runner.submit(
+                extract_attachment, enhanced_db, attachment_id, PROJECT_ROOT,
+                on_done=lambda path: self.open_attachment_file(path) if path else None,
+                on_error=lambda error: messagebox.showerror("خطأ في الفتح", f"تعذر استخراج المرفق من الأرشيف: {error}")
+            )
         else:
             msg = f"الملف غير موجود في المسار التالي:\n{full_path}\n\nقد يكون الملف قد تم حذفه أو نقله. يرجى تحديث المرفق."
             messagebox.showerror("ملف غير موجود", msg)
@@ -944,7 +1354,12 @@ class EnhancedMainWindow:
             return
         item = self.correspondences_tree.item(selected[0])
         corr_id = item['values'][0]
+        # الجدول يعرض معاينة فقط، النص الكامل يُقرأ (ويُفك ضغطه) عند التعديل
         old_content = item['values'][4]
+        for corr in enhanced_db.get_correspondences(self.current_case_id):
+            if str(corr.get('id')) == str(corr_id):
+                old_content = str(corr.get('message_content') or '')
+                break
         win = tk.Toplevel(self.root)
         win.title("تعديل مراسلة")
         win.geometry("400x300")
@@ -1000,65 +1415,179 @@ class EnhancedMainWindow:
             messagebox.showerror("خطأ في الحذف", f"حدث خطأ أثناء حذف المراسلة:\n{e}")
 
     def load_initial_data(self):
+        self.list_filter = CaseFilter()
+        self.list_version = enhanced_db.get_data_version()
         self.cases_data = enhanced_db.get_all_cases() if hasattr(enhanced_db, 'get_all_cases') else []
         self.filtered_cases = self.cases_data.copy()
         self.update_cases_list()
-        self.load_attachments()
-        self.load_correspondences()
-        self.load_audit_log()
+        self.show_case_tabs()
         years = sorted({str(case.get('created_date', '')).split('-')[0] for case in self.cases_data if case.get('created_date')}, reverse=True)
         self.year_combo['values'] = ["الكل"] + years
         self.year_combo.set("الكل")
 
     def load_attachments(self):
-        """تحميل مرفقات الحالة وعرضها في الجدول (النسخة المصححة)."""
-        for i in self.attachments_tree.get_children():
-            self.attachments_tree.delete(i)
-        
-        if not self.current_case_id or not hasattr(enhanced_db, 'get_attachments'):
-            return
-
-        # get_attachments تعيد الآن قائمة من القواميس (dict) بالأسماء الصحيحة
-        attachments = enhanced_db.get_attachments(self.current_case_id)
-        
-        for att in attachments:
-            # إدخال البيانات بالترتيب الصحيح والمتوقع للجدول
-            self.attachments_tree.insert('', 'end', values=(
-                att.get('id'),
-                att.get('file_type'),
-                att.get('file_name'),
-                att.get('description'),
-                att.get('upload_date'),
-                att.get('uploaded_by_name'),
-                att.get('file_path')  # المسار الكامل للملف
-            ))
+        """إعادة تحميل مرفقات الحالة الحالية (بعد إضافة أو حذف مرفق)"""
+        self.reload_case_tab('attachments')
 
     def load_correspondences(self):
-        for i in self.correspondences_tree.get_children():
-            self.correspondences_tree.delete(i)
-        if not self.current_case_id or not hasattr(enhanced_db, 'get_correspondences'):
-            return
-        correspondences = enhanced_db.get_correspondences(self.current_case_id)
-        for corr in correspondences:
-            self.correspondences_tree.insert('', 'end', values=(
-                corr.get('id'),
-                corr.get('case_sequence_number'),
-                corr.get('yearly_sequence_number'),
-                corr.get('sender'),
-                corr.get('message_content'),
-                corr.get('sent_date'),
-                corr.get('created_by_name')
-            ))
+        self.reload_case_tab('correspondences')
 
     def load_audit_log(self):
-        for i in self.audit_tree.get_children():
-            self.audit_tree.delete(i)
-        if not self.current_case_id or not hasattr(enhanced_db, 'get_case_audit_log'):
+        self.reload_case_tab('audit_log')
+
+    def case_tab_fetchers(self):
+        """دوال جلب بيانات كل تبويب من قاعدة البيانات"""
+        return {
+            'attachments': enhanced_db.get_attachments,
+            'correspondences': enhanced_db.get_correspondences,
+            'audit_log': enhanced_db.get_case_audit_log
+        }
+
+    def case_tab_trees(self):
+        return {
+            'attachments': self.attachments_tree,
+            'correspondences': self.correspondences_tree,
+            'audit_log': self.audit_tree
+        }
+
+    def sync_case_cache(self):
+        """قراءة سجل التغييرات في الخلفية وإلغاء بيانات الحالات المتغيرة عند وصوله"""
+        if self.case_cache_sync_task is not None:
+            return
+        if self.case_list is None or not self.case_list.canvas.winfo_exists():
+            # الذاكرة المؤقتة لا تُستخدم خارج النافذة الرئيسية
+            self.root.after(CASE_CACHE_SYNC_MS, self.sync_case_cache)
             return
-        logs = enhanced_db.get_case_audit_log(self.current_case_id)
-        for log in logs:
-            # log: [id, case_id, action_type, action_description, performed_by, timestamp, old_values, new_values, performed_by_name]
-            self.audit_tree.insert('', 'end', values=(log[5], log[8], log[2], log[3]))
+        self.case_cache_sync_task = self.tab_runner.submit(
+            self.case_cache.fetch_changes,
+            on_done=self.on_case_cache_synced, on_error=self.on_case_cache_sync_error)
+
+    def on_case_cache_synced(self, result):
+        self.case_cache_sync_task = None
+        self.case_cache.apply_changes(result)
+        self.root.after(CASE_CACHE_SYNC_MS, self.sync_case_cache)
+
+    def on_case_cache_sync_error(self, error):
+        self.case_cache_sync_task = None
+        print(f"خطأ في مزامنة الذاكرة المؤقتة للحالات: {error}")
+        self.root.after(CASE_CACHE_SYNC_MS, self.sync_case_cache)
+
+    def get_case_details(self, case_id):
+        """تفاصيل الحالة من الذاكرة المؤقتة إن وجدت، وإلا من قاعدة البيانات"""
+        details = self.case_cache.get(case_id, 'details')
+        if details is None:
+            generation = self.case_cache.generation(case_id)
+            details = enhanced_db.get_case_details(case_id)
+            if details:
+                self.case_cache.put(case_id, 'details', details, generation)
+        return details
+
+    def prefetch_neighbours(self, index):
+        """تحميل تفاصيل الحالات المجاورة (والتبويب الظاهر) في الخلفية"""
+        radius = self.prefetcher.radius
+        start = max(0, index - radius)
+        window = [case_key(case) for case in self.filtered_cases[start:index + radius + 1]]
+        parts = ('details', self.visible_case_tab()) if self.visible_case_tab() else ('details',)
+        self.prefetcher.prefetch_around(window, index - start, parts)
+
+    def visible_case_tab(self):
+        """اسم تبويب الحالة الظاهر حالياً (None للبيانات الأساسية)"""
+        try:
+            return self.case_tab_frames.get(str(self.notebook.select()))
+        except tk.TclError:
+            return None
+
+    def show_case_tabs(self, case_id=None):
+        """بدء عرض تبويبات حالة جديدة: إلغاء التحميل الجاري وتحميل التبويب الظاهر فقط"""
+        if case_id is not None:
+            self.current_case_id = case_id
+        for task in self.case_tab_tasks.values():
+            task.cancel()
+        self.case_tab_tasks.clear()
+        for loader in self.case_tab_loaders.values():
+            loader.cancel()
+        self.case_tab_loaders.clear()
+        self.loaded_case_tabs.clear()
+        for tree in self.case_tab_trees().values():
+            tree.delete(*tree.get_children())
+        self.thumbnail_strip.clear()
+        self.load_visible_case_tab()
+
+    def reload_case_tab(self, tab):
+        """إعادة تحميل تبويب بعد تعديل بياناته (فوراً إن كان ظاهراً)"""
+        self.case_cache.invalidate(self.current_case_id, tab)
+        self.loaded_case_tabs.discard(tab)
+        task = self.case_tab_tasks.pop(tab, None)
+        if task:
+            task.cancel()
+        if self.visible_case_tab() == tab:
+            self.load_visible_case_tab()
+
+    def load_visible_case_tab(self, event=None):
+        """تحميل بيانات التبويب الظاهر إذا لم يُحمّل للحالة الحالية بعد"""
+        tab = self.visible_case_tab()
+        case_id = self.current_case_id
+        if tab is None or tab in self.loaded_case_tabs:
+            return
+        self.loaded_case_tabs.add(tab)
+        if not case_id:
+            self.render_case_tab(tab, [])
+            return
+        rows = self.case_cache.get(case_id, tab)
+        if rows is not None:
+            self.render_case_tab(tab, rows)
+            return
+        generation = self.case_cache.generation(case_id)
+        self.case_tab_tasks[tab] = self.tab_runner.submit(
+            self.case_tab_fetchers()[tab], case_id,
+            on_done=lambda rows: self._on_case_tab_loaded(case_id, tab, rows, generation)
+        )
+
+    def _on_case_tab_loaded(self, case_id, tab, rows, generation):
+        self.case_tab_tasks.pop(tab, None)
+        self.case_cache.put(case_id, tab, rows, generation)
+        if case_id == self.current_case_id:
+            self.render_case_tab(tab, rows)
+
+    def render_case_tab(self, tab, rows):
+        """عرض بيانات التبويب في جدوله (على دفعات للقوائم الطويلة)"""
+        previous = self.case_tab_loaders.pop(tab, None)
+        if previous:
+            previous.cancel()
+        loader = ChunkedTreeviewLoader(
+            self.case_tab_trees()[tab], rows, lambda row: self.case_tab_values(tab, row),
+            on_done=lambda: self.case_tab_loaders.pop(tab, None)
+        )
+        self.case_tab_loaders[tab] = loader
+        loader.start()
+        if tab == 'attachments':
+            self.thumbnail_strip.show(rows)
+
+    def case_tab_values(self, tab, row):
+        """قيم صف الجدول لكل تبويب"""
+        if tab == 'attachments':
+            # إدخال البيانات بالترتيب الصحيح والمتوقع للجدول
+            return (
+                row.get('id'),
+                row.get('file_type'),
+                row.get('file_name'),
+                row.get('description'),
+                row.get('upload_date'),
+                row.get('uploaded_by_name'),
+                row.get('file_path')  # المسار الكامل للملف
+            )
+        if tab == 'correspondences':
+            return (
+                row.get('id'),
+                row.get('case_sequence_number'),
+                row.get('yearly_sequence_number'),
+                row.get('sender'),
+                text_preview(row.get('message_content'), 50),
+                row.get('sent_date'),
+                row.get('created_by_name')
+            )
+        # log: [id, case_id, action_type, action_description, performed_by, timestamp, old_values, new_values, performed_by_name]
+        return (row[5], row[8], row[2], row[3])
 
     def print_case(self):
         if not self.current_case_id:
@@ -1146,29 +1675,19 @@ class EnhancedMainWindow:
         except Exception as e:
             messagebox.showerror("خطأ في الطباعة", f"حدث خطأ أثناء الطباعة:\n{e}")
 
+    @instrumented('update_cases_list')
     def update_cases_list(self):
         """
         تحديث عرض قائمة الحالات
         """
-        if self.scrollable_frame is None:
+        if self.case_list is None:
             return
-        # تنظيف القائمة الحالية
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        self.case_card_widgets = []
-        # عرض الحالات المفلترة كبطاقات
-        from customer_issues_functions import EnhancedFunctions
-        ef = EnhancedFunctions(self)
-        for i, case in enumerate(self.filtered_cases):
-            card = ef.create_case_card(case, i, return_widget=True)
-            self.case_card_widgets.append(card)
-        # تحديث منطقة التمرير
-        if hasattr(self, 'cases_canvas'):
-            self.scrollable_frame.update_idletasks()
-            self.cases_canvas.configure(scrollregion=self.cases_canvas.bbox("all"))
-        # تمييز البطاقة المحددة
-        self._highlight_selected_case_card()
+        # تُطبق الفروق فقط على البطاقات الظاهرة مع الحفاظ على التمرير والتحديد
+        self.case_list.set_cases(self.filtered_cases)
+        selected = self.case_list.selected_index
+        self.selected_case_index = selected if selected is not None else -1
 
+    @instrumented('save_changes')
     def save_changes(self):
         """حفظ أو تحديث بيانات الحالة في قاعدة البيانات"""
         if not messagebox.askyesno("تأكيد الحفظ", "هل أنت متأكد أنك تريد حفظ التغييرات؟"):
@@ -1222,7 +1741,11 @@ class EnhancedMainWindow:
             data['modified_date'] = now
             data['created_by'] = emp_id
             data['modified_by'] = emp_id
-            new_id = enhanced_db.add_case(data)
+            try:
+                new_id = enhanced_db.add_case(data)
+            except Exception as e:
+                messagebox.showerror("خطأ في الحفظ", f"تعذر إضافة الحالة:\n{e}")
+                return
             self.current_case_id = new_id
             # سجل التعديلات
             if hasattr(enhanced_db, 'log_action'):
@@ -1231,71 +1754,135 @@ class EnhancedMainWindow:
         else:
             data['modified_date'] = now
             data['modified_by'] = emp_id
-            enhanced_db.update_case(self.current_case_id, data)
+            try:
+                enhanced_db.update_case(self.current_case_id, data)
+            except Exception as e:
+                messagebox.showerror("خطأ في الحفظ", f"تعذر تحديث بيانات الحالة:\n{e}")
+                return
             # سجل التعديلات
             if hasattr(enhanced_db, 'log_action'):
                 enhanced_db.log_action(self.current_case_id, "تحديث", "تم تحديث بيانات الحالة", emp_id)
             messagebox.showinfo("تم الحفظ", "تم تحديث بيانات الحالة بنجاح.")
         self.save_btn.config(state='disabled')
         self.print_btn.config(state='normal')
-        # إعادة تحميل المرفقات والمراسلات وسجل التعديلات للحالة الحالية
-        if hasattr(self, 'functions') and self.functions is not None:
-            if hasattr(self.functions, 'load_case_attachments'):
-                self.functions.load_case_attachments(self.current_case_id)
-            if hasattr(self.functions, 'load_case_correspondences'):
-                self.functions.load_case_correspondences(self.current_case_id)
-            if hasattr(self.functions, 'load_case_audit_log'):
-                self.functions.load_case_audit_log(self.current_case_id)
-        self.load_initial_data()
+        # إعادة تحميل التبويب الظاهر للحالة الحالية (بياناتها المخزنة لم تعد صالحة)
+        self.case_cache.invalidate(self.current_case_id)
+        self.show_case_tabs()
+        # تحديث الحالات المتغيرة فقط في القائمة مع الحفاظ على البحث والتمرير
+        self.refresh_changed_cases()
 
+    @instrumented('search')
     def perform_search(self, event=None):
         """تنفيذ البحث وتحديث قائمة الحالات"""
+        # مفاتيح التنقل والتعديل لا تغير نص البحث
+        if event is not None and getattr(event, 'keysym', None) in IGNORED_SEARCH_KEYS:
+            return
         search_type = self.search_type_var.get()
         search_value = self.search_value_var.get().strip()
         year = self.year_var.get()
-        # فلترة حسب السنة إذا تم اختيار سنة محددة
-        if year and year != "الكل":
-            cases = enhanced_db.get_cases_by_year(year)
-        else:
-            cases = enhanced_db.get_all_cases()
-        # بحث متقدم إذا تم إدخال قيمة بحث
-        if search_value:
-            cases = enhanced_db.search_cases(search_type, search_value)
+        # الكتابة في حقل البحث تنتظر توقف المستخدم، أما الاختيار من القوائم فيتم فوراً
+        immediate = event is None or getattr(event, 'type', None) != tk.EventType.KeyRelease
+        order_by = SORT_OPTIONS.get(self.sort_var.get(), 'modified_desc')
+        self.search_session.request(search_type, search_value, year, order_by, immediate=immediate)
+
+    def run_search(self, search_type, search_value, year, order_by='modified_desc'):
+        """تنفيذ البحث في قاعدة البيانات (يعمل في خيط خلفي)"""
+        # السنة وقيمة البحث والترتيب تُطبق معاً في استعلام واحد
+        case_filter = CaseFilter.from_sidebar(search_type, search_value, year, order_by=order_by)
+        return enhanced_db.query_cases(case_filter)
+
+    @instrumented('search_results')
+    def show_search_results(self, cases):
+        """عرض نتائج البحث في قائمة الحالات"""
+        search_type, search_value, year, order_by, version = self.search_session.last_request
+        self.list_filter = CaseFilter.from_sidebar(search_type, search_value, year, order_by=order_by)
+        self.list_version = version
         self.filtered_cases = cases
         self.update_cases_list()
 
+    def refresh_changed_cases(self, max_changes=200):
+        """تحديث القائمة المعروضة بالحالات التي تغيرت منذ آخر تحميل فقط (من سجل التغييرات)
+
+        الاستعلامات تُنفذ في الخلفية على خيط البحث (بعد أي بحث جارٍ)، ودمج
+        الحالات المتغيرة في القائمة يتم عند وصول النتيجة.
+        """
+        if self.list_filter is None:
+            self.perform_search()
+            return
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+        list_filter, list_version = self.list_filter, self.list_version
+        self.refresh_task = self.search_session.runner.submit(
+            self.fetch_changed_cases, list_filter, list_version, max_changes,
+            on_done=lambda result: self.apply_changed_cases(list_filter, list_version, result),
+            on_error=self.on_refresh_error
+        )
+
+    def fetch_changed_cases(self, list_filter, list_version, max_changes):
+        """الحالات المتغيرة منذ list_version وسنوات الحالات (يعمل في خيط خلفي)
+
+        تُرجع None إذا كان السجل لا يغطي الفترة أو كانت التغييرات كثيرة.
+        """
+        changes, version = enhanced_db.get_changes_since(list_version)
+        case_ids = {change['case_id'] for change in changes or [] if change['case_id'] is not None}
+        if changes is None or len(case_ids) > max_changes:
+            return None
+        changed_rows = []
+        if case_ids:
+            changed_rows = enhanced_db.query_cases(list_filter.copy(case_ids=sorted(case_ids), limit=None, offset=0))
+        return case_ids, changed_rows, version, enhanced_db.get_case_years()
+
+    def apply_changed_cases(self, list_filter, list_version, result):
+        """دمج الحالات المتغيرة في القائمة المعروضة (في خيط الواجهة)"""
+        self.refresh_task = None
+        if not hasattr(self, 'year_combo') or not self.year_combo.winfo_exists():
+            return
+        if self.list_filter is not list_filter or self.list_version != list_version:
+            # بحث أحدث عُرض أثناء التنفيذ
+            return
+        if result is None:
+            # السجل لا يغطي الفترة أو التغييرات كثيرة: إعادة تنفيذ البحث الحالي
+            self.perform_search()
+            return
+        case_ids, changed_rows, version, years = result
+        if case_ids:
+            sort_key, reverse = list_filter.sort_key()
+            self.filtered_cases = merge_changed_cases(self.filtered_cases, changed_rows, case_ids, sort_key, reverse)
+        self.list_version = version
+        self.update_cases_list()
+        # تمييز الحالة الحالية (مثلاً حالة جديدة تمت إضافتها)
+        for index, case in enumerate(self.filtered_cases):
+            if case_key(case) == self.current_case_id:
+                self.selected_case_index = index
+                self._highlight_selected_case_card()
+                break
+        self.year_combo['values'] = ["الكل"] + years
+
+    def on_refresh_error(self, error):
+        self.refresh_task = None
+        print(f"خطأ في تحديث قائمة الحالات: {error}")
+
     def on_closing(self):
         """معالجة حدث إغلاق النافذة"""
         if messagebox.askokcancel("خروج", "هل تريد realmente الخروج؟"):
+            self.save_snapshot()
+            # النسخ الجاري يتوقف ويُستكمل عند إضافة نفس الملف مرة أخرى
+            self.ingest_queue.cancel_all()
+            # الملفات المستخرجة من الأرشيفات ولم تُفتح منذ يوم
+            purge_extract_cache()
             self.root.destroy()
     
-    def show_dashboard(self):
+    def show_dashboard(self, on_first_page=None):
         self.clear_root()
         dash_frame = tk.Frame(self.root, bg='#f8f8f8')
         dash_frame.pack(fill='both', expand=True)
         tk.Label(dash_frame, text="لوحة عرض الحالات", font=('Arial', 22, 'bold'), bg='#f8f8f8').pack(pady=20)
-        columns = ("اسم العميل", "رقم المشترك", "تصنيف المشكلة", "حالة المشكلة", "تاريخ الإضافة")
-        tree = ttk.Treeview(dash_frame, columns=columns, show='headings', height=18)
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=170)
-        # Scrollbar رأسي
-        scrollbar = ttk.Scrollbar(dash_frame, orient="vertical", command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
-        tree.pack(side='left', fill='both', expand=True, padx=30)
-        scrollbar.pack(side='right', fill='y')
-        # تحميل البيانات
-        cases = enhanced_db.get_all_cases() if hasattr(enhanced_db, 'get_all_cases') else []
-        for case in cases:
-            tree.insert('', 'end', values=(
-                case.get('customer_name', ''),
-                case.get('subscriber_number', ''),
-                case.get('category_name', ''),
-                case.get('status', ''),
-                case.get('created_date', '')
-            ))
-        tk.Button(dash_frame, text="دخول للنظام", font=('Arial', 16, 'bold'), bg='#3498db', fg='white', command=self.show_main_window).pack(pady=10)
-        tk.Button(dash_frame, text="الإعدادات", font=('Arial', 12), bg='#95a5a6', fg='white', command=self.show_settings_window).pack(pady=(0, 20))
+        # الأزرار أولاً في أسفل النافذة حتى لا يدفعها الجدول خارجها
+        tk.Button(dash_frame, text="الإعدادات", font=('Arial', 12), bg='#95a5a6', fg='white', command=self.show_settings_window).pack(side='bottom', pady=(0, 20))
+        tk.Button(dash_frame, text="دخول للنظام", font=('Arial', 16, 'bold'), bg='#3498db', fg='white', command=self.show_main_window).pack(side='bottom', pady=10)
+        # الجدول يجلب الصفوف الظاهرة فقط عند التمرير (العد والترتيب والفلترة في الاستعلام)
+        PagedCaseTable(dash_frame, enhanced_db, self.page_runner,
+                       on_first_page=on_first_page).pack(fill='both', expand=True, padx=30)
 
     def clear_root(self):
         for widget in self.root.winfo_children():
@@ -1306,17 +1893,23 @@ class EnhancedMainWindow:
         self.create_main_layout()
         self.after_main_layout()
 
-    def run(self):
-        self.show_dashboard()
+    def run(self, on_ready=None):
+        """عرض لوحة العرض وبدء حلقة الأحداث
+
+        on_ready تُستدعى مرة واحدة بعد رسم الصفحة الأولى (لإغلاق شاشة البداية).
+        """
+        self.show_dashboard(on_first_page=on_ready)
         self.root.mainloop()
 
+    @instrumented('load_case')
     def load_case(self, case):
         """تحميل بيانات الحالة المختارة في النموذج"""
         # جلب بيانات الحالة كاملة من قاعدة البيانات (وليس فقط من القائمة)
         case_id = case.get('id')
         full_case = case
         if hasattr(enhanced_db, 'get_case_details'):
-            db_result = enhanced_db.get_case_details(case_id)
+            # عبر الذاكرة المؤقتة حتى يُستفاد من التحميل المسبق للحالات المجاورة
+            db_result = self.get_case_details(case_id)
             if isinstance(db_result, tuple):
                 columns = [
                     'id', 'customer_name', 'subscriber_number', 'phone', 'address', 'category_id', 'status',
@@ -1382,9 +1975,8 @@ class EnhancedMainWindow:
         self.solved_by_label.config(text=full_case.get('modified_by_name', ''))
         self.save_btn.config(state='normal')
         self.print_btn.config(state='normal')
-        self.load_attachments()
-        self.load_correspondences()
-        self.load_audit_log()
+        # التبويبات الأخرى تُحمّل عند ظهورها
+        self.show_case_tabs()
         # تعبئة التصنيف بالاسم فقط
         if 'category_name' in full_case and 'category' in self.basic_data_widgets:
             self.basic_data_widgets['category'].set(full_case.get('category_name', ''))
@@ -1403,13 +1995,24 @@ class EnhancedMainWindow:
         if not messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد أنك تريد حذف هذه الحالة وكل بياناتها؟ لا يمكن التراجع!"):
             return
         try:
-            if hasattr(enhanced_db, 'delete_case'):
-                enhanced_db.delete_case(self.current_case_id)
-            # حذف ملفات المرفقات من النظام
-            case_folder = os.path.join('files', f"case_{self.current_case_id}")
-            if os.path.exists(case_folder):
+            # مسار أرشيف الحالة وسنة إنشائها قبل حذف بياناتها
+            archive = enhanced_db.get_case_archive(self.current_case_id)
+            details = enhanced_db.get_case_details(self.current_case_id)
+            # الملفات لا تُمس إلا بعد نجاح حذف البيانات (الأرشيف قد يكون النسخة الوحيدة من المرفقات)
+            if not enhanced_db.delete_case(self.current_case_id):
+                messagebox.showerror("خطأ في الحذف", "تعذر حذف الحالة من قاعدة البيانات، لم يتم حذف أي ملف.")
+                return
+            # مجلد النسخ القديم للحالة (قبل مخزن المحتوى) داخل مجلد المرفقات
+            attachments_path = self.settings.get('attachments_path') or self.file_manager.base_path
+            case_folder = os.path.join(attachments_path, f"case_{self.current_case_id}")
+            if os.path.isdir(case_folder):
                 import shutil
                 shutil.rmtree(case_folder)
+            # أرشيف مرفقات الحالة المغلقة وسجل أرشفتها المنقطعة إن وُجد
+            CaseArchiver(enhanced_db, attachments_path, PROJECT_ROOT).remove_case_archive(
+                self.current_case_id, archive[1] if archive else None, details[12] if details else None)
+            # ملفات المحتوى التي كانت تخص الحالة وحدها تُحذف في الخلفية
+            self.start_blob_gc()
             messagebox.showinfo("تم الحذف", "تم حذف الحالة وكل بياناتها بنجاح.")
             self.current_case_id = None
             self.load_initial_data()
@@ -1424,47 +2027,12 @@ class EnhancedMainWindow:
         win = tk.Toplevel(self.root)
         win.title("جميع الحالات")
         win.geometry("900x500")
-        columns = ("اسم العميل", "رقم المشترك", "تصنيف المشكلة", "حالة المشكلة", "تاريخ الإضافة")
-        tree = ttk.Treeview(win, columns=columns, show='headings', height=20)
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=170)
-        tree.pack(fill='both', expand=True)
-        # تعبئة البيانات
-        for case in self.cases_data:
-            if isinstance(case, dict):
-                tree.insert('', 'end', values=(
-                    case.get('customer_name', ''),
-                    case.get('subscriber_number', ''),
-                    case.get('category_name', ''),
-                    case.get('status', ''),
-                    case.get('created_date', '')
-                ))
-            elif isinstance(case, tuple):
-                # ترتيب الأعمدة حسب get_all_cases
-                # ['id', 'customer_name', 'subscriber_number', 'status', 'category_name', 'color_code', 'modified_by_name', 'created_date', 'modified_date']
-                tree.insert('', 'end', values=(
-                    case[1], case[2], case[4], case[3], case[7]
-                ))
-        tk.Button(win, text="إغلاق", command=win.destroy).pack(pady=10)
+        tk.Button(win, text="إغلاق", command=win.destroy).pack(side='bottom', pady=10)
+        PagedCaseTable(win, enhanced_db, self.page_runner).pack(fill='both', expand=True)
 
     def apply_sorting(self, event=None):
-        def get_val(c, key, idx):
-            if isinstance(c, dict):
-                return c.get(key, '')
-            elif isinstance(c, tuple):
-                return c[idx] if len(c) > idx else ''
-            return ''
-        sort_type = self.sort_var.get()
-        if sort_type == "السنة (تنازلي)":
-            self.filtered_cases.sort(key=lambda c: get_val(c, 'created_date', 7), reverse=True)
-        elif sort_type == "السنة (تصاعدي)":
-            self.filtered_cases.sort(key=lambda c: get_val(c, 'created_date', 7))
-        elif sort_type == "اسم العميل (أ-ي)":
-            self.filtered_cases.sort(key=lambda c: get_val(c, 'customer_name', 1))
-        elif sort_type == "اسم العميل (ي-أ)":
-            self.filtered_cases.sort(key=lambda c: get_val(c, 'customer_name', 1), reverse=True)
-        self.update_cases_list()
+        # الترتيب يتم في الاستعلام (ORDER BY مع ترتيب ARABIC للأسماء)
+        self.perform_search()
 
     def update_status_button_color(self, status_value):
         """تحديث لون زر أو شارة الحالة حسب القيمة (منطق الألوان فقط، بدون ربط مباشر بعناصر الواجهة)"""
@@ -1488,23 +2056,24 @@ class EnhancedMainWindow:
                 btn.config(bg='#3498db', fg='white')
 
     def _on_case_list_up(self, event=None):
-        if not self.case_card_widgets:
+        if not self.filtered_cases:
             return
         self.selected_case_index = max(0, self.selected_case_index - 1)
         self._highlight_selected_case_card()
         self._select_case_by_index()
     def _on_case_list_down(self, event=None):
-        if not self.case_card_widgets:
+        if not self.filtered_cases:
             return
-        self.selected_case_index = min(len(self.case_card_widgets) - 1, self.selected_case_index + 1)
+        self.selected_case_index = min(len(self.filtered_cases) - 1, self.selected_case_index + 1)
         self._highlight_selected_case_card()
         self._select_case_by_index()
-    def _highlight_selected_case_card(self):
-        for idx, card in enumerate(self.case_card_widgets):
-            if idx == self.selected_case_index:
-                card.config(bg="#d1e7fd")
-            else:
-                card.config(bg="#ffffff")
+    def _on_case_card_selected(self, index):
+        self.selected_case_index = index
+        self._highlight_selected_case_card(scroll=False)
+        self._select_case_by_index()
+    def _highlight_selected_case_card(self, scroll=True):
+        if self.case_list is not None:
+            self.case_list.set_selected(self.selected_case_index, scroll=scroll)
     def _select_case_by_index(self):
         if 0 <= self.selected_case_index < len(self.filtered_cases):
             case = self.filtered_cases[self.selected_case_index]
@@ -1513,4 +2082,5 @@ class EnhancedMainWindow:
             if isinstance(case, dict):
                 ef.select_case(case.get('id'))
             elif isinstance(case, tuple):
-                ef.select_case(case[0])
\ No newline at end of file
+                ef.select_case(case[0])
+            self.prefetch_neighbours(self.selected_case_index)
\ No newline at end of file